@@ -0,0 +1,153 @@
+"""
+Tamaño de lote adaptativo para las consultas por LEGAJO
+Empieza con lotes chicos, mide la latencia de cada uno y ajusta el tamaño hacia una
+latencia objetivo, sin pasar el máximo de parámetros que acepta Firebird
+"""
+
+import logging
+import math
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from config import BATCH_CONFIG, FETCH_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Firebird (hasta la versión 4) no acepta más de 1500 elementos en un predicado IN
+FIREBIRD_MAX_IN_PARAMS = 1500
+
+
+class AdaptiveBatchController:
+    """Ajusta el tamaño de lote de un perfil de consulta según la latencia medida
+
+    - Estima el costo por LEGAJO con un promedio móvil de las latencias (`smoothing`)
+    - Propone el tamaño que tardaría `target_seconds`, creciendo como mucho `growth` veces
+      y bajando como mucho a la mitad por decisión
+    - `max_params` acota el tamaño cuando cada LEGAJO es un parámetro del IN
+    - Un lote fallido o vencido reduce el tamaño a la mitad
+
+    Es seguro usarlo desde varios threads; cada decisión queda en el log.
+    """
+
+    def __init__(self, profile: str, initial_size: int = 100, min_size: int = 10,
+                 max_size: int = FIREBIRD_MAX_IN_PARAMS, target_seconds: float = 2.0,
+                 max_params: Optional[int] = FIREBIRD_MAX_IN_PARAMS, growth: float = 2.0,
+                 smoothing: float = 0.5):
+        if max_params is not None:
+            max_size = min(max_size, max_params)
+        if not 1 <= min_size <= max_size:
+            raise ValueError(f"Límites de lote inválidos: min_size={min_size}, max_size={max_size}")
+
+        self.profile = profile
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.growth = growth
+        self.smoothing = smoothing
+        self.size = self._clamp(initial_size)
+        self._seconds_per_key: Optional[float] = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._keys = 0
+        self._rows = 0
+        self._failures = 0
+
+    def next_size(self) -> int:
+        with self._lock:
+            return self.size
+
+    def record(self, size: int, elapsed: float, rows: int):
+        """Registra un lote terminado (`rows` resultados en `elapsed` segundos) y ajusta el tamaño"""
+        if size <= 0:
+            return
+        with self._lock:
+            self._batches += 1
+            self._keys += size
+            self._rows += rows
+
+            sample = max(elapsed, 1e-6) / size
+            if self._seconds_per_key is None:
+                self._seconds_per_key = sample
+            else:
+                self._seconds_per_key += self.smoothing * (sample - self._seconds_per_key)
+
+            ideal = self.target_seconds / self._seconds_per_key
+            bounded = min(max(ideal, self.size / 2), self.size * self.growth)
+            previous, self.size = self.size, self._clamp(bounded)
+
+        logger.info(f"[lote {self.profile}] {size} LEGAJOs en {elapsed:.2f}s, {rows} resultados "
+                    f"({rows / size:.2f} por LEGAJO): tamaño {previous} -> {self.size}")
+
+    def record_failure(self, size: int, reason: str):
+        """Un lote con error o timeout: reducir a la mitad antes del reintento"""
+        with self._lock:
+            self._failures += 1
+            previous, self.size = self.size, self._clamp(min(self.size, size / 2))
+        logger.warning(f"[lote {self.profile}] {size} LEGAJOs fallaron ({reason}): "
+                       f"tamaño {previous} -> {self.size}")
+
+    def batches_for(self, keys: int) -> int:
+        """Lotes estimados para `keys` LEGAJOs con el tamaño actual"""
+        return math.ceil(keys / self.next_size()) if keys > 0 else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "profile": self.profile,
+                "size": self.size,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "target_seconds": self.target_seconds,
+                "seconds_per_key": self._seconds_per_key,
+                "batches": self._batches,
+                "keys": self._keys,
+                "rows": self._rows,
+                "failures": self._failures
+            }
+
+    def _clamp(self, size: float) -> int:
+        return int(min(max(size, self.min_size), self.max_size))
+
+
+_controllers: Dict[str, AdaptiveBatchController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_batch_controller(profile: str, **options) -> AdaptiveBatchController:
+    """Controlador compartido del perfil; el tamaño aprendido se conserva entre archivos
+
+    `options` se usan solo al crear el controlador.
+    """
+    with _controllers_lock:
+        controller = _controllers.get(profile)
+        if controller is None:
+            controller = AdaptiveBatchController(profile, **options)
+            _controllers[profile] = controller
+        return controller
+
+
+def controller_stats() -> Dict[str, Dict[str, Any]]:
+    """Estado de todos los perfiles, para ajustar la configuración"""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return {controller.profile: controller.stats() for controller in controllers}
+
+
+def lookup_controller(mode: str, fields: Sequence[str]) -> Optional[AdaptiveBatchController]:
+    """Controlador para consultar `fields` en modo "in_list" o "temp_table" (None si está desactivado)
+
+    Cada combinación de modo y campos es un perfil propio: un mapeo angosto admite lotes
+    más grandes que uno con treinta joins.
+    """
+    if not BATCH_CONFIG["adaptive"]:
+        return None
+    temp_table = mode == "temp_table"
+    return get_batch_controller(
+        f"{mode}:{','.join(fields)}",
+        initial_size=BATCH_CONFIG["initial_size"],
+        min_size=BATCH_CONFIG["min_size"],
+        max_size=FETCH_CONFIG["temp_table_batch_size"] if temp_table else FETCH_CONFIG["batch_size"],
+        target_seconds=BATCH_CONFIG["target_seconds"],
+        # Con tabla temporal las claves no van como parámetros del IN
+        max_params=None if temp_table else FIREBIRD_MAX_IN_PARAMS
+    )
@@ -0,0 +1,203 @@
+"""
+Consulta de lotes de LEGAJOs en paralelo contra Firebird
+Cada worker usa su propia conexión del pool; los resultados se combinan en orden de lote
+"""
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+from batch_controller import AdaptiveBatchController
+
+logger = logging.getLogger(__name__)
+
+
+class BatchFetchError(RuntimeError):
+    """Uno o más lotes agotaron sus reintentos
+
+    `result` tiene los resultados combinados de los lotes que sí terminaron y `failed` las
+    claves que quedaron sin consultar.
+    """
+
+    def __init__(self, message: str, result: Any, failed: List[str]):
+        super().__init__(message)
+        self.result = result
+        self.failed = failed
+
+
+def merge_dicts(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    merged = {}
+    for batch_result in results:
+        merged.update(batch_result)
+    return merged
+
+
+class ParallelBatchFetcher:
+    """Ejecuta `fetch_batch` sobre lotes de claves con un pool de threads
+
+    - `workers`: consultas simultáneas (el pool de conexiones debe tener al menos ese tamaño)
+    - `max_in_flight`: lotes enviados sin terminar; limita la carga sobre el servidor
+    - `timeout`: segundos por lote antes de darlo por perdido y reintentarlo
+    - `retries`: reintentos por lote tras un error o timeout
+    - `controller`: tamaño de lote adaptativo (ver batch_controller.py); sin él se usa
+      `batch_size` fijo
+    - `combine`: une los resultados de los lotes en orden; por defecto `fetch_batch` devuelve
+      dicts y se combinan con update (con DataFrames, p. ej. `fill_engine.concat_results`)
+    """
+
+    def __init__(self, fetch_batch: Callable[[List[str]], Any], workers: int = 4,
+                 batch_size: int = 1000, timeout: float = 120, retries: int = 2,
+                 max_in_flight: Optional[int] = None, retry_delay: float = 1.0,
+                 controller: Optional[AdaptiveBatchController] = None,
+                 combine: Optional[Callable[[List[Any]], Any]] = None):
+        if workers < 1 or batch_size < 1:
+            raise ValueError(f"Parámetros inválidos: workers={workers}, batch_size={batch_size}")
+
+        self.fetch_batch = fetch_batch
+        self.workers = workers
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.retries = retries
+        self.max_in_flight = max_in_flight or workers
+        self.retry_delay = retry_delay
+        self.controller = controller
+        self.combine = combine or merge_dicts
+
+    def fetch(self, keys: List[str], errors: Optional[List[str]] = None,
+              progress: Optional[Callable[[int, int], None]] = None) -> Any:
+        """Consulta todas las claves y devuelve los resultados combinados
+
+        Los lotes se arman a medida que hay cupo, con el tamaño vigente del controlador.
+        El orden de combinación es el de los lotes, no el de finalización, así que el
+        resultado es determinista. Los lotes que agotan sus reintentos se reportan en `errors`
+        y, al terminar, se lanza `BatchFetchError` con lo que sí se obtuvo: una consulta a
+        medias no pasa por completa.
+        `progress(terminados, total)` se llama al cerrar cada lote (con tamaño adaptativo
+        el total es una estimación); si lanza una excepción la consulta se interrumpe.
+        """
+        if not keys:
+            return self.combine([])
+
+        batches: List[List[str]] = []
+        results: List[Any] = []
+        attempts: List[int] = []
+        offset = 0  # Claves ya asignadas a un lote
+        pending = deque()  # Reintentos: (lote, no antes de)
+        in_flight = {}  # future -> (lote, deadline)
+        abandoned = False
+        finished = reported = 0
+
+        def new_batch() -> int:
+            nonlocal offset
+            size = self.controller.next_size() if self.controller else self.batch_size
+            batches.append(keys[offset:offset + size])
+            results.append(None)
+            attempts.append(0)
+            offset += len(batches[-1])
+            return len(batches) - 1
+
+        def retry_or_fail(index: int, reason: str) -> bool:
+            if self.controller is None:
+                return self._retry_or_fail(index, attempts, pending, batches, errors, reason)
+            self.controller.record_failure(len(batches[index]), reason)
+            if not self._retry_or_fail(index, attempts, pending, batches, errors, reason):
+                return False
+            # Reintentar con el tamaño reducido: el resto del lote pasa a lotes nuevos
+            size = self.controller.next_size()
+            batch = batches[index]
+            batches[index] = batch[:size]
+            for start in range(size, len(batch), size):
+                batches.append(batch[start:start + size])
+                results.append(None)
+                attempts.append(attempts[index])
+                pending.append((len(batches) - 1, pending[-1][1]))
+            return True
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch-fetch")
+        try:
+            while pending or in_flight or offset < len(keys):
+                now = time.monotonic()
+
+                # Back-pressure: solo se envían lotes mientras haya cupo; primero los reintentos
+                while len(in_flight) < self.max_in_flight:
+                    if pending and pending[0][1] <= now:
+                        index, _ = pending.popleft()
+                    elif offset < len(keys):
+                        index = new_batch()
+                    else:
+                        break
+                    attempts[index] += 1
+                    future = executor.submit(self._timed_fetch, batches[index])
+                    in_flight[future] = (index, now + self.timeout)
+
+                if not in_flight:
+                    time.sleep(max(0.0, pending[0][1] - now))
+                    continue
+
+                next_deadline = min(deadline for _, deadline in in_flight.values())
+                done, _ = wait(in_flight, timeout=max(0.0, next_deadline - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    index, _ = in_flight.pop(future)
+                    try:
+                        results[index], elapsed = future.result()
+                        logger.info(f"Lote {index + 1}: {len(batches[index])} LEGAJOs, "
+                                    f"{len(results[index])} resultados en {elapsed:.2f}s")
+                        if self.controller is not None:
+                            self.controller.record(len(batches[index]), elapsed, len(results[index]))
+                        finished += 1
+                    except Exception as e:
+                        if not retry_or_fail(index, str(e)):
+                            finished += 1
+
+                # Lotes vencidos: se abandonan (el thread no se puede interrumpir) y se reintentan
+                now = time.monotonic()
+                for future, (index, deadline) in list(in_flight.items()):
+                    if deadline <= now:
+                        del in_flight[future]
+                        future.cancel()
+                        abandoned = True
+                        if not retry_or_fail(index, f"timeout de {self.timeout:g}s"):
+                            finished += 1
+
+                if progress is not None and finished != reported:
+                    reported = finished
+                    progress(finished, len(batches) + self._batches_left(len(keys) - offset))
+        finally:
+            # No esperar a threads colgados en consultas abandonadas
+            executor.shutdown(wait=not abandoned, cancel_futures=True)
+
+        combined = self.combine([batch_result for batch_result in results if batch_result is not None])
+        failed = [key for batch, batch_result in zip(batches, results) if batch_result is None for key in batch]
+        if failed:
+            lost = sum(1 for batch_result in results if batch_result is None)
+            raise BatchFetchError(f"{lost} de {len(batches)} lotes fallaron tras agotar los reintentos: "
+                                  f"{len(failed)} LEGAJOs sin consultar", combined, failed)
+        return combined
+
+    def _timed_fetch(self, batch: List[str]):
+        start = time.monotonic()
+        result = self.fetch_batch(batch)
+        return result, time.monotonic() - start
+
+    def _batches_left(self, keys: int) -> int:
+        if self.controller is not None:
+            return self.controller.batches_for(keys)
+        return -(-keys // self.batch_size)
+
+    def _retry_or_fail(self, index: int, attempts: List[int], pending: deque,
+                       batches: List[List[str]], errors: Optional[List[str]], reason: str) -> bool:
+        """Reencola el lote si le quedan reintentos; devuelve True si se reintentará"""
+        if attempts[index] <= self.retries:
+            logger.warning(f"Lote {index + 1} falló ({reason}), reintento {attempts[index]}/{self.retries}")
+            pending.append((index, time.monotonic() + self.retry_delay * attempts[index]))
+            return True
+
+        message = f"Lote {index + 1} ({len(batches[index])} LEGAJOs) falló tras {attempts[index]} intentos: {reason}"
+        logger.error(message)
+        if errors is not None:
+            errors.append(message)
+        return False
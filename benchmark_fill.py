@@ -0,0 +1,145 @@
+"""
+Benchmark de regresión del llenado de templates
+Compara el llenado anterior (to_list -> loop de Python -> pl.Series) con fill_engine.apply_fill:
+verifica que el resultado sea idéntico, que el DataFrame devuelto traiga los datos y que las
+columnas que no cambian se compartan sin copiar. Sale con código 1 si algo no coincide.
+
+Uso: python benchmark_fill.py [--rows 200000] [--cols 30] [--unique 20000] [--repeat 5]
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import polars as pl
+
+import fill_engine
+
+TARGET_INDEX = 5  # Columna CLIENTE del template
+START_ROW = 10
+
+
+def generate_template(rows: int, cols: int, unique: int, seed: int = 42) -> pl.DataFrame:
+    """Template sintético: 10 filas de encabezado y LEGAJOs repetidos en la columna B"""
+    rng = random.Random(seed)
+    pool = [str(642799 + i) for i in range(unique)]
+    columns = {}
+    for c in range(cols):
+        name = f"column_{c + 1}"
+        header = ["CLIENTE" if c == TARGET_INDEX else f"H{c}"] * START_ROW
+        if c == 1:
+            data = [rng.choice(pool) if rng.random() > 0.05 else "" for _ in range(rows)]
+        elif c == TARGET_INDEX:
+            data = [""] * rows
+        else:
+            data = [f"v{c}_{i % 97}" for i in range(rows)]
+        columns[name] = header + data
+    return pl.DataFrame(columns, schema={name: pl.Utf8 for name in columns})
+
+
+def generate_results(df: pl.DataFrame, hit_ratio: float = 0.9, seed: int = 7):
+    """Resultados de BD simulados para una fracción de los LEGAJOs del template"""
+    rng = random.Random(seed)
+    legajos = fill_engine.unique_legajos(fill_engine.extract_legajos(df, START_ROW, 1))
+    return {legajo: {"nombre_cliente": f"CLIENTE {legajo}"} for legajo in legajos if rng.random() < hit_ratio}
+
+
+def legacy_fill(df: pl.DataFrame, propuestas_data: dict, return_frame: bool = True):
+    """Llenado anterior de main.py: valores a lista de Python, loop por fila y Series nueva
+
+    Con `return_frame=False` reproduce el error original: la columna se reasignaba a un `df`
+    local y el que se escribía era el DataFrame sin llenar.
+    """
+    target_col_name = df.columns[TARGET_INDEX]
+    propuesta_col = df.get_column(df.columns[1])
+    current_target_values = df.get_column(target_col_name).to_list()
+    matched_count = 0
+
+    for idx in range(START_ROW, df.height):
+        propuesta = propuesta_col[idx]
+        if propuesta is None:
+            continue
+        propuesta = str(propuesta).strip()
+        if propuesta.isdigit() and len(propuesta) >= 4 and propuesta in propuestas_data:
+            current_target_values[idx] = propuestas_data[propuesta]["nombre_cliente"]
+            matched_count += 1
+
+    updated = df.with_columns(pl.Series(target_col_name, current_target_values))
+    return (updated if return_frame else df), matched_count
+
+
+def engine_fill(df: pl.DataFrame, propuestas_data: dict):
+    legajos = fill_engine.extract_legajos(df, START_ROW, 1)
+    results = fill_engine.results_to_frame(propuestas_data, ["nombre_cliente"])
+    filled, stats = fill_engine.apply_fill(
+        df, legajos, results, {df.columns[TARGET_INDEX]: "nombre_cliente"}, overwrite=True
+    )
+    return filled, stats["matched_rows"]
+
+
+def best_time(func, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de regresión del llenado de templates")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--cols", type=int, default=30)
+    parser.add_argument("--unique", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"[TEST] Template sintético: {args.rows:,} filas x {args.cols} columnas, {args.unique:,} LEGAJOs")
+    df = generate_template(args.rows, args.cols, args.unique)
+    propuestas_data = generate_results(df)
+    target = df.columns[TARGET_INDEX]
+    failures = []
+
+    # 1. El error original: el DataFrame que se escribía no traía los datos
+    buggy, _ = legacy_fill(df, propuestas_data, return_frame=False)
+    buggy_filled = buggy.get_column(target).slice(START_ROW).str.starts_with("CLIENTE ").sum()
+    print(f"[INFO] Llenado anterior sin devolver el DataFrame: {buggy_filled:,} celdas llenas en el archivo escrito")
+
+    # 2. Tiempos
+    legacy_time, (legacy_df, legacy_matched) = best_time(lambda: legacy_fill(df, propuestas_data), args.repeat)
+    engine_time, (engine_df, engine_matched) = best_time(lambda: engine_fill(df, propuestas_data), args.repeat)
+
+    # 3. Correctitud
+    if not engine_df.equals(legacy_df):
+        failures.append("El resultado del motor difiere del llenado anterior")
+    if engine_matched != legacy_matched:
+        failures.append(f"Matches distintos: motor {engine_matched:,}, anterior {legacy_matched:,}")
+    engine_filled = engine_df.get_column(target).slice(START_ROW).str.starts_with("CLIENTE ").sum()
+    if engine_filled != engine_matched or engine_filled == 0:
+        failures.append(f"El DataFrame devuelto tiene {engine_filled:,} celdas llenas, se esperaban {engine_matched:,}")
+    if not df.get_column(target).slice(START_ROW).eq("").all():
+        failures.append("El DataFrame de entrada fue modificado")
+
+    # 4. Columnas sin cambios compartidas con la entrada (sin copia)
+    copied = [name for name in df.columns if name != target
+              and engine_df.get_column(name)._get_ptr() != df.get_column(name)._get_ptr()]
+    if copied:
+        failures.append(f"Columnas copiadas sin necesidad: {', '.join(copied)}")
+
+    print(f"[TIEMPO] Llenado anterior (loop de Python): {legacy_time * 1000:,.1f} ms")
+    print(f"[TIEMPO] fill_engine.apply_fill:             {engine_time * 1000:,.1f} ms")
+    print(f"[COHETE] Aceleración: {legacy_time / engine_time:,.1f}x, {engine_matched:,} filas llenadas")
+    if engine_time >= legacy_time:
+        failures.append("El motor no es más rápido que el llenado anterior")
+
+    if failures:
+        for failure in failures:
+            print(f"[X] {failure}")
+        sys.exit(1)
+    print("[CHECK] Resultado idéntico, DataFrame devuelto con datos y columnas sin copiar")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Benchmark de planes de consulta para la búsqueda por LEGAJO
+Ejecuta cada variante de la consulta de propuestas con las mismas claves y registra el plan,
+el mejor tiempo y las filas traídas. Verifica que todas encuentren los mismos LEGAJOs y que el
+registro que se conserva de cada uno tenga los valores de la consulta anterior (correlated);
+sale con código 1 si alguna difiere.
+
+Variantes:
+- correlated: la consulta anterior de main.py (subconsulta correlacionada en el join de domicilios)
+- joins: field_mapping.build_lookup_query, joins simples
+- joins_titular: igual, ordenando por prioridad de titular
+- catalog: joins_titular con el IN completado hasta la aridad fija (la que usa main.py por defecto)
+- derived: joins simples con la dirección pre-agregada por cliente en una tabla derivada
+- keys_table: claves cargadas en una tabla temporal y ROW_NUMBER() (ver temp_lookup.py)
+
+Uso:
+    python benchmark_queries.py [--propuestas 20000] [--keys 1000] [--repeat 5] [--json resultados.json]
+    python benchmark_queries.py --backend firebird [--keys-file legajos.txt]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import field_mapping
+import query_catalog
+import standin_db
+import temp_lookup
+from field_mapping import FIELDS, PROPUESTA_FIELDS
+
+# Consulta de get_multiple_propuestas antes de usar field_mapping
+CORRELATED_QUERY = """
+        SELECT DISTINCT
+            p.LEGAJO AS COD_PROPUESTA,
+            c.NOMBRE as Nombre_Cliente,
+            cc.COD_CLIENTE,
+            s.NOMBRE AS SUCURSAL,
+            CR.MONTO,
+            ct.FECHA as FECHA_CONTRATO,
+            ec.ESTADO as ESTADO,
+            TC.NOMBRE AS TIPO_CONTRATO,
+            c.TELEFONO,
+            c.TELEFONO_MOVIL,
+            DOM.DIRECCION,
+            vg.NOMBRE as asesor
+        FROM CONTRATOS_CLIENTES cc
+        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
+        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
+        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
+        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
+        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
+        INNER JOIN ESTADOS_CONTRATOS ec ON ct.COD_ESTADO_CONTRATO = ec.COD_ESTADO_CONTRATO
+        INNER JOIN TIPOS_CONTRATOS TC ON CT.COD_TIPO_CONTRATO=TC.COD_TIPO_CONTRATO
+        INNER JOIN vendedor vg ON ct.COD_VENDEDOR=vg.COD_VENDEDOR
+        LEFT JOIN MEDIOS_COBROS_DOMICILIOS mcd ON mcd.COD_MEDIO_COBRO IN (
+            SELECT COD_MEDIO_COBRO FROM MEDIOS_COBROS WHERE COD_CLIENTE = c.COD_CLIENTE
+        )
+        LEFT JOIN DOMICILIOS DOM ON dom.COD_DOMICILIO = mcd.COD_DOMICILIO
+        WHERE p.LEGAJO IN ({placeholders})
+        ORDER BY p.LEGAJO
+        """
+
+# Una dirección por cliente, agregada antes del join (no multiplica filas por domicilio)
+DIRECCION_DERIVED = """LEFT JOIN (
+            SELECT mco.COD_CLIENTE, MIN(dom.DIRECCION) AS DIRECCION
+            FROM MEDIOS_COBROS mco
+            INNER JOIN MEDIOS_COBROS_DOMICILIOS mcd ON mcd.COD_MEDIO_COBRO = mco.COD_MEDIO_COBRO
+            INNER JOIN DOMICILIOS dom ON dom.COD_DOMICILIO = mcd.COD_DOMICILIO
+            GROUP BY mco.COD_CLIENTE
+        ) dir ON dir.COD_CLIENTE = c.COD_CLIENTE"""
+
+
+def build_derived_query(fields: Sequence[str], key_count: int) -> str:
+    """Como build_lookup_query con prioridad de titular, pero la dirección sale de `DIRECCION_DERIVED`"""
+    other = [field for field in fields if field != "direccion"]
+    columns = ",\n            ".join(
+        ["p.LEGAJO"] + ["dir.DIRECCION" if field == "direccion" else FIELDS[field][0] for field in fields]
+    )
+    joins = [field_mapping.JOINS[alias][0] for alias in field_mapping.required_joins(other, ("cart",))]
+    if "direccion" in fields:
+        joins.append(DIRECCION_DERIVED)
+    tables = "\n        ".join([field_mapping.BASE_FROM] + joins)
+    placeholders = ','.join(['?' for _ in range(key_count)])
+    return f"""
+        SELECT
+            {columns}
+        {tables}
+        WHERE p.LEGAJO IN ({placeholders})
+        ORDER BY p.LEGAJO, {field_mapping.TITULAR_PRIORITY}, c.NOMBRE
+        """
+
+
+class SQLiteBackend:
+    """Base de reemplazo generada por standin_db"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, propuestas: int, seed: int):
+        print(f"[BD] Generando base de reemplazo con {propuestas:,} propuestas en {path}")
+        self.con = standin_db.create_standin(path, propuestas, seed)
+        # Mismo tipo que propuesta.LEGAJO para que el join use el índice
+        self.con.execute(f"CREATE TEMP TABLE {temp_lookup.TEMP_TABLE} (LEGAJO INTEGER NOT NULL PRIMARY KEY)")
+
+    def sample_keys(self, count: int) -> List[str]:
+        return standin_db.sample_legajos(self.con, count)
+
+    def load_keys(self, cur, keys: Sequence[str]):
+        cur.execute(f"DELETE FROM {temp_lookup.TEMP_TABLE}")
+        cur.executemany(f"INSERT OR IGNORE INTO {temp_lookup.TEMP_TABLE} (LEGAJO) VALUES (?)",
+                        [(key,) for key in keys])
+        # Sin estadísticas el planificador recorre los catálogos antes que las claves
+        cur.execute(f"ANALYZE temp.{temp_lookup.TEMP_TABLE}")
+
+    def plan(self, cur, sql: str, params: Sequence[Any]) -> str:
+        cur.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return "\n".join(row[-1] for row in cur.fetchall())
+
+    def finish(self):
+        self.con.rollback()
+
+    def close(self):
+        self.con.close()
+
+
+class FirebirdBackend:
+    """Base Firebird de DATABASE_CONFIG (solo lectura; la tabla temporal se crea si no existe)"""
+
+    name = "firebird"
+
+    def __init__(self):
+        import fdb
+        from config import DATABASE_CONFIG
+
+        print(f"[BD] Conectando a {DATABASE_CONFIG['host']}:{DATABASE_CONFIG['database_path']}")
+        self.con = fdb.connect(
+            host=DATABASE_CONFIG["host"],
+            database=DATABASE_CONFIG["database_path"],
+            user=DATABASE_CONFIG["user"],
+            password=DATABASE_CONFIG["password"],
+            charset=DATABASE_CONFIG["charset"]
+        )
+        temp_lookup.ensure_temp_table(self.con)
+
+    def sample_keys(self, count: int) -> List[str]:
+        cur = self.con.cursor()
+        cur.execute(f"SELECT FIRST {int(count)} p.LEGAJO FROM propuesta p ORDER BY p.COD_PROPUESTA DESC")
+        return [str(row[0]) for row in cur.fetchall()]
+
+    def load_keys(self, cur, keys: Sequence[str]):
+        temp_lookup.load_keys(self.con, keys)
+
+    def plan(self, cur, sql: str, params: Sequence[Any]) -> str:
+        return cur.prep(sql).plan or ""
+
+    def finish(self):
+        # ON COMMIT DELETE ROWS: el rollback vacía la tabla temporal
+        self.con.rollback()
+
+    def close(self):
+        self.con.close()
+
+
+def variants(fields: Sequence[str]) -> Dict[str, Callable[[Any, Any, Sequence[str]], Tuple[str, Sequence[Any]]]]:
+    """nombre -> función (backend, cursor, claves) que devuelve (sql, parámetros)"""
+    table = temp_lookup.TEMP_TABLE
+
+    def keys_table(backend, cur, keys):
+        backend.load_keys(cur, keys)
+        return field_mapping.build_keys_table_query(fields, table, titular_priority=True, ranked=True), ()
+
+    return {
+        "correlated": lambda backend, cur, keys: (
+            CORRELATED_QUERY.format(placeholders=','.join('?' for _ in keys)), keys
+        ),
+        "joins": lambda backend, cur, keys: (field_mapping.build_lookup_query(fields, len(keys)), keys),
+        "joins_titular": lambda backend, cur, keys: (
+            field_mapping.build_lookup_query(fields, len(keys), titular_priority=True), keys
+        ),
+        "catalog": lambda backend, cur, keys: (
+            query_catalog.lookup_sql(tuple(fields), query_catalog.in_arity(len(keys)), True),
+            query_catalog.pad_keys(keys)
+        ),
+        "derived": lambda backend, cur, keys: (build_derived_query(fields, len(keys)), keys),
+        "keys_table": keys_table,
+    }
+
+
+def run_variant(backend, prepare, keys: Sequence[str], repeat: int) -> Dict[str, Any]:
+    """Mejor tiempo de `repeat` ejecuciones (carga de claves incluida), plan y filas traídas"""
+    best = float("inf")
+    rows: List[Sequence[Any]] = []
+    plan = ""
+    for attempt in range(repeat):
+        cur = backend.con.cursor()
+        start = time.perf_counter()
+        sql, params = prepare(backend, cur, keys)
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        best = min(best, time.perf_counter() - start)
+        if attempt == 0:
+            plan = backend.plan(backend.con.cursor(), sql, params)
+        backend.finish()
+
+    legajos = {str(row[0]) for row in rows}
+    return {
+        "seconds": best,
+        "rows": len(rows),
+        "legajos": len(legajos),
+        "rows_per_legajo": len(rows) / len(legajos) if legajos else 0.0,
+        "plan": plan,
+        "_found": legajos,
+        "_rows": rows,
+    }
+
+
+def _client_rows(rows: Sequence[Sequence[Any]]) -> Dict[Tuple[str, str], set]:
+    """(LEGAJO, COD_CLIENTE) -> filas posibles de ese cliente, con los valores como string"""
+    cod_cliente = 1 + PROPUESTA_FIELDS.index("cod_cliente")
+    options: Dict[Tuple[str, str], set] = {}
+    for row in rows:
+        values = tuple(None if value is None else str(value) for value in row)
+        options.setdefault((values[0], values[cod_cliente]), set()).add(values[1:])
+    return options
+
+
+def check_values(reference_rows: Sequence[Sequence[Any]], rows: Sequence[Sequence[Any]]) -> List[str]:
+    """LEGAJOs cuyo registro elegido (ver rows_to_records) no es una fila de la consulta de referencia
+
+    Se compara por cliente: la referencia no ordena clientes, pero para el cliente elegido los
+    valores (dirección incluida) tienen que ser los de alguna de sus filas.
+    """
+    options = _client_rows(reference_rows)
+    records = field_mapping.rows_to_records(rows, PROPUESTA_FIELDS)
+    return sorted(
+        legajo for legajo, record in records.items()
+        if tuple(record[field] for field in PROPUESTA_FIELDS)
+        not in options.get((legajo, record["cod_cliente"]), ())
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de planes de la consulta de propuestas")
+    parser.add_argument("--backend", choices=["sqlite", "firebird"], default="sqlite")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "standin_propuestas.sqlite"),
+                        help="Archivo de la base de reemplazo (backend sqlite)")
+    parser.add_argument("--propuestas", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keys", type=int, default=1000, help="LEGAJOs por consulta (máximo 1500 en Firebird)")
+    parser.add_argument("--keys-file", help="Archivo con un LEGAJO por línea en lugar de una muestra")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--variants", help="Variantes separadas por coma (por defecto todas)")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        backend = SQLiteBackend(args.db, args.propuestas, args.seed)
+    else:
+        backend = FirebirdBackend()
+
+    if args.keys_file:
+        with open(args.keys_file, encoding="utf-8") as f:
+            keys = list(dict.fromkeys(line.strip() for line in f if line.strip()))[:args.keys]
+    else:
+        keys = backend.sample_keys(args.keys)
+
+    available = variants(PROPUESTA_FIELDS)
+    selected = args.variants.split(",") if args.variants else list(available)
+    unknown = [name for name in selected if name not in available]
+    if unknown:
+        parser.error(f"Variantes desconocidas: {', '.join(unknown)}")
+
+    print(f"[TEST] {len(keys):,} LEGAJOs, {len(PROPUESTA_FIELDS)} campos, {args.repeat} repeticiones, "
+          f"backend {backend.name}")
+    results = {}
+    try:
+        for name in selected:
+            results[name] = run_variant(backend, available[name], keys, args.repeat)
+            result = results[name]
+            print(f"[TIEMPO] {name:<14} {result['seconds'] * 1000:>10,.1f} ms  "
+                  f"{result['rows']:>8,} filas  {result['legajos']:>6,} LEGAJOs  "
+                  f"({result['rows_per_legajo']:.2f} filas por LEGAJO)")
+    finally:
+        backend.close()
+
+    print()
+    for name, result in results.items():
+        print(f"[PLAN] {name}")
+        for line in result["plan"].splitlines():
+            print(f"    {line}")
+
+    # Todas las variantes deben encontrar los mismos LEGAJOs
+    failures = []
+    reference_name = selected[0]
+    reference = results[reference_name]["_found"]
+    for name, result in results.items():
+        if result["_found"] != reference:
+            failures.append(f"{name} encontró {result['legajos']:,} LEGAJOs, "
+                            f"{reference_name} {len(reference):,}")
+
+    # Y los mismos valores que la consulta anterior para el cliente que eligen
+    if "correlated" in results:
+        for name, result in results.items():
+            if name == "correlated":
+                continue
+            different = check_values(results["correlated"]["_rows"], result["_rows"])
+            if different:
+                failures.append(f"{name}: {len(different):,} LEGAJOs con valores distintos a correlated "
+                                f"(por ejemplo {', '.join(different[:5])})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "backend": backend.name,
+                "keys": len(keys),
+                "fields": PROPUESTA_FIELDS,
+                "repeat": args.repeat,
+                "variants": {name: {k: v for k, v in result.items() if not k.startswith("_")}
+                             for name, result in results.items()}
+            }, f, indent=2, ensure_ascii=False)
+        print(f"[GUARDAR] Resultados en {args.json}")
+
+    if failures:
+        for failure in failures:
+            print(f"[X] {failure}")
+        sys.exit(1)
+    fastest = min(results, key=lambda name: results[name]["seconds"])
+    print(f"[CHECK] Mismos LEGAJOs y valores en todas las variantes; la más rápida: {fastest}")
+
+
+if __name__ == "__main__":
+    main()
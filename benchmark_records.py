@@ -0,0 +1,108 @@
+"""
+Benchmark de memoria y velocidad de los resultados por lotes de propuestas
+Construye los resultados de N LEGAJOs (por defecto 100.000) de tres formas y mide el tiempo,
+el pico de memoria durante la construcción y la memoria retenida:
+- model: Dict[str, PropuestaData] (modelo Pydantic validado, como antes)
+- record: Dict[str, PropuestaRecord] (field_mapping, con __slots__)
+- frame: DataFrame de resultados (fill_engine.results_to_frame, columnas de Polars)
+
+tracemalloc solo ve memoria de Python; la del DataFrame se toma de `estimated_size`.
+Verifica que convertir cada registro con `to_propuesta_data` dé el mismo modelo y sale con
+código 1 si no.
+
+Uso: python benchmark_records.py [--legajos 100000] [--repeat 3]
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+import fill_engine
+from field_mapping import PROPUESTA_FIELDS, PropuestaRecord
+from main import FirebirdManager, PropuestaData, to_propuesta_data
+
+
+def generate_records(count: int, seed: int = 42) -> Dict[str, Dict[str, Any]]:
+    """Registros como los devuelve `rows_to_records` (valores string o None)"""
+    rng = random.Random(seed)
+    records = {}
+    for i in range(count):
+        legajo = str(10000 + i)
+        records[legajo] = {
+            "nombre_cliente": f"CLIENTE {rng.randint(1, 10 ** 6)}",
+            "cod_cliente": str(rng.randint(1, 10 ** 6)),
+            "sucursal": f"SUCURSAL {rng.randint(1, 20)}",
+            "monto": f"{rng.uniform(5000, 250000):.2f}" if rng.random() < 0.9 else None,
+            "fecha_contrato": f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "estado": rng.choice(["VIGENTE", "CANCELADO", "SUSPENDIDO"]),
+            "tipo_contrato": f"CONTRATO {rng.randint(1, 5)}",
+            "telefono": f"55{rng.randint(10 ** 7, 10 ** 8 - 1)}",
+            "telefono_movil": f"55{rng.randint(10 ** 7, 10 ** 8 - 1)}" if rng.random() < 0.7 else None,
+            "direccion": f"CALLE {rng.randint(1, 999)} #{rng.randint(1, 500)}" if rng.random() < 0.8 else None,
+            "asesor": f"ASESOR {rng.randint(1, 200)}",
+        }
+    return records
+
+
+def measure(build: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Mejor tiempo de `repeat` corridas, y pico y memoria retenida de una corrida con tracemalloc"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = build()
+        best = min(best, time.perf_counter() - start)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": best, "retained": current, "peak": peak, "_result": result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de registros de propuestas por lotes")
+    parser.add_argument("--legajos", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    records = generate_records(args.legajos)
+    variants = {
+        "model": lambda: {legajo: FirebirdManager._to_propuesta(legajo, record) for legajo, record in records.items()},
+        "record": lambda: {legajo: PropuestaRecord.from_record(legajo, record) for legajo, record in records.items()},
+        "frame": lambda: fill_engine.results_to_frame(records, PROPUESTA_FIELDS),
+    }
+
+    print(f"[TEST] {args.legajos:,} LEGAJOs, {len(PROPUESTA_FIELDS)} campos, {args.repeat} repeticiones")
+    results = {name: measure(build, args.repeat) for name, build in variants.items()}
+    results["frame"]["retained"] += results["frame"]["_result"].estimated_size()
+
+    baseline = results["model"]
+    for name, result in results.items():
+        print(f"[TIEMPO] {name:<7} {result['seconds'] * 1000:>9,.1f} ms  "
+              f"{args.legajos / result['seconds']:>12,.0f} LEGAJOs/s  "
+              f"retenido {result['retained'] / 2 ** 20:>8,.1f} MB  pico {result['peak'] / 2 ** 20:>8,.1f} MB  "
+              f"({result['retained'] / baseline['retained']:.0%} del modelo)")
+
+    # La conversión en el borde del API debe dar exactamente el modelo de antes
+    models = baseline["_result"]
+    compact = results["record"]["_result"]
+    start = time.perf_counter()
+    converted = {legajo: to_propuesta_data(record) for legajo, record in compact.items()}
+    print(f"[TIEMPO] conversión record -> PropuestaData: {(time.perf_counter() - start) * 1000:,.1f} ms")
+
+    mismatches = [legajo for legajo, model in models.items() if converted[legajo] != model]
+    if mismatches or not isinstance(next(iter(converted.values())), PropuestaData):
+        print(f"[X] {len(mismatches):,} registros convertidos distintos al modelo (ej. {mismatches[:3]})")
+        sys.exit(1)
+    print("[CHECK] Los registros compactos convierten al mismo PropuestaData")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark del refresco incremental del snapshot de LEGAJOs (ver snapshot.py)
+Sobre la base de reemplazo (standin_db.py): exporta el snapshot completo, aplica un día de
+cambios simulados, refresca con cada tipo de marca y compara contra una exportación completa
+nueva. Sale con código 1 si el refresco con tabla de cambios no queda igual a la exportación
+completa (con "keys" se esperan diferencias: no ve ediciones de clientes ni bajas).
+
+Uso:
+    python benchmark_snapshot.py [--propuestas 20000] [--inserts 50] [--updates 200] [--deletes 20]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import polars as pl
+
+import standin_db
+from config import SNAPSHOT_CONFIG
+from fill_engine import LEGAJO
+from snapshot import SnapshotStore
+
+MARKERS = ["keys", "change_log"]
+
+
+def read_sorted(store: SnapshotStore) -> pl.DataFrame:
+    return pl.read_parquet(store.path).sort(LEGAJO)
+
+
+def differing_legajos(frame: pl.DataFrame, reference: pl.DataFrame) -> int:
+    """LEGAJOs que faltan, sobran o tienen algún valor distinto"""
+    joined = frame.join(reference, on=LEGAJO, how="outer", suffix="_ref")
+    mismatch = pl.lit(False)
+    for column in reference.columns:
+        if column == LEGAJO:
+            continue
+        mismatch = mismatch | pl.col(column).ne_missing(pl.col(f"{column}_ref"))
+    return joined.filter(mismatch).height
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del refresco incremental del snapshot")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "standin_snapshot.sqlite"),
+                        help="Archivo de la base de reemplazo")
+    parser.add_argument("--propuestas", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--inserts", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--deletes", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"[BD] Generando base de reemplazo con {args.propuestas:,} propuestas...")
+    con = standin_db.create_standin(args.db, args.propuestas, args.seed, SNAPSHOT_CONFIG["change_log_table"])
+    workdir = tempfile.mkdtemp(prefix="snapshot_bench_")
+    original_markers = SNAPSHOT_CONFIG["change_markers"]
+    failures = []
+    try:
+        stores = {}
+        for markers in MARKERS:
+            SNAPSHOT_CONFIG["change_markers"] = markers
+            stores[markers] = SnapshotStore(os.path.join(workdir, markers))
+            meta = stores[markers].export(con, source=args.db)
+            print(f"[TIEMPO] export completo ({markers:<10}) {meta['export_seconds'] * 1000:>10,.1f} ms  "
+                  f"{meta['legajos']:>8,} LEGAJOs")
+
+        stats = standin_db.simulate_changes(con, inserts=args.inserts, updates=args.updates, deletes=args.deletes)
+        print(f"[CAMBIOS] {', '.join(f'{name}={count}' for name, count in stats.items())}")
+
+        reference_store = SnapshotStore(os.path.join(workdir, "full"))
+        start = time.time()
+        reference_store.export(con, source=args.db)
+        full_seconds = time.time() - start
+        reference = read_sorted(reference_store)
+        print(f"[TIEMPO] export completo nuevo      {full_seconds * 1000:>10,.1f} ms  {reference.height:>8,} LEGAJOs")
+
+        for markers in MARKERS:
+            SNAPSHOT_CONFIG["change_markers"] = markers
+            meta = stores[markers].refresh(con, source=args.db)
+            last = meta["last_refresh"]
+            differences = differing_legajos(read_sorted(stores[markers]), reference)
+            print(f"[TIEMPO] refresco {markers:<10}          {last['seconds'] * 1000:>10,.1f} ms  "
+                  f"{last['changed_propuestas']:>6,} propuestas  {last['rows_fetched']:>6,} filas  "
+                  f"{differences:,} LEGAJOs distintos al completo")
+            if markers == "change_log" and differences:
+                failures.append(f"El refresco con tabla de cambios difiere en {differences:,} LEGAJOs")
+    finally:
+        SNAPSHOT_CONFIG["change_markers"] = original_markers
+        con.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if failures:
+        for failure in failures:
+            print(f"[X] {failure}")
+        sys.exit(1)
+    print("[CHECK] El refresco con tabla de cambios coincide con la exportación completa")
+
+
+if __name__ == "__main__":
+    main()
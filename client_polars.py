@@ -9,7 +9,7 @@ import json
 import os
 import polars as pl
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from config import DATABASE_CONFIG, CSV_CONFIG, POLARS_CONFIG
 
 class CSVFirebirdClientPolars:
@@ -44,8 +44,11 @@ class CSVFirebirdClientPolars:
     
     def process_csv_file(self, file_path: str, target_column: str = None, 
                         data_start_row: int = None, propuesta_column: str = None,
-                        use_streaming: bool = None):
-        """Procesa un archivo CSV usando Polars para máximo rendimiento"""
+                        use_streaming: bool = None, field_mapping: Dict[str, str] = None):
+        """Procesa un archivo CSV usando Polars para máximo rendimiento
+        
+        `field_mapping` (encabezado -> campo de BD) llena varias columnas con una sola consulta.
+        """
         
         # Usar valores por defecto de la configuración
         target_column = target_column or CSV_CONFIG["target_column"]
@@ -66,44 +69,218 @@ class CSVFirebirdClientPolars:
         
         with open(file_path, 'rb') as f:
             files = {'file': (os.path.basename(file_path), f, 'text/csv')}
-            data = {
+            # El servidor lee el cuerpo como stream: los parámetros van en la URL
+            params = {
                 'target_column': target_column,
                 'data_start_row': data_start_row,
                 'propuesta_column': propuesta_column,
                 'use_streaming': str(use_streaming).lower()
             }
+            if field_mapping:
+                params['field_mapping'] = json.dumps(field_mapping)
             
             print(f"[COHETE] Enviando archivo para procesamiento...")
             start_time = time.time()
             
-            response = self.session.post(f"{self.base_url}/process-csv/", files=files, data=data)
+            response = self.session.post(f"{self.base_url}/process-csv/", files=files, params=params)
             
             upload_time = time.time() - start_time
         
         if response.status_code == 200:
             result = response.json()
             print("[CHECK] Archivo procesado correctamente con Polars")
-            print(f"   [GRAFICO] Registros procesados: {result['processed_count']:,}")
-            print(f"   [CHECK] Matches encontrados: {result['matched_count']:,}")
-            print(f"   [TIEMPO]  Tiempo total: {result['execution_time']:.2f} segundos")
+            self._print_result(result)
             print(f"   [EMOJI] Tiempo upload: {upload_time:.2f} segundos")
-            print(f"   [COHETE] Velocidad: {result['processed_count']/result['execution_time']:,.0f} registros/seg")
-            
-            if result.get('chunks_processed'):
-                print(f"   [CHUNKS] Chunks procesados: {result['chunks_processed']}")
-            
-            if result['errors']:
-                print(f"   [WARNING]  Errores encontrados: {len(result['errors'])}")
-                for error in result['errors'][:3]:  # Mostrar solo los primeros 3 errores
-                    print(f"      - {error}")
-                if len(result['errors']) > 3:
-                    print(f"      ... y {len(result['errors']) - 3} errores más")
             
+            # La ruta del servidor no es accesible desde otra máquina: bajar el resultado
+            if result.get('download_url'):
+                output_path = file_path.replace('.csv', '_processed.csv')
+                if self._download(result['download_url'], output_path):
+                    result['file_path'] = output_path
             return result
         else:
             print(f"[X] Error procesando archivo: {response.text}")
             return None
     
+    def process_csv_batch(self, file_paths: List[str], target_column: str = None,
+                          data_start_row: int = None, propuesta_column: str = None,
+                          field_mapping: Dict[str, str] = None):
+        """Procesa varios CSV en un solo request: los LEGAJOs de todos se consultan una vez
+        
+        Cada resultado se descarga junto a su original como `<nombre>_processed.csv`.
+        """
+        target_column = target_column or CSV_CONFIG["target_column"]
+        data_start_row = data_start_row or CSV_CONFIG["data_start_row"]
+        propuesta_column = propuesta_column or CSV_CONFIG["propuesta_column"]
+        
+        missing = [path for path in file_paths if not os.path.exists(path)]
+        if missing:
+            print(f"[X] Archivos no encontrados: {', '.join(missing)}")
+            return None
+        
+        total_mb = sum(os.path.getsize(path) for path in file_paths) / (1024 * 1024)
+        print(f"[CARPETA] {len(file_paths)} archivos ({total_mb:.1f} MB)")
+        
+        params = {
+            'target_column': target_column,
+            'data_start_row': data_start_row,
+            'propuesta_column': propuesta_column
+        }
+        if field_mapping:
+            params['field_mapping'] = json.dumps(field_mapping)
+        
+        handles = [open(path, 'rb') for path in file_paths]
+        try:
+            files = [('files', (os.path.basename(path), f, 'text/csv')) for path, f in zip(file_paths, handles)]
+            print(f"[COHETE] Enviando archivos para procesamiento...")
+            start_time = time.time()
+            response = self.session.post(f"{self.base_url}/process-csv/batch/", files=files, params=params)
+            upload_time = time.time() - start_time
+        finally:
+            for f in handles:
+                f.close()
+        
+        if response.status_code != 200:
+            print(f"[X] Error procesando archivos: {response.text}")
+            return None
+        
+        result = response.json()
+        print(f"[CHECK] {sum(item['success'] for item in result['files'])} de {len(file_paths)} archivos procesados")
+        for path, item in zip(file_paths, result['files']):
+            if not item['success']:
+                print(f"   [X] {item['file']}: {'; '.join(item['errors'])}")
+                continue
+            print(f"   [OK] {item['file']}: {item['matched_count']:,} de {item['processed_count']:,} registros, "
+                  f"{item['unmatched_count']:,} LEGAJOs sin datos")
+            if item.get('download_url'):
+                output_path = path.replace('.csv', '_processed.csv')
+                if self._download(item['download_url'], output_path):
+                    item['file_path'] = output_path
+        print(f"   [BUSCAR] LEGAJOs únicos consultados: {result['unique_count']:,} "
+              f"({result['shared_count']:,} compartidos entre archivos)")
+        print(f"   [TIEMPO]  Lectura {result['scan_time']:.2f}s, BD {result['lookup_time']:.2f}s, "
+              f"llenado {result['fill_time']:.2f}s, total {result['execution_time']:.2f}s")
+        print(f"   [EMOJI] Tiempo upload: {upload_time:.2f} segundos")
+        return result
+    
+    def process_csv_job(self, file_path: str, target_column: str = None,
+                        data_start_row: int = None, propuesta_column: str = None,
+                        output_path: str = None, poll_interval: float = 2.0,
+                        field_mapping: Dict[str, str] = None):
+        """Procesa un CSV como trabajo asíncrono: encola, consulta el avance y descarga el resultado
+        
+        No depende de que la conexión HTTP aguante todo el procesamiento.
+        """
+        params = {
+            'target_column': target_column or CSV_CONFIG["target_column"],
+            'data_start_row': data_start_row or CSV_CONFIG["data_start_row"],
+            'propuesta_column': propuesta_column or CSV_CONFIG["propuesta_column"]
+        }
+        if field_mapping:
+            params['field_mapping'] = json.dumps(field_mapping)
+        
+        if not os.path.exists(file_path):
+            print(f"[X] Archivo no encontrado: {file_path}")
+            return None
+        
+        with open(file_path, 'rb') as f:
+            files = {'file': (os.path.basename(file_path), f, 'text/csv')}
+            print(f"[COHETE] Encolando {os.path.basename(file_path)}...")
+            response = self.session.post(f"{self.base_url}/jobs/", files=files, params=params)
+        
+        if response.status_code == 503:
+            print(f"[X] Servidor ocupado, reintentar en {response.headers.get('Retry-After', '?')}s: {response.text}")
+            return None
+        if response.status_code != 202:
+            print(f"[X] Error encolando archivo: {response.text}")
+            return None
+        
+        job_id = response.json()['job_id']
+        print(f"   [LISTA] Trabajo {job_id}")
+        
+        status = self.wait_for_job(job_id, poll_interval)
+        if status is None or status['phase'] != 'terminado':
+            return status
+        
+        result = status['result']
+        print("[CHECK] Archivo procesado correctamente con Polars")
+        self._print_result(result)
+        
+        output_path = output_path or file_path.replace('.csv', '_processed.csv')
+        if self.download_job_result(job_id, output_path):
+            result['file_path'] = output_path
+        return result
+    
+    def wait_for_job(self, job_id: str, poll_interval: float = 2.0):
+        """Consulta el estado del trabajo hasta que termine, mostrando el avance"""
+        while True:
+            response = self.session.get(f"{self.base_url}/jobs/{job_id}")
+            if response.status_code != 200:
+                print(f"[X] Error consultando trabajo: {response.text}")
+                return None
+            
+            status = response.json()
+            if status['phase'] in ('terminado', 'fallido', 'cancelado'):
+                if status['phase'] != 'terminado':
+                    print(f"[X] Trabajo {status['phase']}: {status.get('error') or ''}")
+                return status
+            
+            eta = f", ETA {status['eta_seconds']:.0f}s" if status.get('eta_seconds') is not None else ""
+            print(f"   [TIEMPO] {status['phase']} ({status.get('step') or '-'}): "
+                  f"{status['progress'] * 100:.0f}%, {status['rows_done']:,} filas, "
+                  f"{status['batches_done']} lotes{eta}")
+            time.sleep(poll_interval)
+    
+    def download_job_result(self, job_id: str, output_path: str) -> bool:
+        """Descarga el CSV procesado de un trabajo"""
+        return self._download(f"/jobs/{job_id}/result", output_path)
+    
+    def _download(self, url: str, output_path: str, compression: str = None) -> bool:
+        """Descarga un resultado por bloques; con `compression` (gzip/zstd) se guarda comprimido"""
+        params = {'compression': compression} if compression else None
+        with self.session.get(f"{self.base_url}{url}", params=params, stream=True) as response:
+            if response.status_code != 200:
+                print(f"[X] Error descargando resultado: {response.text}")
+                return False
+            with open(output_path, 'wb') as f:
+                for block in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(block)
+        
+        print(f"   [GUARDADO] Resultado: {output_path}")
+        return True
+    
+    def cancel_job(self, job_id: str):
+        """Cancela un trabajo en cola o en proceso"""
+        response = self.session.delete(f"{self.base_url}/jobs/{job_id}")
+        if response.status_code == 200:
+            print(f"[CHECK] Trabajo {job_id}: {response.json()['phase']}")
+            return response.json()
+        print(f"[X] Error cancelando trabajo: {response.text}")
+        return None
+    
+    def _print_result(self, result: Dict[str, Any]):
+        """Muestra el resumen de un ProcessResult"""
+        print(f"   [GRAFICO] Registros procesados: {result['processed_count']:,}")
+        if result.get('unique_count') is not None:
+            print(f"   [BUSCAR] LEGAJOs únicos consultados: {result['unique_count']:,}")
+        print(f"   [CHECK] Matches encontrados: {result['matched_count']:,}")
+        print(f"   [TIEMPO]  Tiempo total: {result['execution_time']:.2f} segundos")
+        if result['execution_time']:
+            print(f"   [COHETE] Velocidad: {result['processed_count']/result['execution_time']:,.0f} registros/seg")
+        
+        if result.get('cache_hits') is not None:
+            print(f"   [CACHE] Aciertos caché: {result['cache_hits']:,} / consultados a BD: {result['cache_misses']:,}")
+        
+        if result.get('chunks_processed'):
+            print(f"   [CHUNKS] Chunks procesados: {result['chunks_processed']}")
+        
+        if result['errors']:
+            print(f"   [WARNING]  Errores encontrados: {len(result['errors'])}")
+            for error in result['errors'][:3]:  # Mostrar solo los primeros 3 errores
+                print(f"      - {error}")
+            if len(result['errors']) > 3:
+                print(f"      ... y {len(result['errors']) - 3} errores más")
+    
     def _show_csv_preview(self, file_path: str, data_start_row: int):
         """Muestra un preview del CSV usando Polars"""
         try:
@@ -164,6 +341,9 @@ class CSVFirebirdClientPolars:
             print(f"   Base de datos configurada: {status['database_configured']}")
             if 'database_connection' in status:
                 print(f"   Conexión BD: {status['database_connection']}")
+            if 'database_pool' in status:
+                pool = status['database_pool']
+                print(f"   Pool BD: {pool['in_use']} en uso / {pool['size']} abiertas (máx. {pool['max_size']})")
             return status
         else:
             print(f"[X] Error verificando estado: {response.text}")
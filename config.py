@@ -15,9 +15,117 @@ CSV_CONFIG = {
     "use_streaming": True
 }
 
+# Encabezado del template -> campo de BD (ver field_mapping.FIELDS); una sola consulta llena todas
+FILL_MAPPING = {
+    "CLIENTE": "nombre_cliente",
+    "IMPORTE ORIGINAL": "monto",
+    "FECHA CONTRATO": "fecha_contrato",
+}
+
 POLARS_CONFIG = {
     "n_threads": None,  # Usar todos los threads disponibles
     "streaming": True,  # Habilitar streaming para archivos grandes
     "string_cache": True,  # Cache de strings para mejor rendimiento
     "fmt_str_lengths": 50,  # Longitud de strings en output
-}
\ No newline at end of file
+}
+POOL_CONFIG = {
+    "min_size": 1,  # Conexiones abiertas al configurar la BD
+    "max_size": 8,  # Máximo de conexiones simultáneas a Firebird
+    "idle_timeout": 300,  # Segundos antes de cerrar conexiones inactivas (sobre min_size)
+    "acquire_timeout": 30,  # Segundos de espera por una conexión libre
+    "validation_interval": 30,  # Validar con SELECT 1 si la conexión estuvo inactiva más de esto
+}
+
+FETCH_CONFIG = {
+    "workers": 4,  # Lotes consultados en paralelo (no más que POOL_CONFIG["max_size"])
+    "batch_size": 1000,  # LEGAJOs por consulta IN
+    "batch_timeout": 120,  # Segundos por lote antes de reintentarlo
+    "retries": 2,  # Reintentos por lote tras error o timeout
+    "max_in_flight": 4,  # Lotes enviados sin terminar (back-pressure sobre el servidor)
+    "lookup_mode": "in_list",  # "in_list": IN (?, ?, ...) por lote; "temp_table": claves en tabla temporal y un join; "snapshot": ver SNAPSHOT_CONFIG
+    "temp_table_batch_size": 20000,  # LEGAJOs por consulta en modo "temp_table"
+    "fetch_size": 5000,  # Filas por fetchmany al pasar resultados a columnas de Polars
+    "titular_priority": True,  # Con varios clientes por LEGAJO: TITULAR, luego PROPIETARIO, luego el resto
+}
+
+SNAPSHOT_CONFIG = {
+    "directory": ".cache",  # Carpeta del Parquet y sus metadatos
+    "name": "legajos_snapshot",  # Nombre base de los archivos (.parquet y .json)
+    "fields": None,  # Campos exportados (None = los del API, FILL_MAPPING y caracter_titular)
+    "fetch_size": 10000,  # Filas por fetchmany al exportar
+    "max_age_seconds": 86400,  # Pasado este tiempo se avisa que el snapshot está viejo
+    "fallback_missing": True,  # Consultar a la BD los LEGAJOs que no están en el snapshot
+    # Refresco incremental: "keys" (COD_PROPUESTA/COD_CONTRATO crecientes y fecha de contrato, solo altas)
+    # o "change_log" (tabla de cambios con triggers: altas, ediciones y bajas; ver snapshot.py changelog-ddl)
+    "change_markers": "keys",
+    "change_log_table": "CAMBIOS_LEGAJOS",
+    "change_log_overlap": 1000,  # IDs de la tabla de cambios que se releen (transacciones confirmadas tarde)
+    "date_overlap_days": 1,  # Días de la fecha de contrato que se releen
+}
+
+QUERY_CONFIG = {
+    "prepared": True,  # Preparar cada consulta una vez por conexión (cursor.prep) y reutilizarla
+    "in_arities": [1, 10, 25, 50, 100, 200, 300, 500, 750, 1000, 1500],  # Tamaños fijos del IN (se completa con NULL)
+    "max_statements": 64,  # Sentencias preparadas por conexión; se descartan las menos usadas
+}
+
+BATCH_CONFIG = {
+    "adaptive": True,  # Ajustar el tamaño de lote a la latencia medida (False = tamaños fijos de FETCH_CONFIG)
+    "initial_size": 200,  # Tamaño del primer lote de cada perfil de consulta
+    "min_size": 20,  # Nunca menos LEGAJOs por lote
+    "target_seconds": 2.0,  # Latencia buscada por lote
+    # El máximo es FETCH_CONFIG["batch_size"] (y 1500 parámetros del IN) o "temp_table_batch_size"
+}
+
+CACHE_CONFIG = {
+    "enabled": True,  # Caché persistente LEGAJO -> datos de cliente
+    "directory": ".cache",  # Carpeta del archivo SQLite de la caché
+    "ttl_seconds": 86400,  # Vigencia de cada entrada (1 día)
+    "max_entries": 500000,  # Tamaño máximo; se desalojan las menos usadas (LRU)
+    "memory_max_entries": 2048,  # Caché en memoria de GET /propuesta/{legajo}
+    "memory_ttl_seconds": 60,  # Vigencia de cada consulta individual en memoria
+}
+
+SERVICE_CONFIG = {
+    "io_workers": 8,  # Threads para consultas Firebird y lectura/escritura de CSV
+    "cpu_workers": 0,  # Procesos para el llenado con Polars (0 = en el mismo thread; Polars ya usa varios cores)
+    "max_concurrent_uploads": 2,  # CSV procesándose a la vez; el resto espera su turno
+    "max_concurrent_lookups": 16,  # Consultas individuales simultáneas a la BD
+}
+
+JOBS_CONFIG = {
+    "workers": 2,  # Trabajos de CSV procesándose a la vez
+    "max_queue": 20,  # Trabajos en espera; al llenarse POST /jobs/ responde 503
+    "retention_seconds": 3600,  # Tiempo que se guardan estado y resultado de un trabajo terminado
+}
+
+MULTI_FILE_CONFIG = {
+    "workers": 4,  # Procesos para leer y llenar templates en paralelo (multi_template.py y POST /process-csv/batch/)
+    "max_files": 50,  # Archivos por request en POST /process-csv/batch/
+}
+
+INGEST_CONFIG = {
+    "inbox": "inbox",  # Carpeta vigilada por ingest_daemon.py
+    "outbox": "outbox",  # Carpeta de los CSV procesados
+    "workers": 2,  # Archivos procesándose a la vez
+    "max_queue": 100,  # Archivos listos esperando turno; el resto espera en la entrada
+    "settle_seconds": 2.0,  # Segundos sin cambios de tamaño/fecha antes de tomar un archivo
+    "poll_interval": 1.0,  # Segundos entre revisiones de la carpeta (sin inotify)
+    "use_inotify": True,  # En Linux; en otros sistemas siempre se revisa periódicamente
+    "metrics_file": "ingest_metrics.jsonl",  # Métricas por archivo dentro de outbox (None = no guardar)
+    "stats_interval": 60,  # Segundos entre resúmenes en consola
+}
+
+UPLOAD_CONFIG = {
+    "directory": None,  # Carpeta de las subidas (None = carpeta temporal del sistema)
+    "chunk_size": 1024 * 1024,  # Bytes escritos a disco por bloque
+    "max_size_mb": 1024,  # Tamaño máximo de un CSV subido; más grande responde 413
+}
+
+OUTPUT_CONFIG = {
+    "directory": "outputs",  # Carpeta donde quedan los CSV procesados para descargar
+    "retention_seconds": 86400,  # Tiempo que se guarda cada resultado (1 día)
+    "max_total_mb": 2048,  # Cuota de disco; al superarla se borran los más antiguos
+    "cleanup_interval": 300,  # Segundos entre limpiezas por retención aunque no lleguen resultados nuevos
+    "chunk_size": 1024 * 1024,  # Bytes por bloque en las descargas
+}
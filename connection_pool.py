@@ -0,0 +1,219 @@
+"""
+Pool de conexiones Firebird acotado y thread-safe
+Evita pagar el handshake de fdb.connect en cada consulta
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+import query_catalog
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """No se liberó ninguna conexión dentro del tiempo de espera"""
+
+
+class FirebirdConnectionPool:
+    """Pool de conexiones con tamaño mínimo/máximo, expiración por inactividad y validación"""
+
+    def __init__(self, connect: Callable[[], Any], min_size: int = 1, max_size: int = 8,
+                 idle_timeout: float = 300, acquire_timeout: float = 30,
+                 validation_interval: float = 30):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Tamaños de pool inválidos: min={min_size}, max={max_size}")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.validation_interval = validation_interval
+
+        # Conexiones libres como (conexión, último uso); se reutiliza la más reciente (LIFO)
+        self._idle = deque()
+        self._in_use = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        """Conexiones abiertas (libres + en uso)"""
+        return len(self._idle) + self._in_use
+
+    def warm_up(self):
+        """Abre y valida `min_size` conexiones por adelantado"""
+        with self._cond:
+            missing = self.min_size - self.size
+            self._in_use += max(missing, 0)
+
+        created = []
+        try:
+            for _ in range(max(missing, 0)):
+                con = self._connect()
+                created.append(con)
+                if not self._validate(con):
+                    raise ConnectionError("La conexión nueva no pasó la validación")
+        finally:
+            with self._cond:
+                self._in_use -= max(missing, 0)
+                now = time.monotonic()
+                for con in created:
+                    self._idle.append((con, now))
+                self._cond.notify_all()
+
+        logger.info(f"Pool Firebird listo: {self.size} conexiones (min={self.min_size}, max={self.max_size})")
+
+    def acquire(self, timeout: float = None):
+        """Obtiene una conexión válida del pool, abriendo una nueva si hay cupo"""
+        self.prune()
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            con = None
+            last_used = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("El pool de conexiones está cerrado")
+                    if self._idle:
+                        con, last_used = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self.size < self.max_size:
+                        self._in_use += 1  # Reservar el cupo antes de conectar fuera del lock
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"Sin conexiones libres tras {timeout:.0f}s ({self.max_size} en uso)"
+                        )
+                    self._cond.wait(remaining)
+
+            if con is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+
+            # Validar solo conexiones que llevan un rato sin usarse
+            if time.monotonic() - last_used < self.validation_interval or self._validate(con):
+                return con
+
+            logger.warning("Conexión del pool inválida, reconectando")
+            self._discard(con)
+
+    def release(self, con, discard: bool = False):
+        """Devuelve la conexión al pool, terminando su transacción"""
+        if not discard:
+            try:
+                # Cerrar la transacción de lectura para que el próximo uso vea datos frescos
+                con.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._discard(con)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._in_use -= 1
+                self._close_quietly(con)
+            else:
+                self._in_use -= 1
+                self._idle.append((con, time.monotonic()))
+            self._cond.notify()
+
+        self.prune()
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """Context manager: `with pool.connection() as con: ...`"""
+        con = self.acquire(timeout)
+        failed = False
+        try:
+            yield con
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Tras un error, descartar la conexión si ya no responde
+            self.release(con, discard=failed and not self._validate(con))
+
+    def prune(self):
+        """Cierra conexiones inactivas más allá de `idle_timeout`, respetando `min_size`
+
+        Se llama desde `acquire`, `release` y `stats`.
+        """
+        expired = []
+        now = time.monotonic()
+        with self._cond:
+            # Las más antiguas están al inicio de la cola
+            while (self._idle and self.size > self.min_size
+                   and now - self._idle[0][1] > self.idle_timeout):
+                expired.append(self._idle.popleft()[0])
+
+        for con in expired:
+            self._close_quietly(con)
+        if expired:
+            logger.info(f"Pool Firebird: {len(expired)} conexiones inactivas cerradas")
+
+    def stats(self) -> Dict[str, int]:
+        """Ocupación actual del pool
+
+        Antes cierra las conexiones vencidas: con el servicio sin tráfico, las consultas de
+        /metrics y /health siguen liberando las que quedaron libres.
+        """
+        self.prune()
+        with self._cond:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size
+            }
+
+    def close(self):
+        """Cierra todas las conexiones libres; las que están en uso se cierran al devolverse"""
+        with self._cond:
+            self._closed = True
+            idle = [con for con, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+
+        for con in idle:
+            self._close_quietly(con)
+
+    def _validate(self, con) -> bool:
+        try:
+            query_catalog.execute(con, "validation").fetchone()
+            return True
+        except Exception as e:
+            logger.warning(f"Validación de conexión fallida: {str(e)}")
+            return False
+
+    def _discard(self, con):
+        self._close_quietly(con)
+        self._forget()
+
+    def _forget(self):
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(con):
+        query_catalog.discard(con)
+        try:
+            con.close()
+        except Exception:
+            pass
@@ -0,0 +1,272 @@
+"""
+Mapeo declarativo encabezado del template -> campo de la base de datos
+Cada campo conoce su expresión SQL y los joins que necesita; la consulta se arma
+solo con los campos pedidos, así un mapeo angosto no paga los 30 joins de la consulta completa
+"""
+
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Tuple
+
+# Tablas base: toda consulta va de propuesta (LEGAJO) al cliente del contrato
+BASE_FROM = """FROM CONTRATOS_CLIENTES cc
+        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
+        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
+        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA"""
+
+# Variante que parte de una tabla de claves cargada antes (ver temp_lookup.py)
+KEYS_FROM = """FROM {table} k
+        INNER JOIN propuesta p ON p.LEGAJO = k.LEGAJO
+        INNER JOIN contratos ct ON ct.COD_PROPUESTA=p.COD_PROPUESTA
+        INNER JOIN CONTRATOS_CLIENTES cc ON cc.COD_CONTRATO=ct.COD_CONTRATO
+        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE"""
+
+# Con varios clientes por LEGAJO se prefiere el TITULAR, luego el PROPIETARIO y luego el resto
+TITULAR_PRIORITY = (
+    "CASE WHEN UPPER(cart.NOMBRE) = 'TITULAR' THEN 1 "
+    "WHEN UPPER(cart.NOMBRE) = 'PROPIETARIO' THEN 2 ELSE 3 END"
+)
+
+# Un cliente con varios medios de cobro trae una fila por medio, y los que no tienen domicilio
+# vienen con la dirección en NULL: dentro del mismo cliente van primero las filas con dirección
+ADDRESS_FIRST = "CASE WHEN DOM.DIRECCION IS NULL THEN 1 ELSE 0 END"
+
+# alias: (cláusula JOIN, alias de los que depende)
+# El orden del dict es el orden en que aparecen en la consulta
+JOINS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "cart": ("LEFT JOIN CARACTER_TITULARES cart ON cart.COD_CARACTER_TITULAR = cc.COD_CARACTER_TITULAR", ()),
+    "cr": ("INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA", ()),
+    "s": ("INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL", ("cr",)),
+    "ed": ("INNER JOIN ESTADOS_DEUDAS ed ON cr.COD_ESTADO_DEUDA=ed.COD_ESTADO_DEUDA", ("cr",)),
+    "ec": ("INNER JOIN ESTADOS_CONTRATOS ec ON ct.COD_ESTADO_CONTRATO = ec.COD_ESTADO_CONTRATO", ()),
+    "tc": ("INNER JOIN TIPOS_CONTRATOS TC ON CT.COD_TIPO_CONTRATO=TC.COD_TIPO_CONTRATO", ()),
+    "vg": ("INNER JOIN vendedor vg ON ct.COD_VENDEDOR=vg.COD_VENDEDOR", ()),
+    "eq": ("INNER JOIN EQUIPO_VENDEDORES eq ON vg.COD_EQUIPO=eq.COD_EQUIPO", ("vg",)),
+    "pvm": ("LEFT JOIN PLANES_VENTAS_MODELOS pvm ON ct.COD_PLAN_VENTA_MODELO=pvm.COD_PLAN_VENTA_MODELO", ()),
+    "cp": ("LEFT JOIN CONTRATOS_PARCELAS cp ON ct.COD_CONTRATO=cp.COD_CONTRATO_PARCELA", ()),
+    "pa": ("LEFT JOIN parcela pa ON cp.COD_PARCELA=pa.COD_PARCELA", ("cp",)),
+    "mco": ("LEFT JOIN MEDIOS_COBROS mco ON mco.COD_CLIENTE = c.COD_CLIENTE", ()),
+    "zc": ("LEFT JOIN ZONA_COBRANZA zc ON zc.COD_ZONA_COBRANZA = mco.COD_ZONA_COBRANZA", ("mco",)),
+    "mcd": ("LEFT JOIN MEDIOS_COBROS_DOMICILIOS mcd ON mcd.COD_MEDIO_COBRO = mco.COD_MEDIO_COBRO", ("mco",)),
+    "dom": ("LEFT JOIN DOMICILIOS DOM ON dom.COD_DOMICILIO = mcd.COD_DOMICILIO", ("mcd",)),
+    "bar": ("LEFT JOIN BARRIOS bar ON bar.COD_BARRIO = dom.COD_BARRIO", ("dom",)),
+    "loc": ("LEFT JOIN LOCALIDADES loc ON loc.COD_LOCALIDAD = dom.COD_LOCALIDAD", ("dom",)),
+    "prv": ("LEFT JOIN PROVINCIAS prv ON prv.COD_PROVINCIA = loc.COD_PROVINCIA", ("loc",)),
+    "mcb": ("LEFT OUTER JOIN MEDIOS_COBROS_BANCOS mcb ON mcb.COD_MEDIO_COBRO = mco.COD_MEDIO_COBRO", ("mco",)),
+    "tx": ("LEFT OUTER JOIN TARJETA_OXXO tx ON tx.COD_PROPUESTA = p.COD_PROPUESTA", ()),
+    "cb": ("LEFT OUTER JOIN CLABE_BANCARIA cb ON cb.COD_PROPUESTA = p.COD_PROPUESTA", ()),
+}
+
+# campo: (expresión SQL, alias de los joins que necesita)
+FIELDS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "nombre_cliente": ("c.NOMBRE", ()),
+    "cod_cliente": ("cc.COD_CLIENTE", ()),
+    "cod_contrato": ("cc.COD_CONTRATO", ()),
+    "caracter_titular": ("cart.NOMBRE", ("cart",)),
+    "sucursal": ("s.NOMBRE", ("s",)),
+    "monto": ("CR.MONTO", ("cr",)),
+    "estado_credito": ("ed.ESTADO", ("ed",)),
+    "fecha_contrato": ("ct.FECHA", ()),
+    "estado": ("ec.ESTADO", ("ec",)),
+    "tipo_contrato": ("TC.NOMBRE", ("tc",)),
+    "asesor": ("vg.NOMBRE", ("vg",)),
+    "equipo": ("eq.DESCRIPCION", ("eq",)),
+    "nombre_anterior": ("pvm.NOMBRE", ("pvm",)),
+    "ubicacion": ("pa.LEGAJO", ("pa",)),
+    "telefono": ("c.TELEFONO", ()),
+    "telefono_movil": ("c.TELEFONO_MOVIL", ()),
+    "telefono_laboral": ("c.TELEFONO_LABORAL", ()),
+    "tipo_documento": ("C.TIPO_DOCUMENTO", ()),
+    "nro_documento": ("C.NRO_DOCUMENTO", ()),
+    "rfc": ("C.CUIT", ()),
+    "medio_cobro": ("mco.DESCRIPCION", ("mco",)),
+    "cobrador_asignado": ("mco.COD_COBRADOR_ASIGNADO", ("mco",)),
+    "zona_cobranza": ("zc.DESCRIPCION", ("zc",)),
+    "direccion": ("DOM.DIRECCION", ("dom",)),
+    "manzana": ("dom.MANZANA", ("dom",)),
+    "barrio": ("bar.NOMBRE", ("bar",)),
+    "localidad": ("loc.NOMBRE", ("loc",)),
+    "provincia": ("prv.NOMBRE", ("prv",)),
+    "medio_cobro_cuenta": ("mcb.NRO_CUENTA", ("mcb",)),
+    "titular_cobro": ("mcb.TITULAR", ("mcb",)),
+    "cod_barra_oxxo": ("tx.CODIGO_BARRA", ("tx",)),
+    "clabe_banco": (
+        "CASE WHEN cb.CLABE IS NULL THEN '0' ELSE 'C.' || CAST(cb.CLABE AS VARCHAR(50)) END",
+        ("cb",)
+    ),
+}
+
+# Campos de PropuestaData (API /propuesta/{legajo})
+PROPUESTA_FIELDS = [
+    "nombre_cliente", "cod_cliente", "sucursal", "monto", "fecha_contrato", "estado",
+    "tipo_contrato", "telefono", "telefono_movil", "direccion", "asesor",
+]
+
+
+
+class PropuestaRecord:
+    """Registro compacto de una propuesta para el procesamiento por lotes
+
+    Mismos campos que `PropuestaData` (main.py) en `__slots__`: sin `__dict__` por instancia
+    ni validación. Se convierte al modelo solo al responder desde el API.
+    """
+
+    __slots__ = ("cod_propuesta", *PROPUESTA_FIELDS)
+
+    def __init__(self, cod_propuesta: str, **values: Any):
+        self.cod_propuesta = cod_propuesta
+        for field in PROPUESTA_FIELDS:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def from_record(cls, legajo: str, record: Mapping[str, Any]) -> "PropuestaRecord":
+        """Desde un registro de `rows_to_records`: textos vacíos en lugar de NULL y monto numérico"""
+        values = {field: record.get(field) or "" for field in PROPUESTA_FIELDS}
+        values["monto"] = float(record["monto"]) if record.get("monto") else 0.0
+        return cls(legajo, **values)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, PropuestaRecord) and self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        return f"PropuestaRecord({self.cod_propuesta!r}, nombre_cliente={self.nombre_cliente!r})"
+
+
+def validate_mapping(mapping: Mapping[str, str]) -> Dict[str, str]:
+    """Valida un mapeo encabezado -> campo; lanza ValueError si hay campos desconocidos"""
+    if not mapping:
+        raise ValueError("El mapeo de campos está vacío")
+    unknown = sorted({field for field in mapping.values() if field not in FIELDS})
+    if unknown:
+        raise ValueError(
+            f"Campos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(sorted(FIELDS))}"
+        )
+    return dict(mapping)
+
+
+def mapping_fields(mapping: Mapping[str, str]) -> List[str]:
+    """Campos distintos de un mapeo, en orden estable (varias columnas pueden usar el mismo)"""
+    return sorted(set(mapping.values()))
+
+
+def required_joins(fields: Iterable[str], extra: Iterable[str] = ()) -> List[str]:
+    """Joins que necesitan `fields` y los alias `extra` (con sus dependencias), en el orden de `JOINS`"""
+    needed = set()
+    pending = [alias for field in fields for alias in FIELDS[field][1]] + list(extra)
+    while pending:
+        alias = pending.pop()
+        if alias not in needed:
+            needed.add(alias)
+            pending.extend(JOINS[alias][1])
+    return [alias for alias in JOINS if alias in needed]
+
+
+def _client_order(fields: Sequence[str], titular_priority: bool) -> str:
+    """Orden de las filas de un LEGAJO: primero se elige el cliente y después su mejor fila"""
+    order = [TITULAR_PRIORITY] if titular_priority else []
+    order += ["c.NOMBRE", "cc.COD_CLIENTE"]
+    if "dom" in required_joins(fields):
+        order.append(ADDRESS_FIRST)
+    return ", ".join(order)
+
+
+def _joins(fields: Sequence[str], titular_priority: bool) -> List[str]:
+    extra = ("cart",) if titular_priority else ()
+    return [JOINS[alias][0] for alias in required_joins(fields, extra)]
+
+
+def build_lookup_query(fields: Sequence[str], key_count: int, titular_priority: bool = False) -> str:
+    """Consulta por LEGAJO con un IN de `key_count` parámetros que trae solo `fields`
+
+    La primera columna es el LEGAJO y las siguientes los campos en el orden dado; dentro de
+    cada LEGAJO las filas vienen por nombre de cliente, o primero el titular con
+    `titular_priority`, y las de un mismo cliente con dirección antes que sin ella (ver
+    `rows_to_records`). Los INNER JOIN de campos no pedidos no se
+    incluyen, así que un mapeo angosto también encuentra propuestas que no tienen, por
+    ejemplo, crédito cargado.
+    """
+    columns = ",\n            ".join(["p.LEGAJO"] + [FIELDS[field][0] for field in fields])
+    tables = "\n        ".join([BASE_FROM] + _joins(fields, titular_priority))
+    placeholders = ','.join(['?' for _ in range(key_count)])
+    return f"""
+        SELECT
+            {columns}
+        {tables}
+        WHERE p.LEGAJO IN ({placeholders})
+        ORDER BY p.LEGAJO, {_client_order(fields, titular_priority)}
+        """
+
+
+def build_snapshot_query(fields: Sequence[str], titular_priority: bool = True, key_count: int = 0) -> str:
+    """Consulta de `fields` para todos los LEGAJOs (ver snapshot.py)
+
+    Columnas: LEGAJO, COD_PROPUESTA y los campos. Con `key_count` se limita a un IN de
+    COD_PROPUESTA (propuestas modificadas desde el último refresco). Las filas vienen por
+    LEGAJO y prioridad de cliente: la primera fila de cada LEGAJO es la que se conserva.
+    """
+    columns = ",\n            ".join(["p.LEGAJO", "p.COD_PROPUESTA"] + [FIELDS[field][0] for field in fields])
+    tables = "\n        ".join([BASE_FROM] + _joins(fields, titular_priority))
+    where = f"WHERE p.COD_PROPUESTA IN ({','.join(['?' for _ in range(key_count)])})" if key_count else ""
+    return f"""
+        SELECT
+            {columns}
+        {tables}
+        {where}
+        ORDER BY p.LEGAJO, {_client_order(fields, titular_priority)}
+        """
+
+
+def build_keys_table_query(fields: Sequence[str], table: str, titular_priority: bool = True,
+                           ranked: bool = True) -> str:
+    """Consulta de `fields` para todos los LEGAJOs cargados en `table`, sin parámetros
+
+    Con `ranked` el servidor elige un solo cliente por LEGAJO con ROW_NUMBER() (Firebird 3+).
+    Sin él las filas vienen ordenadas por prioridad y `rows_to_records` se queda con la primera.
+    """
+    aliases = [f"F{i}" for i in range(len(fields))]
+    tables = "\n        ".join([KEYS_FROM.format(table=table)] + _joins(fields, titular_priority))
+    order = _client_order(fields, titular_priority)
+
+    if not ranked:
+        columns = ",\n            ".join(["p.LEGAJO"] + [FIELDS[field][0] for field in fields])
+        return f"""
+        SELECT
+            {columns}
+        {tables}
+        ORDER BY p.LEGAJO, {order}
+        """
+
+    columns = ",\n            ".join(
+        ["p.LEGAJO"]
+        + [f"{FIELDS[field][0]} AS {alias}" for field, alias in zip(fields, aliases)]
+        + [f"ROW_NUMBER() OVER (PARTITION BY p.LEGAJO ORDER BY {order}) AS RN"]
+    )
+    return f"""
+        SELECT ranked.LEGAJO{''.join(f', ranked.{alias}' for alias in aliases)}
+        FROM (
+        SELECT
+            {columns}
+        {tables}
+        ) ranked
+        WHERE ranked.RN = 1
+        ORDER BY ranked.LEGAJO
+        """
+
+
+def rows_to_records(rows: Iterable[Sequence[Any]], fields: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """LEGAJO -> {campo: valor} con el primer registro de cada LEGAJO
+
+    Los valores quedan como string (None si son NULL): así se escriben en el CSV y se
+    guardan igual en la caché persistente.
+    """
+    records = {}
+    for row in rows:
+        legajo = str(row[0])
+        if legajo in records:
+            continue
+        records[legajo] = {
+            field: None if value is None else str(value)
+            for field, value in zip(fields, row[1:])
+        }
+    return records
@@ -0,0 +1,342 @@
+"""
+Motor compartido de extracción de LEGAJOs y llenado de templates con Polars
+Todo el trabajo por fila se hace con expresiones vectorizadas (sin loops de Python)
+"""
+
+import csv
+import glob
+import io
+import os
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import polars as pl
+
+# Columnas auxiliares internas
+ROW_IDX = "__row_idx"
+LEGAJO = "legajo"
+FILL_PREFIX = "__fill_"
+
+# LEGAJOs válidos: números puros de 4+ dígitos
+LEGAJO_PATTERN = r"^\d{4,}$"
+
+# Valores que se consideran "celda vacía" en los templates
+EMPTY_PLACEHOLDERS = ['', 'CLIENTE', 'nan', 'None', 'null']
+
+# Encabezados de los templates y su columna habitual (0-based), de respaldo si no aparecen
+TEMPLATE_HEADERS = {
+    "PROPUESTA JKM": 1,  # Columna B
+    "CLIENTE": 5,  # Columna F
+    "FECHA CONTRATO": 7,  # Columna H
+    "IMPORTE ORIGINAL": 21,  # Columna V
+}
+
+# Filas de encabezado antes de los datos (los datos empiezan en la fila 11)
+HEADER_ROWS = 10
+
+# Template que procesan los scripts cuando no se les pasa ningún archivo
+DEFAULT_TEMPLATE = "ORDEN DE VENTA CUA.csv"
+
+
+def template_paths(patterns: Sequence[str], default: Optional[str] = DEFAULT_TEMPLATE) -> List[str]:
+    """Rutas de los argumentos de un script, expandiendo comodines (sin repetir, en el orden dado)
+
+    Sin argumentos devuelve `default` (lista vacía si es None).
+    """
+    if not patterns:
+        return [default] if default else []
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def processed_path(file_path: str, suffix: str = "_PROCESADO", output_dir: Optional[str] = None) -> str:
+    """Ruta del resultado: `<nombre><suffix>.csv` junto al original o en `output_dir`"""
+    directory, name = os.path.split(file_path)
+    base, _ = os.path.splitext(name)
+    return os.path.join(output_dir or directory, f"{base}{suffix}.csv")
+
+
+def read_template(file_path: Any, header_rows: Optional[int] = None, **kwargs) -> pl.DataFrame:
+    """Lee un template CSV irregular con todas las columnas como string
+
+    Con `header_rows` el ancho es el de la fila más ancha de las primeras `header_rows`
+    (ver `header_width`); si no, el de la primera fila, como hace Polars.
+    """
+    options = dict(
+        separator=',',
+        has_header=False,
+        truncate_ragged_lines=True,  # Arregla líneas irregulares
+        ignore_errors=True,
+        infer_schema_length=0,  # Todo como string
+        encoding='utf-8'
+    )
+    options.update(kwargs)
+    if header_rows is not None and "schema" not in options:
+        options["schema"] = template_schema(header_width(file_path, header_rows, options["encoding"]))
+    return pl.read_csv(file_path, **options)
+
+
+def header_width(source: Any, header_rows: int = HEADER_ROWS, encoding: str = 'utf-8') -> int:
+    """Máximo de campos en las primeras `header_rows` filas de una ruta o archivo binario
+
+    Es el ancho del template: la primera fila suele ser un título más angosto que los
+    encabezados. Un archivo abierto queda en la posición en que estaba.
+    """
+    def widest(binary) -> int:
+        text = io.TextIOWrapper(binary, encoding=encoding, errors="replace", newline="")
+        try:
+            return max([1] + [len(row) for _, row in zip(range(header_rows), csv.reader(text))])
+        finally:
+            text.detach()
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return widest(f)
+    position = source.tell()
+    try:
+        return widest(source)
+    finally:
+        source.seek(position)
+
+
+def template_schema(width: int) -> Dict[str, Any]:
+    """Esquema de `width` columnas string con los nombres que pone Polars sin encabezado"""
+    return {f"column_{i + 1}": pl.Utf8 for i in range(width)}
+
+
+def column_letter_to_index(letter: str) -> int:
+    """Convierte una letra de columna de Excel (A, B, ..., AA) a índice 0-based"""
+    index = 0
+    for char in letter.strip().upper():
+        index = index * 26 + (ord(char) - ord('A') + 1)
+    return index - 1
+
+
+def normalize_header(name: str) -> str:
+    """Forma canónica de un encabezado: mayúsculas, sin '_' ni espacios repetidos"""
+    return " ".join(name.replace("_", " ").upper().split())
+
+
+def build_header_index(df: pl.DataFrame, header_rows: int = HEADER_ROWS,
+                       names: Iterable[str] = TEMPLATE_HEADERS) -> Dict[str, int]:
+    """Busca los encabezados `names` en las primeras `header_rows` filas, en una sola pasada
+
+    Devuelve encabezado normalizado -> índice de columna (0-based). Si un encabezado aparece
+    en varias columnas gana la de más a la izquierda. Los no encontrados no se incluyen.
+    """
+    wanted = list({normalize_header(name) for name in names})
+    if df.width == 0 or not wanted:
+        return {}
+
+    positions = {column: i for i, column in enumerate(df.columns)}
+    found = (
+        df.lazy()
+        .head(header_rows)
+        .select(pl.all().cast(pl.Utf8))
+        .melt(variable_name="__column", value_name="__header")
+        .with_columns(
+            pl.col("__header").str.replace_all("_", " ").str.replace_all(r"\s+", " ")
+            .str.strip_chars().str.to_uppercase()
+        )
+        .filter(pl.col("__header").is_in(wanted))
+        .collect()
+    )
+
+    index = {}
+    for column, header in found.iter_rows():
+        if header not in index or positions[column] < index[header]:
+            index[header] = positions[column]
+    return index
+
+
+def resolve_column_map(df: pl.DataFrame, header_index: Dict[str, int], fields: Dict[str, str],
+                       fallbacks: Dict[str, int] = TEMPLATE_HEADERS) -> Dict[str, str]:
+    """Arma el `column_map` de `apply_fill` (columna del DataFrame -> campo) desde el índice
+
+    `fields` va de campo a encabezado. Un encabezado no encontrado usa su columna habitual
+    de `fallbacks` si existe en `df`; si no, se crea una columna nueva al final.
+    """
+    return resolve_fill_mapping(df, header_index, {header: field for field, header in fields.items()}, fallbacks)
+
+
+def resolve_fill_mapping(df: pl.DataFrame, header_index: Dict[str, int], mapping: Mapping[str, str],
+                         fallbacks: Dict[str, int] = TEMPLATE_HEADERS) -> Dict[str, str]:
+    """Como `resolve_column_map` pero con el mapeo encabezado -> campo (ver field_mapping.py)
+
+    Varios encabezados pueden llenarse con el mismo campo.
+    """
+    column_map = {}
+    new_columns = 0
+    for header, field in mapping.items():
+        key = normalize_header(header)
+        index = header_index.get(key, fallbacks.get(key))
+        if index is None or index >= df.width:
+            new_columns += 1
+            column = f"column_{df.width + new_columns}"
+        else:
+            column = df.columns[index]
+        column_map[column] = field
+    return column_map
+
+
+def extract_legajos(df: pl.DataFrame, start_row: int = 10, column_index: int = 1) -> pl.DataFrame:
+    """Extrae los LEGAJOs válidos desde `start_row` (0-based)
+
+    Devuelve un DataFrame con el índice de fila (`ROW_IDX`) y el `LEGAJO` limpio.
+    """
+    if df.width <= column_index:
+        return pl.DataFrame(schema={ROW_IDX: pl.UInt32, LEGAJO: pl.Utf8})
+
+    column_name = df.columns[column_index]
+    return (
+        df.lazy()
+        .select(pl.col(column_name).str.strip_chars().alias(LEGAJO))
+        .with_row_count(ROW_IDX)
+        .slice(start_row)
+        .filter(pl.col(LEGAJO).str.contains(LEGAJO_PATTERN))
+        .select(ROW_IDX, LEGAJO)
+        .collect()
+    )
+
+
+def unique_legajos(legajos: pl.DataFrame) -> List[str]:
+    """LEGAJOs sin repetir, en orden numérico para que Firebird recorra el índice secuencialmente
+
+    El llenado es un join por LEGAJO, así que cada resultado vuelve a todas las filas que lo usan.
+    """
+    return (
+        legajos.select(LEGAJO)
+        .unique()
+        .sort([pl.col(LEGAJO).str.len_chars(), LEGAJO])
+        .get_column(LEGAJO)
+        .to_list()
+    )
+
+
+def results_to_frame(matches: Mapping[str, Any], fields: List[str]) -> pl.DataFrame:
+    """Convierte los resultados de BD (LEGAJO -> dict u objeto) en un DataFrame de strings
+
+    Solo recorre los LEGAJOs encontrados (no las filas del CSV).
+    """
+    columns = {LEGAJO: list(matches.keys())}
+    for field in fields:
+        values = []
+        for row in matches.values():
+            value = row.get(field) if isinstance(row, Mapping) else getattr(row, field, None)
+            values.append(None if value is None else str(value))
+        columns[FILL_PREFIX + field] = values
+
+    schema = {name: pl.Utf8 for name in columns}
+    return pl.DataFrame(columns, schema=schema)
+
+
+def results_schema(fields: List[str]) -> Dict[str, pl.DataType]:
+    return {LEGAJO: pl.Utf8, **{FILL_PREFIX + field: pl.Utf8 for field in fields}}
+
+
+def rows_to_frame(rows: Sequence[Sequence[Any]], fields: List[str]) -> pl.DataFrame:
+    """Convierte filas de BD (LEGAJO, campos...) en un bloque de resultados, columna por columna
+
+    Sin objetos ni dicts por fila; los valores quedan como string igual que en
+    `field_mapping.rows_to_records`. No quita LEGAJOs repetidos (ver `concat_results`).
+    """
+    schema = results_schema(fields)
+    if not rows:
+        return pl.DataFrame(schema=schema)
+    columns = {
+        name: [None if value is None else str(value) for value in values]
+        for name, values in zip(schema, zip(*rows))
+    }
+    return pl.DataFrame(columns, schema=schema)
+
+
+def concat_results(frames: List[pl.DataFrame], fields: List[str]) -> pl.DataFrame:
+    """Une bloques de resultados dejando la primera fila de cada LEGAJO (la del titular)"""
+    frames = [frame for frame in frames if frame.height]
+    if not frames:
+        return pl.DataFrame(schema=results_schema(fields))
+    return pl.concat(frames).unique(subset=[LEGAJO], keep="first", maintain_order=True)
+
+
+def frame_to_results(results: pl.DataFrame, fields: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Inversa de `results_to_frame`: LEGAJO -> {campo: valor} (para la caché persistente)"""
+    columns = [FILL_PREFIX + field for field in fields]
+    return {
+        row[0]: dict(zip(fields, row[1:]))
+        for row in results.select(LEGAJO, *columns).iter_rows()
+    }
+
+
+def empty_cell(column: str) -> pl.Expr:
+    """Expresión que indica si una celda del template está vacía o es un placeholder"""
+    return pl.col(column).is_null() | pl.col(column).str.strip_chars().is_in(EMPTY_PLACEHOLDERS)
+
+
+def apply_fill(df: pl.DataFrame, legajos: pl.DataFrame, results: pl.DataFrame,
+               column_map: Dict[str, str], overwrite: bool = False) -> Tuple[pl.DataFrame, Dict[str, Any]]:
+    """Llena las columnas del template con los datos de BD (función pura: `df` no se modifica)
+
+    `column_map` va de nombre de columna del DataFrame a campo de `results`.
+    Sin `overwrite` solo se llenan celdas vacías. Columnas inexistentes se crean.
+
+    Solo se reconstruyen las columnas destino: los valores de BD se alinean a las filas
+    con un join sobre el índice de fila (sin tocar las demás columnas) y el DataFrame
+    nuevo comparte con `df` la memoria de todas las columnas que no cambian.
+
+    Devuelve el DataFrame nuevo y las estadísticas
+    `{"matched_rows": n, "filled": {columna: n}}`.
+    """
+    # Filas del CSV con su fila de resultados (inner: solo las que tienen datos)
+    fields = list(dict.fromkeys(column_map.values()))
+    fills = (
+        legajos.join(results.select(LEGAJO, *[FILL_PREFIX + field for field in fields]), on=LEGAJO, how="inner")
+        .drop(LEGAJO)
+    )
+    matched_rows = fills.height
+
+    # Valores de BD alineados a cada fila del template (null donde no hay dato)
+    aligned = (
+        pl.DataFrame({ROW_IDX: pl.arange(0, df.height, dtype=pl.UInt32, eager=True)})
+        .join(fills, on=ROW_IDX, how="left")
+        .drop(ROW_IDX)
+    )
+    # Concatenación horizontal sin copiar: solo las columnas destino existentes más los valores
+    targets = [column for column in column_map if column in df.columns]
+    work = pl.concat([df.select(targets), aligned], how="horizontal") if targets else aligned
+
+    new_columns = []
+    counts = []
+    for column, field in column_map.items():
+        value = pl.col(FILL_PREFIX + field)
+        condition = value.is_not_null()
+        if column not in df.columns:
+            # Columna nueva: todas sus celdas están vacías
+            new_columns.append(value.alias(column))
+        else:
+            if not overwrite:
+                condition = condition & empty_cell(column)
+            new_columns.append(pl.when(condition).then(value).otherwise(pl.col(column)).alias(column))
+        counts.append(condition.sum().alias(column))
+
+    # Valores nuevos y conteos se calculan en paralelo sobre el mismo `work`
+    computed, filled_counts = pl.collect_all([work.lazy().select(new_columns), work.lazy().select(counts)])
+    filled_counts = filled_counts.row(0, named=True)
+
+    stats = {
+        "matched_rows": matched_rows,
+        "filled": {column: int(filled_counts[column] or 0) for column in column_map}
+    }
+    return df.with_columns(computed.get_columns()), stats
+
+
+def unmatched_legajos(legajos: pl.DataFrame, results: pl.DataFrame) -> List[str]:
+    """LEGAJOs del CSV sin datos en BD, sin repetir y en orden de aparición"""
+    return (
+        legajos.select(LEGAJO)
+        .unique(maintain_order=True)
+        .join(results.select(LEGAJO), on=LEGAJO, how="anti")
+        .get_column(LEGAJO)
+        .to_list()
+    )
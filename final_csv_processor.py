@@ -6,14 +6,16 @@ Procesador final de CSV con estadísticas completas y opción de sobrescribir
 import polars as pl
 import fdb
 import os
+import sys
 from config import DATABASE_CONFIG
+import query_catalog
+from fill_engine import build_header_index, template_paths, processed_path, DEFAULT_TEMPLATE
 
-def process_csv_final(overwrite_existing=False):
+def process_csv_final(overwrite_existing=False, csv_file=DEFAULT_TEMPLATE):
     """Procesa el CSV con opción de sobrescribir datos existentes"""
     print("PROCESADOR FINAL CSV-FIREBIRD")
     print("=" * 60)
-    
-    csv_file = "ORDEN DE VENTA CUA.csv"
+    print(f"[ARCHIVO] {csv_file}")
     
     # 1. Leer CSV
     print("[1/5] Leyendo CSV...")
@@ -34,7 +36,9 @@ def process_csv_final(overwrite_existing=False):
     
     # 2. Extraer LEGAJOs
     print("\n[2/5] Extrayendo LEGAJOs...")
-    column_b_name = df.columns[1]
+    # Encabezados del template resueltos una sola vez (con las columnas habituales de respaldo)
+    header_index = build_header_index(df)
+    column_b_name = df.columns[header_index.get("PROPUESTA JKM", 1)]
     col_b = df.get_column(column_b_name)
     
     legajos = []
@@ -58,20 +62,6 @@ def process_csv_final(overwrite_existing=False):
             charset=DATABASE_CONFIG["charset"]
         )
         
-        query = """
-        SELECT DISTINCT 
-            p.LEGAJO AS COD_PROPUESTA,
-            c.NOMBRE as Nombre_Cliente
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        WHERE p.LEGAJO = ?
-        """
-        
-        cursor = con.cursor()
         matches = {}
         
         print("[INFO] Procesando en lotes de 100...")
@@ -80,14 +70,12 @@ def process_csv_final(overwrite_existing=False):
             batch = legajos[i:i+100]
             print(f"  Lote {i//100 + 1}: {len(batch)} LEGAJOs")
             
-            for legajo in batch:
-                try:
-                    cursor.execute(query, (legajo,))
-                    result = cursor.fetchone()
-                    if result:
-                        matches[legajo] = result[1]
-                except:
-                    pass
+            try:
+                # Una consulta IN por lote; la sentencia preparada se reutiliza en todos
+                records = query_catalog.fetch_lookup(con, batch, ["nombre_cliente"])
+                matches.update({legajo: record["nombre_cliente"] for legajo, record in records.items()})
+            except:
+                pass
         
         con.close()
         print(f"[OK] {len(matches)} matches encontrados en BD")
@@ -99,7 +87,7 @@ def process_csv_final(overwrite_existing=False):
     # 4. Actualizar CSV
     print("\n[4/5] Actualizando CSV...")
     
-    cliente_col_name = df.columns[5]  # Columna F (CLIENTE)
+    cliente_col_name = df.columns[header_index.get("CLIENTE", 5)]  # Columna F si no hay encabezado
     current_values = df.get_column(cliente_col_name).to_list()
     
     stats = {
@@ -145,7 +133,7 @@ def process_csv_final(overwrite_existing=False):
     print("\n[5/5] Guardando archivo...")
     
     try:
-        output_file = "ORDEN DE VENTA CUA_PROCESADO.csv"
+        output_file = processed_path(csv_file)
         df.write_csv(output_file, separator=',')
         print(f"[OK] Archivo guardado: {output_file}")
         
@@ -180,6 +168,7 @@ def process_csv_final(overwrite_existing=False):
     print(f"\nArchivo final: {output_file}")
 
 def main():
+    # Uso: python final_csv_processor.py [archivo.csv ...] (por defecto ORDEN DE VENTA CUA.csv)
     print("¿Quieres sobrescribir datos existentes? (s/n): ", end="")
     response = input().strip().lower()
     overwrite = response.startswith('s')
@@ -189,7 +178,8 @@ def main():
     else:
         print("[INFO] Modo: Solo llenar campos vacíos")
     
-    process_csv_final(overwrite_existing=overwrite)
+    for csv_file in template_paths(sys.argv[1:]):
+        process_csv_final(overwrite_existing=overwrite, csv_file=csv_file)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
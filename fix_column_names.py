@@ -85,6 +85,7 @@ def test_database_with_legajos(legajos):
     try:
         from config import DATABASE_CONFIG
         import fdb
+        import query_catalog
         
         con = fdb.connect(
             host=DATABASE_CONFIG["host"],
@@ -94,27 +95,14 @@ def test_database_with_legajos(legajos):
             charset=DATABASE_CONFIG["charset"]
         )
         
-        query = """
-        SELECT DISTINCT 
-            p.LEGAJO AS COD_PROPUESTA,
-            c.NOMBRE as Nombre_Cliente,
-            s.NOMBRE AS SUCURSAL
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        WHERE p.LEGAJO = ?
-        """
+        # Consulta del catálogo (query_catalog.py), preparada una vez para todos los LEGAJOs
+        fields = ["nombre_cliente", "sucursal"]
         
-        cursor = con.cursor()
         matches = {}
         
         for legajo in legajos[:10]:  # Probar primeros 10
             try:
-                cursor.execute(query, (legajo,))
-                result = cursor.fetchone()
+                result = query_catalog.execute_lookup(con, [legajo], fields).fetchone()
                 
                 if result:
                     matches[legajo] = result[1]  # Nombre del cliente
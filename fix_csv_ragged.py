@@ -8,6 +8,7 @@ import polars as pl
 import os
 from config import DATABASE_CONFIG
 import fdb
+import query_catalog
 
 def analyze_real_csv():
     """Analiza el archivo CSV real del usuario"""
@@ -135,27 +136,14 @@ def test_propuestas_in_database(propuestas):
             charset=DATABASE_CONFIG["charset"]
         )
         
-        query = """
-        SELECT DISTINCT 
-            p.LEGAJO AS COD_PROPUESTA,
-            c.NOMBRE as Nombre_Cliente,
-            s.NOMBRE AS SUCURSAL
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        WHERE p.LEGAJO = ?
-        """
+        # Consulta del catálogo (query_catalog.py), preparada una vez para todos los LEGAJOs
+        fields = ["nombre_cliente", "sucursal"]
         
-        cur = con.cursor()
         matches_found = []
         
         for propuesta in propuestas:
             try:
-                cur.execute(query, (propuesta,))
-                result = cur.fetchone()
+                result = query_catalog.execute_lookup(con, [propuesta], fields).fetchone()
                 
                 if result:
                     matches_found.append({
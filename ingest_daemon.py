@@ -0,0 +1,494 @@
+"""
+Daemon de ingesta: procesa los templates CSV que se dejan en una carpeta de entrada
+- Vigila `inbox` con inotify (Linux) o, si no está disponible, revisando la carpeta cada
+  `poll_interval` segundos
+- Un archivo se toma recién cuando su tamaño y fecha no cambian durante `settle_seconds`
+  (así no se procesa un CSV que todavía se está copiando)
+- Los archivos listos pasan a `inbox/procesando` y a una cola acotada atendida por
+  `workers` threads; el resultado queda en `outbox` y el original en `inbox/procesados`
+  (o en `inbox/fallidos` junto con el error), con la fecha y hora agregadas al nombre
+- Cada archivo deja una línea JSON en `outbox/<metrics_file>` con su latencia y velocidad
+
+Uso:
+    python ingest_daemon.py [--inbox inbox] [--outbox outbox] [--workers 2] [--polling]
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import queue
+import select
+import shutil
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import CSV_CONFIG, FILL_MAPPING, INGEST_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Subcarpetas de la carpeta de entrada
+PROCESSING_DIR = "procesando"
+DONE_DIR = "procesados"
+FAILED_DIR = "fallidos"
+
+# Espera máxima entre reintentos del vigilante tras errores seguidos (segundos)
+MAX_BACKOFF = 30.0
+
+# Eventos de inotify (ver inotify(7))
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+# process(ruta) -> dict con success, processed_count, matched_count, errors y file_path del resultado
+Process = Callable[[str], Dict[str, Any]]
+
+
+def is_template(name: str) -> bool:
+    """CSV de entrada: ni temporales de editores/copias ni resultados de otra corrida"""
+    lower = name.lower()
+    return (
+        lower.endswith(".csv")
+        and not lower.endswith("_processed.csv")
+        and not name.startswith((".", "~$"))
+    )
+
+
+class _Inotify:
+    """inotify sobre una carpeta vía ctypes (solo Linux); `read` devuelve los nombres tocados"""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify no disponible")
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+        mask = _IN_CREATE | _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch falló en {directory}")
+
+    def read(self, timeout: float) -> Tuple[List[str], bool]:
+        """Nombres con eventos en `timeout` segundos, y si la cola del kernel se desbordó"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+
+        names, overflow, offset = [], False, 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+            elif name:
+                names.append(os.fsdecode(name))
+        return names, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class InboxWatcher:
+    """Detecta CSV nuevos en `inbox` y los entrega cuando dejan de cambiar
+
+    Con inotify solo se revisan los archivos con eventos (más una revisión completa al
+    empezar y si el kernel pierde eventos); sin inotify se lista la carpeta en cada vuelta.
+    """
+
+    def __init__(self, inbox: str, settle_seconds: float = 2.0, poll_interval: float = 1.0,
+                 use_inotify: bool = True):
+        self.inbox = inbox
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        # nombre -> (firma (tamaño, mtime), primera vez visto, último cambio)
+        self._pending: Dict[str, Tuple[Optional[Tuple[int, int]], float, float]] = {}
+        self._inotify: Optional[_Inotify] = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify(inbox)
+            except OSError as e:
+                logger.warning(f"inotify no disponible ({str(e)}); se revisa la carpeta cada {poll_interval}s")
+        self._scan()
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "polling"
+
+    def _scan(self):
+        for entry in os.scandir(self.inbox):
+            if entry.is_file():
+                self._touch(entry.name)
+
+    def _touch(self, name: str):
+        if is_template(name) and name not in self._pending:
+            now = time.time()
+            self._pending[name] = (None, now, now)
+
+    def _signature(self, name: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(os.path.join(self.inbox, name))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def poll(self) -> List[Tuple[str, float]]:
+        """Espera eventos (o una vuelta de polling) y devuelve [(nombre, primera vez visto)] estables"""
+        if self._inotify is not None:
+            # Con archivos pendientes hay que volver a mirarlos aunque no lleguen eventos
+            timeout = min(self.poll_interval, self.settle_seconds / 2) if self._pending else self.poll_interval
+            names, overflow = self._inotify.read(timeout)
+            if overflow:
+                logger.warning("Se perdieron eventos de inotify; revisando la carpeta completa")
+                self._scan()
+            for name in names:
+                self._touch(name)
+        else:
+            time.sleep(self.poll_interval)
+            self._scan()
+
+        now = time.time()
+        ready = []
+        for name, (previous, first_seen, changed_at) in list(self._pending.items()):
+            signature = self._signature(name)
+            if signature is None:
+                # Borrado o renombrado antes de estar listo
+                del self._pending[name]
+            elif signature != previous:
+                self._pending[name] = (signature, first_seen, now)
+            elif signature[0] > 0 and now - changed_at >= self.settle_seconds:
+                ready.append((name, first_seen))
+        return ready
+
+    def reopen(self):
+        """Vuelve a armar la vigilancia tras un error (la carpeta pudo desmontarse y volver)"""
+        use_inotify = self._inotify is not None
+        self.close()
+        if use_inotify:
+            try:
+                self._inotify = _Inotify(self.inbox)
+            except OSError as e:
+                logger.warning(f"inotify no disponible ({str(e)}); se revisa la carpeta cada {self.poll_interval}s")
+        self._scan()
+
+    def release(self, name: str):
+        """Deja de seguir `name` (ya se tomó para procesar)"""
+        self._pending.pop(name, None)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+
+class IngestDaemon:
+    """Toma los CSV estables de `inbox`, los procesa con `process` y deja los resultados en `outbox`
+
+    A lo sumo `workers` archivos se procesan a la vez y `max_queue` esperan turno; los demás
+    quedan en `inbox` hasta que haya lugar.
+    """
+
+    def __init__(self, inbox: str, outbox: str, process: Process, workers: int = 2, max_queue: int = 100,
+                 settle_seconds: float = 2.0, poll_interval: float = 1.0, use_inotify: bool = True,
+                 metrics_file: Optional[str] = "ingest_metrics.jsonl"):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.process = process
+        self.workers = workers
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.metrics_path = os.path.join(outbox, metrics_file) if metrics_file else None
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._totals = {"files_done": 0, "files_failed": 0, "rows": 0, "bytes": 0,
+                        "processing_seconds": 0.0, "latency_seconds": 0.0, "max_latency_seconds": 0.0}
+        self.started_at: Optional[float] = None
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.inbox, name)
+
+    def start(self):
+        for directory in (self.inbox, self.outbox, self._dir(PROCESSING_DIR), self._dir(DONE_DIR),
+                          self._dir(FAILED_DIR)):
+            os.makedirs(directory, exist_ok=True)
+        self.started_at = time.time()
+
+        # Archivos que quedaron a medio procesar en una corrida anterior (y sus resultados parciales)
+        for name in sorted(os.listdir(self._dir(PROCESSING_DIR))):
+            path = os.path.join(self._dir(PROCESSING_DIR), name)
+            if is_template(name):
+                os.replace(path, os.path.join(self.inbox, name))
+                logger.info(f"{name}: devuelto a la entrada (quedó sin terminar)")
+            elif name.lower().endswith("_processed.csv"):
+                os.remove(path)
+
+        watcher = InboxWatcher(self.inbox, self.settle_seconds, self.poll_interval, self.use_inotify)
+        logger.info(f"Vigilando {os.path.abspath(self.inbox)} ({watcher.mode}), {self.workers} workers")
+        self._threads.append(threading.Thread(target=self._watch, args=(watcher,), name="ingest-watch", daemon=True))
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker, name=f"ingest-worker-{i}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait: bool = True):
+        """Deja de tomar archivos; con `wait` espera a que terminen los que están en proceso"""
+        self._stop.set()
+        for _ in range(self.workers):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _watch(self, watcher: InboxWatcher):
+        delay = 0.0  # Espera tras un error; crece hasta MAX_BACKOFF mientras sigan los errores
+        try:
+            while not self._stop.is_set():
+                try:
+                    if delay:
+                        watcher.reopen()
+                    self._claim_ready(watcher)
+                    delay = 0.0
+                except Exception as e:
+                    # Un error pasajero (carpeta de red desmontada un momento) no debe frenar la ingesta
+                    delay = min(max(delay * 2, self.poll_interval), MAX_BACKOFF)
+                    logger.error(f"Error vigilando {self.inbox}: {str(e)}; reintento en {delay:.1f}s")
+                    self._stop.wait(delay)
+        finally:
+            watcher.close()
+
+    def _claim_ready(self, watcher: InboxWatcher):
+        """Pasa a `procesando` y a la cola los archivos que el vigilante da por listos"""
+        for name, first_seen in watcher.poll():
+            if self._queue.full():
+                # Sin lugar en la cola: sigue en la entrada y se reintenta en la próxima vuelta
+                break
+            ext = os.path.splitext(name)[1]
+            stem = self._unique_stem(name, ext)
+            # Extensión en minúsculas: el procesador arma la ruta del resultado reemplazando '.csv'
+            claimed = os.path.join(self._dir(PROCESSING_DIR), stem + ".csv")
+            try:
+                os.replace(os.path.join(self.inbox, name), claimed)
+            except PermissionError:
+                # En Windows un archivo abierto por quien lo copia no se puede mover
+                continue
+            except FileNotFoundError:
+                watcher.release(name)
+                continue
+            watcher.release(name)
+            self._queue.put({"name": name, "stem": stem, "ext": ext, "path": claimed,
+                             "first_seen": first_seen, "queued_at": time.time()})
+            logger.info(f"{name}: en cola ({self._queue.qsize()} esperando)")
+
+    def _paths(self, stem: str, ext: str) -> List[str]:
+        """Rutas que usa un archivo tomado con el nombre `stem`: en proceso, resultado y archivado"""
+        return [
+            os.path.join(self._dir(PROCESSING_DIR), stem + ".csv"),
+            os.path.join(self.outbox, f"{stem}_processed.csv"),
+            os.path.join(self._dir(DONE_DIR), stem + ext),
+            os.path.join(self._dir(FAILED_DIR), stem + ext),
+        ]
+
+    def _unique_stem(self, name: str, ext: str) -> str:
+        """Nombre del archivo con fecha y hora (y un número si hace falta) que no usa ningún otro
+
+        Un archivo con el mismo nombre dejado otro día, o mientras se procesa el anterior, no pisa
+        el resultado ni el original del anterior. Solo el thread vigilante asigna nombres.
+        """
+        base = os.path.splitext(name)[0]
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        stem, counter = f"{base}_{stamp}", 1
+        while any(os.path.exists(path) for path in self._paths(stem, ext)):
+            stem = f"{base}_{stamp}_{counter}"
+            counter += 1
+        return stem
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None or self._stop.is_set():
+                # Lo que sigue en `procesando` vuelve a la entrada al reiniciar
+                break
+            try:
+                self._run(item)
+            except Exception as e:
+                # Un error inesperado no debe dejar al daemon sin workers
+                logger.error(f"{item['name']}: error inesperado: {str(e)}")
+
+    def _run(self, item: Dict[str, Any]):
+        name = item["name"]
+        _, output_path, done_path, _ = self._paths(item["stem"], item["ext"])
+        size = 0
+        result: Dict[str, Any] = {}
+        started_at = finished_at = time.time()
+        try:
+            size = os.path.getsize(item["path"])
+            try:
+                result = self.process(item["path"])
+            except Exception as e:
+                logger.error(f"{name}: error procesando: {str(e)}")
+                result = {"success": False, "errors": [str(e)]}
+            finished_at = time.time()
+
+            if result.get("success") and result.get("file_path") and os.path.exists(result["file_path"]):
+                shutil.move(result["file_path"], output_path)
+                shutil.move(item["path"], done_path)
+            else:
+                output_path = None
+                self._fail(item, result.get("errors") or ["Sin archivo de resultado"])
+        except Exception as e:
+            # Archivo borrado, sin permisos o que no se pudo mover: a `fallidos` y se sigue
+            logger.error(f"{name}: {str(e)}")
+            output_path = None
+            result = {**result, "errors": [*(result.get("errors") or []), str(e)]}
+            self._fail(item, result["errors"])
+
+        processing = finished_at - started_at
+        rows = result.get("processed_count", 0) or 0
+        record = {
+            "file": name,
+            "success": output_path is not None,
+            "detected_at": datetime.fromtimestamp(item["first_seen"]).isoformat(timespec="seconds"),
+            "size_bytes": size,
+            "rows": rows,
+            "matched": result.get("matched_count", 0) or 0,
+            "settle_seconds": round(item["queued_at"] - item["first_seen"], 3),
+            "queue_seconds": round(started_at - item["queued_at"], 3),
+            "processing_seconds": round(processing, 3),
+            # Desde que apareció en la entrada hasta que el resultado quedó en la salida
+            "latency_seconds": round(time.time() - item["first_seen"], 3),
+            "rows_per_second": round(rows / processing, 1) if processing else None,
+            "mb_per_second": round(size / (1024 * 1024) / processing, 3) if processing else None,
+            "output": output_path,
+            "errors": (result.get("errors") or [])[:5],
+        }
+        self._record(record)
+
+    def _fail(self, item: Dict[str, Any], errors: List[str]):
+        """Mueve el archivo a `fallidos` junto con sus errores (si no se puede, queda donde está)"""
+        failed = self._paths(item["stem"], item["ext"])[3]
+        try:
+            if os.path.exists(item["path"]):
+                shutil.move(item["path"], failed)
+            with open(failed + ".error.txt", "w", encoding="utf-8") as f:
+                f.write("\n".join(errors) + "\n")
+        except OSError as e:
+            logger.error(f"{item['name']}: no se pudo mover a {FAILED_DIR}: {str(e)}")
+
+    def _record(self, record: Dict[str, Any]):
+        with self._lock:
+            totals = self._totals
+            totals["files_done" if record["success"] else "files_failed"] += 1
+            totals["rows"] += record["rows"]
+            totals["bytes"] += record["size_bytes"]
+            totals["processing_seconds"] += record["processing_seconds"]
+            totals["latency_seconds"] += record["latency_seconds"]
+            totals["max_latency_seconds"] = max(totals["max_latency_seconds"], record["latency_seconds"])
+            if self.metrics_path:
+                with open(self.metrics_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        status = "OK" if record["success"] else "FALLÓ"
+        logger.info(f"{record['file']}: {status}, {record['rows']:,} filas en {record['processing_seconds']:.2f}s "
+                    f"({record['rows_per_second'] or 0:,.0f} filas/s), latencia {record['latency_seconds']:.2f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Totales desde el arranque: archivos, filas, velocidad y latencia promedio"""
+        with self._lock:
+            totals = dict(self._totals)
+        files = totals["files_done"] + totals["files_failed"]
+        uptime = time.time() - self.started_at if self.started_at else 0.0
+        return {
+            **totals,
+            "queued": self._queue.qsize(),
+            "uptime_seconds": round(uptime, 1),
+            "files_per_minute": round(files * 60 / uptime, 2) if uptime else 0.0,
+            "rows_per_second": round(totals["rows"] / totals["processing_seconds"], 1) if totals["processing_seconds"] else 0.0,
+            "avg_latency_seconds": round(totals["latency_seconds"] / files, 3) if files else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procesa los templates CSV que se dejan en una carpeta")
+    parser.add_argument("--inbox", default=INGEST_CONFIG["inbox"])
+    parser.add_argument("--outbox", default=INGEST_CONFIG["outbox"])
+    parser.add_argument("--workers", type=int, default=INGEST_CONFIG["workers"])
+    parser.add_argument("--settle", type=float, default=INGEST_CONFIG["settle_seconds"],
+                        help="Segundos sin cambios antes de tomar un archivo")
+    parser.add_argument("--polling", action="store_true", help="Revisar la carpeta periódicamente en lugar de inotify")
+    parser.add_argument("--mapping", help="Mapeo encabezado -> campo en JSON (por defecto FILL_MAPPING)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # Import diferido: el vigilante y las métricas no necesitan fdb ni FastAPI
+    import field_mapping
+    from config import DATABASE_CONFIG
+    from main import CSVProcessor, CSVProcessRequest, DatabaseConfig, FirebirdManager
+
+    try:
+        mapping = field_mapping.validate_mapping(json.loads(args.mapping) if args.mapping else FILL_MAPPING)
+    except ValueError as e:
+        print(f"[ERROR] Mapeo inválido: {str(e)}")
+        sys.exit(1)
+    request = CSVProcessRequest(
+        target_column=CSV_CONFIG["target_column"],
+        data_start_row=CSV_CONFIG["data_start_row"],
+        propuesta_column=CSV_CONFIG["propuesta_column"],
+        field_mapping=mapping
+    )
+    manager = FirebirdManager(DatabaseConfig(**DATABASE_CONFIG))
+
+    def process(path: str) -> Dict[str, Any]:
+        return CSVProcessor(manager).process_csv_file(path, request).model_dump()
+
+    daemon = IngestDaemon(
+        args.inbox, args.outbox, process,
+        workers=args.workers,
+        max_queue=INGEST_CONFIG["max_queue"],
+        settle_seconds=args.settle,
+        poll_interval=INGEST_CONFIG["poll_interval"],
+        use_inotify=INGEST_CONFIG["use_inotify"] and not args.polling,
+        metrics_file=INGEST_CONFIG["metrics_file"]
+    )
+    daemon.start()
+    print(f"[INICIO] Dejar templates CSV en {os.path.abspath(args.inbox)} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(INGEST_CONFIG["stats_interval"])
+            stats = daemon.stats()
+            print(f"[STATS] {stats['files_done']} procesados, {stats['files_failed']} fallidos, "
+                  f"{stats['queued']} en cola, {stats['rows_per_second']:,.0f} filas/s, "
+                  f"latencia promedio {stats['avg_latency_seconds']:.2f}s")
+    except KeyboardInterrupt:
+        print("\n[STOP] Terminando los archivos en proceso...")
+        daemon.stop()
+    finally:
+        manager.pool.close()
+
+
+if __name__ == "__main__":
+    main()
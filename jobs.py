@@ -0,0 +1,251 @@
+"""
+Trabajos asíncronos de procesamiento de CSV
+El API devuelve un id al instante; una cola con workers propios procesa los archivos
+y el cliente consulta el progreso hasta descargar el resultado
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fases de un trabajo
+QUEUED = "en_cola"
+RUNNING = "procesando"
+DONE = "terminado"
+FAILED = "fallido"
+CANCELLED = "cancelado"
+FINISHED_PHASES = (DONE, FAILED, CANCELLED)
+
+STOP_POLL = 1.0  # Segundos que un worker espera en la cola antes de revisar si hay que detenerse
+
+
+class QueueFullError(Exception):
+    """La cola de trabajos alcanzó su capacidad máxima"""
+
+
+class JobCancelled(Exception):
+    """El trabajo fue cancelado mientras se procesaba"""
+
+
+class Job:
+    """Estado de un trabajo; lo actualiza el worker y lo lee el API"""
+
+    def __init__(self, input_path: str, params: Dict[str, Any], filename: str = None):
+        self.id = uuid.uuid4().hex
+        self.input_path = input_path
+        self.params = params
+        self.filename = filename
+        self.phase = QUEUED
+        self.step = None  # Etapa interna del procesamiento (leyendo, consultando, ...)
+        self.rows_done = 0
+        self.rows_total = None
+        self.batches_done = 0
+        self.batches_total = None
+        self.fraction = 0.0
+        self.result: Optional[Dict[str, Any]] = None
+        self.output_path: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def update(self, **fields):
+        """Callback de progreso del procesador; corta el trabajo si fue cancelado"""
+        if self._cancel.is_set():
+            raise JobCancelled(f"Trabajo {self.id} cancelado")
+        with self._lock:
+            for name, value in fields.items():
+                if name == "phase":
+                    self.step = value
+                elif value is not None:
+                    setattr(self, name, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado actual con ETA estimada a partir de la fracción completada"""
+        with self._lock:
+            now = self.finished_at or time.time()
+            elapsed = now - self.started_at if self.started_at else 0.0
+            eta = None
+            if self.phase == RUNNING and 0 < self.fraction < 1:
+                eta = round(elapsed * (1 - self.fraction) / self.fraction, 1)
+
+            return {
+                "job_id": self.id,
+                "filename": self.filename,
+                "phase": self.phase,
+                "step": self.step,
+                "rows_done": self.rows_done,
+                "rows_total": self.rows_total,
+                "batches_done": self.batches_done,
+                "batches_total": self.batches_total,
+                "progress": round(self.fraction, 4),
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": eta,
+                "error": self.error,
+                "result": self.result
+            }
+
+
+class JobManager:
+    """Cola acotada de trabajos con un número fijo de workers
+
+    `run_job(job)` hace el procesamiento: debe reportar con `job.update(...)` y devolver
+    el resultado como dict (con `file_path` del CSV generado). Los trabajos terminados se
+    olvidan tras `retention_seconds`.
+    """
+
+    def __init__(self, run_job: Callable[[Job], Dict[str, Any]], workers: int = 2,
+                 max_queue: int = 20, retention_seconds: float = 3600):
+        self.run_job = run_job
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Cola de trabajos iniciada: {self.workers} workers, capacidad {self._queue.maxsize}")
+
+    def submit(self, input_path: str, params: Dict[str, Any], filename: str = None) -> Job:
+        """Encola un trabajo; lanza QueueFullError si no hay lugar o la cola se está deteniendo"""
+        if self._stop.is_set():
+            raise QueueFullError("La cola de trabajos se está deteniendo")
+        self.prune()
+        job = Job(input_path, params, filename)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFullError(f"Cola de trabajos llena ({self._queue.maxsize} pendientes)")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Marca el trabajo como cancelado; si está en cola no llega a ejecutarse"""
+        job = self.get(job_id)
+        if job is not None and job.phase not in FINISHED_PHASES:
+            job._cancel.set()
+            with job._lock:
+                if job.phase == QUEUED:
+                    job.phase = CANCELLED
+                    job.finished_at = time.time()
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            phases = [job.phase for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": phases.count(QUEUED),
+            "running": phases.count(RUNNING),
+            "max_queue": self._queue.maxsize
+        }
+
+    def prune(self):
+        """Olvida los trabajos terminados hace más de `retention_seconds`
+
+        Los CSV generados no se borran aquí: quedan en el almacén de resultados, que tiene
+        su propia retención (ver output_store.py).
+        """
+        limit = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished_at is not None and job.finished_at < limit]
+            for job in expired:
+                del self._jobs[job.id]
+
+    def shutdown(self):
+        """Cancela los trabajos pendientes y detiene los workers sin bloquearse
+
+        Si la cola está llena no entran todos los avisos de fin: los workers vacían la cola
+        (los trabajos ya están cancelados, solo se borra su archivo) y salen al encontrarla vacía.
+        """
+        self._stop.set()
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            self.cancel(job.id)
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+    def _worker(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=STOP_POLL)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if job is None:
+                return
+            try:
+                self._run(job)
+            finally:
+                self._remove_file(job.input_path)
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        with job._lock:
+            if job.cancelled:
+                return
+            job.phase = RUNNING
+            job.started_at = time.time()
+
+        logger.info(f"Trabajo {job.id} iniciado ({job.filename})")
+        try:
+            result = self.run_job(job)
+            error = None
+        except Exception as e:
+            result = None
+            error = str(e)
+
+        with job._lock:
+            job.finished_at = time.time()
+            job.result = result
+            if job.cancelled:
+                job.phase = CANCELLED
+                self._remove_file((result or {}).get("file_path"))
+            elif error is not None or not (result or {}).get("success"):
+                job.phase = FAILED
+                job.error = error or "; ".join((result or {}).get("errors") or [])
+            else:
+                job.phase = DONE
+                job.fraction = 1.0
+                job.output_path = result.get("file_path")
+
+        logger.info(f"Trabajo {job.id} {job.phase} en {job.finished_at - job.started_at:.1f}s")
+
+    @staticmethod
+    def _remove_file(path: Optional[str]):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"No se pudo borrar {path}: {str(e)}")
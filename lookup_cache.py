@@ -0,0 +1,277 @@
+"""
+Cachés de resultados por LEGAJO
+- LegajoLookupCache: persistente en SQLite, para los lotes de los templates
+- CoalescingLRUCache: en memoria, para consultas individuales del API
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import CACHE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# SQLite antiguos limitan a 999 parámetros por sentencia
+_MAX_SQL_PARAMS = 500
+
+# Al superar max_entries se desaloja hasta esta fracción, así el conteo completo de la tabla
+# no se repite en cada lote que se guarda con la caché llena
+_EVICT_TO = 0.9
+
+
+class LegajoLookupCache:
+    """Caché por (namespace, LEGAJO) con TTL por entrada y desalojo LRU por tamaño
+
+    El namespace separa resultados de bases o consultas distintas (cada una guarda filas
+    con campos diferentes).
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float = 86400, max_entries: int = 500000):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "legajo_cache.sqlite3")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS lookup (
+                namespace TEXT NOT NULL,
+                legajo TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, legajo)
+            )
+        """)
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_lookup_last_access ON lookup (last_access)")
+        # Cota superior de las entradas: cada put suma sus filas (aunque reemplacen otras) y
+        # solo al pasar max_entries se cuenta la tabla de verdad (ver _evict_locked)
+        self._estimated_entries = self._con.execute("SELECT COUNT(*) FROM lookup").fetchone()[0]
+
+    def get_many(self, namespace: str, legajos: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Devuelve las entradas vigentes para `legajos` (solo los aciertos)"""
+        now = time.time()
+        hits = {}
+
+        with self._lock:
+            for i in range(0, len(legajos), _MAX_SQL_PARAMS):
+                chunk = legajos[i:i + _MAX_SQL_PARAMS]
+                placeholders = ','.join(['?' for _ in chunk])
+                rows = self._con.execute(
+                    f"SELECT legajo, payload FROM lookup "
+                    f"WHERE namespace = ? AND expires_at > ? AND legajo IN ({placeholders})",
+                    [namespace, now, *chunk]
+                ).fetchall()
+
+                for legajo, payload in rows:
+                    hits[legajo] = json.loads(payload)
+
+                if rows:
+                    # Marcar el acceso para el desalojo LRU
+                    found = [legajo for legajo, _ in rows]
+                    self._con.execute(
+                        f"UPDATE lookup SET last_access = ? "
+                        f"WHERE namespace = ? AND legajo IN ({','.join(['?' for _ in found])})",
+                        [now, namespace, *found]
+                    )
+
+        return hits
+
+    def put_many(self, namespace: str, entries: Dict[str, Dict[str, Any]], ttl_seconds: Optional[float] = None):
+        """Guarda o reemplaza entradas; `ttl_seconds` permite un TTL distinto al por defecto"""
+        if not entries:
+            return
+
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        rows = [
+            (namespace, legajo, json.dumps(payload, default=str), expires_at, now)
+            for legajo, payload in entries.items()
+        ]
+
+        with self._lock:
+            self._con.execute("BEGIN")
+            try:
+                self._con.executemany("INSERT OR REPLACE INTO lookup VALUES (?, ?, ?, ?, ?)", rows)
+                self._con.execute("COMMIT")
+            except Exception:
+                self._con.execute("ROLLBACK")
+                raise
+            self._estimated_entries += len(rows)
+            if self._estimated_entries > self.max_entries:
+                self._evict_locked()
+
+    def invalidate(self, legajos: Optional[List[str]] = None, namespace: Optional[str] = None) -> int:
+        """Borra las entradas de `legajos` (o todas si es None); devuelve cuántas se borraron"""
+        conditions = []
+        params = []
+        if namespace is not None:
+            conditions.append("namespace = ?")
+            params.append(namespace)
+
+        with self._lock:
+            if legajos is None:
+                where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+                deleted = self._con.execute(f"DELETE FROM lookup{where}", params).rowcount
+                self._estimated_entries -= deleted
+                return deleted
+
+            deleted = 0
+            for i in range(0, len(legajos), _MAX_SQL_PARAMS):
+                chunk = legajos[i:i + _MAX_SQL_PARAMS]
+                chunk_conditions = conditions + [f"legajo IN ({','.join(['?' for _ in chunk])})"]
+                deleted += self._con.execute(
+                    f"DELETE FROM lookup WHERE {' AND '.join(chunk_conditions)}", params + chunk
+                ).rowcount
+            self._estimated_entries -= deleted
+            return deleted
+
+    def purge_expired(self) -> int:
+        """Borra las entradas vencidas"""
+        with self._lock:
+            deleted = self._con.execute("DELETE FROM lookup WHERE expires_at <= ?", (time.time(),)).rowcount
+            self._estimated_entries -= deleted
+            return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._estimated_entries = self._con.execute("SELECT COUNT(*) FROM lookup").fetchone()[0]
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+    def _evict_locked(self):
+        """Si se superó `max_entries`, desaloja las menos usadas recientemente hasta `_EVICT_TO`"""
+        entries = self._con.execute("SELECT COUNT(*) FROM lookup").fetchone()[0]
+        if entries > self.max_entries:
+            excess = entries - int(self.max_entries * _EVICT_TO)
+            entries -= self._con.execute(
+                "DELETE FROM lookup WHERE rowid IN "
+                "(SELECT rowid FROM lookup ORDER BY last_access LIMIT ?)",
+                (excess,)
+            ).rowcount
+            logger.info(f"Caché de LEGAJOs: {excess} entradas desalojadas (LRU)")
+        self._estimated_entries = entries
+
+
+class CoalescingLRUCache:
+    """Caché LRU con TTL en memoria para el event loop de asyncio
+
+    Las peticiones concurrentes por la misma clave comparten una sola carga
+    (request coalescing). Los resultados None no se guardan. Si la petición que hace la
+    carga se cancela, las que esperaban la repiten.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 60):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # clave -> (vence, valor)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        # Ya hay una carga en curso para esta clave: esperar su resultado
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # Si se canceló la carga de la otra petición (y no esta), cargar de nuevo
+                if not in_flight.cancelled():
+                    raise
+            self.coalesced -= 1  # Se vuelve a contar al reintentar
+            return await self.get_or_load(key, loader)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Marcar como leída si nadie más la esperaba
+            raise
+        except BaseException:
+            # Cancelada (cliente desconectado, timeout): los que esperaban no deben quedar colgados
+            future.cancel()
+            raise
+        finally:
+            del self._in_flight[key]
+
+        if value is not None:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        future.set_result(value)
+        return value
+
+    def invalidate(self, keys: Optional[List[str]] = None) -> int:
+        """Borra las claves indicadas (o todas); devuelve cuántas se borraron"""
+        if keys is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+        return sum(1 for key in keys if self._entries.pop(key, None) is not None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            # Las peticiones unidas a una carga en curso no van a la BD: cuentan como acierto
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0
+        }
+
+
+_cache: Optional[LegajoLookupCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_lookup_cache() -> Optional[LegajoLookupCache]:
+    """Caché compartida del proceso según CACHE_CONFIG (None si está deshabilitada)"""
+    global _cache
+    if not CACHE_CONFIG["enabled"]:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = LegajoLookupCache(
+                CACHE_CONFIG["directory"],
+                ttl_seconds=CACHE_CONFIG["ttl_seconds"],
+                max_entries=CACHE_CONFIG["max_entries"]
+            )
+        return _cache
@@ -4,19 +4,44 @@ Maneja el match entre PROPUESTA JKM y LEGAJO para llenar campos automáticamente
 Optimizado con Polars para máximo rendimiento
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Tuple
 import fdb
 import polars as pl
 import os
 import logging
+import time
 from datetime import datetime
 import asyncio
 from contextlib import asynccontextmanager
 import tempfile
 import uuid
+import io
+import csv
+import json
+from config import CSV_CONFIG, POOL_CONFIG, FETCH_CONFIG, CACHE_CONFIG, SERVICE_CONFIG, JOBS_CONFIG, UPLOAD_CONFIG, MULTI_FILE_CONFIG, OUTPUT_CONFIG, SNAPSHOT_CONFIG
+from lookup_cache import get_lookup_cache, CoalescingLRUCache
+import threading
+import functools
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from connection_pool import FirebirdConnectionPool
+import fill_engine
+import field_mapping
+from field_mapping import PropuestaRecord
+import multi_template
+import metrics
+from monitor import current_process, process_usage
+import temp_lookup
+import query_catalog
+from batch_fetcher import ParallelBatchFetcher
+from snapshot import get_snapshot_store, SnapshotBusyError
+from batch_controller import lookup_controller, controller_stats
+from jobs import Job, JobManager, QueueFullError, DONE
+from output_store import get_output_store, iter_file, COMPRESSIONS
+from upload_stream import save_csv_upload, save_csv_uploads, SavedUpload, UploadTooLargeError, UploadFormatError
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
@@ -44,27 +69,79 @@ class PropuestaData(BaseModel):
     direccion: Optional[str] = Field(None, description="Dirección")
     asesor: Optional[str] = Field(None, description="Asesor de ventas")
 
+def to_propuesta_data(record: PropuestaRecord) -> PropuestaData:
+    """Convierte un registro del procesamiento por lotes al modelo validado del API"""
+    return PropuestaData(**record.as_dict())
+
 class ProcessResult(BaseModel):
     success: bool
-    processed_count: int
+    processed_count: int  # Filas con LEGAJO (incluye repetidos)
     matched_count: int
     errors: List[str] = []
     file_path: Optional[str] = None
     execution_time: float
+    chunks_processed: Optional[int] = None
+    input_sha256: Optional[str] = None  # Hash del CSV subido
+    output_id: Optional[str] = None  # Id del resultado en el almacén de descargas
+    download_url: Optional[str] = None
+    unique_count: Optional[int] = None  # LEGAJOs distintos consultados a la BD
+    cache_hits: Optional[int] = None  # LEGAJOs resueltos desde la caché persistente
+    cache_misses: Optional[int] = None  # LEGAJOs que hubo que consultar a Firebird
+
+class FileProcessSummary(BaseModel):
+    file: str  # Nombre original del CSV
+    success: bool
+    processed_count: int = 0
+    matched_count: int = 0
+    unique_count: Optional[int] = None  # LEGAJOs distintos del archivo
+    unmatched_count: int = 0
+    unmatched: List[str] = []  # Muestra de LEGAJOs sin datos en BD
+    filled: Dict[str, int] = {}  # Celdas llenadas por campo
+    errors: List[str] = []
+    file_path: Optional[str] = None
+    fill_time: Optional[float] = None
+    output_id: Optional[str] = None
+    download_url: Optional[str] = None
+
+class BatchProcessResult(BaseModel):
+    success: bool  # Todos los archivos se procesaron
+    files: List[FileProcessSummary]
+    processed_count: int
+    matched_count: int
+    unique_count: int  # LEGAJOs distintos de todos los archivos, consultados una sola vez
+    shared_count: int  # LEGAJOs repetidos entre archivos que no se volvieron a consultar
+    errors: List[str] = []
+    scan_time: float
+    lookup_time: float
+    fill_time: float
+    execution_time: float
+    cache_hits: Optional[int] = None
+    cache_misses: Optional[int] = None
+
+class CacheInvalidateRequest(BaseModel):
+    legajos: Optional[List[str]] = Field(None, description="LEGAJOs a invalidar (todos si se omite)")
 
 class CSVProcessRequest(BaseModel):
     target_column: str = Field(default="CLIENTE", description="Columna objetivo a llenar")
     data_start_row: int = Field(default=11, description="Fila donde empiezan los datos")
     propuesta_column: str = Field(default="B", description="Columna de PROPUESTA JKM")
+    field_mapping: Optional[Dict[str, str]] = Field(
+        None, description="Encabezado del template -> campo de BD; por defecto target_column -> nombre_cliente"
+    )
 
 # Clase para manejo de la base de datos
 class FirebirdManager:
     def __init__(self, config: DatabaseConfig):
         self.config = config
         self.connection_string = f"{config.host}:{config.database_path}"
+        # Las consultas toman conexiones de este pool en lugar de abrir una nueva cada vez
+        self.pool = FirebirdConnectionPool(self.get_connection, **POOL_CONFIG)
+        # Caché persistente de resultados; separada por base de datos y conjunto de campos
+        self.lookup_cache = get_lookup_cache()
+        self._stats_lock = threading.Lock()
         
     def get_connection(self):
-        """Obtiene una conexión a la base de datos Firebird"""
+        """Abre una conexión nueva a la base de datos Firebird (usada por el pool)"""
         try:
             con = fdb.connect(
                 host=self.config.host,
@@ -79,136 +156,178 @@ class FirebirdManager:
             raise HTTPException(status_code=500, detail=f"Error de conexión a BD: {str(e)}")
 
     def get_propuesta_data(self, legajo: str) -> Optional[PropuestaData]:
-        """Obtiene los datos de una propuesta específica por LEGAJO"""
-        query = """
-        SELECT DISTINCT 
-            p.LEGAJO AS COD_PROPUESTA,
-            c.NOMBRE as Nombre_Cliente,
-            cc.COD_CLIENTE, 
-            s.NOMBRE AS SUCURSAL, 
-            CR.MONTO,
-            ct.FECHA as FECHA_CONTRATO, 
-            ec.ESTADO as ESTADO,
-            TC.NOMBRE AS TIPO_CONTRATO,
-            c.TELEFONO,
-            c.TELEFONO_MOVIL,
-            DOM.DIRECCION,
-            vg.NOMBRE as asesor
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        INNER JOIN ESTADOS_CONTRATOS ec ON ct.COD_ESTADO_CONTRATO = ec.COD_ESTADO_CONTRATO
-        INNER JOIN TIPOS_CONTRATOS TC ON CT.COD_TIPO_CONTRATO=TC.COD_TIPO_CONTRATO
-        INNER JOIN vendedor vg ON ct.COD_VENDEDOR=vg.COD_VENDEDOR
-        LEFT JOIN MEDIOS_COBROS_DOMICILIOS mcd ON mcd.COD_MEDIO_COBRO IN (
-            SELECT COD_MEDIO_COBRO FROM MEDIOS_COBROS WHERE COD_CLIENTE = c.COD_CLIENTE
-        )
-        LEFT JOIN DOMICILIOS DOM ON dom.COD_DOMICILIO = mcd.COD_DOMICILIO
-        WHERE p.LEGAJO = ?
-        """
-        
+        """Obtiene los datos de una propuesta específica por LEGAJO (sin caché persistente)"""
         try:
-            with self.get_connection() as con:
-                cur = con.cursor()
-                cur.execute(query, (legajo,))
-                row = cur.fetchone()
-                
-                if row:
-                    return PropuestaData(
-                        cod_propuesta=str(row[0]) if row[0] else "",
-                        nombre_cliente=str(row[1]) if row[1] else "",
-                        cod_cliente=str(row[2]) if row[2] else "",
-                        sucursal=str(row[3]) if row[3] else "",
-                        monto=float(row[4]) if row[4] else 0.0,
-                        fecha_contrato=str(row[5]) if row[5] else "",
-                        estado=str(row[6]) if row[6] else "",
-                        tipo_contrato=str(row[7]) if row[7] else "",
-                        telefono=str(row[8]) if row[8] else "",
-                        telefono_movil=str(row[9]) if row[9] else "",
-                        direccion=str(row[10]) if row[10] else "",
-                        asesor=str(row[11]) if row[11] else ""
-                    )
-                return None
+            with self.pool.connection() as con:
+                records = self._fetch_records(con, [legajo], field_mapping.PROPUESTA_FIELDS)
+            record = records.get(str(legajo))
+            return self._to_propuesta(str(legajo), record) if record else None
                 
         except Exception as e:
             logger.error(f"Error ejecutando consulta para LEGAJO {legajo}: {str(e)}")
             return None
 
-    def get_multiple_propuestas(self, legajos: List[str]) -> Dict[str, PropuestaData]:
-        """Obtiene datos de múltiples propuestas de manera eficiente"""
+    def get_multiple_propuestas(self, legajos: List[str], raise_errors: bool = False,
+                                cache_stats: Optional[Dict[str, int]] = None) -> Dict[str, PropuestaRecord]:
+        """Obtiene datos de múltiples propuestas de manera eficiente
+        
+        Primero se consulta la caché persistente y solo los LEGAJOs faltantes van a Firebird.
+        Con `raise_errors` los errores de BD se propagan (para que el llamador pueda reintentar).
+        `cache_stats` acumula {"hits", "misses"} (puede compartirse entre threads).
+        Devuelve registros compactos; `to_propuesta_data` los convierte al modelo del API.
+        """
+        records = self.get_field_values(legajos, field_mapping.PROPUESTA_FIELDS, raise_errors, cache_stats)
+        return {legajo: PropuestaRecord.from_record(legajo, record) for legajo, record in records.items()}
+
+    def get_field_values(self, legajos: List[str], fields: List[str], raise_errors: bool = False,
+                         cache_stats: Optional[Dict[str, int]] = None) -> Dict[str, Dict[str, Any]]:
+        """Obtiene solo los campos `fields` (ver field_mapping.FIELDS) de varios LEGAJOs
+        
+        La consulta incluye únicamente los joins que esos campos necesitan. Con
+        `FETCH_CONFIG["lookup_mode"] == "temp_table"` los LEGAJOs se cargan en una tabla temporal
+        y se consultan con un solo join (ver temp_lookup.py). La caché persistente se separa por
+        conjunto de campos. Mismos `raise_errors`/`cache_stats` que `get_multiple_propuestas`.
+        """
         if not legajos:
             return {}
-            
-        # Crear placeholders para la consulta IN
-        placeholders = ','.join(['?' for _ in legajos])
-        
-        query = f"""
-        SELECT DISTINCT 
-            p.LEGAJO AS COD_PROPUESTA,
-            c.NOMBRE as Nombre_Cliente,
-            cc.COD_CLIENTE, 
-            s.NOMBRE AS SUCURSAL, 
-            CR.MONTO,
-            ct.FECHA as FECHA_CONTRATO, 
-            ec.ESTADO as ESTADO,
-            TC.NOMBRE AS TIPO_CONTRATO,
-            c.TELEFONO,
-            c.TELEFONO_MOVIL,
-            DOM.DIRECCION,
-            vg.NOMBRE as asesor
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        INNER JOIN ESTADOS_CONTRATOS ec ON ct.COD_ESTADO_CONTRATO = ec.COD_ESTADO_CONTRATO
-        INNER JOIN TIPOS_CONTRATOS TC ON CT.COD_TIPO_CONTRATO=TC.COD_TIPO_CONTRATO
-        INNER JOIN vendedor vg ON ct.COD_VENDEDOR=vg.COD_VENDEDOR
-        LEFT JOIN MEDIOS_COBROS_DOMICILIOS mcd ON mcd.COD_MEDIO_COBRO IN (
-            SELECT COD_MEDIO_COBRO FROM MEDIOS_COBROS WHERE COD_CLIENTE = c.COD_CLIENTE
-        )
-        LEFT JOIN DOMICILIOS DOM ON dom.COD_DOMICILIO = mcd.COD_DOMICILIO
-        WHERE p.LEGAJO IN ({placeholders})
-        ORDER BY p.LEGAJO
-        """
+        
+        namespace = self._cache_namespace(fields)
+        cached = self._cached_values(namespace, legajos, cache_stats)
+        legajos = [legajo for legajo in legajos if legajo not in cached]
+        if not legajos:
+            return cached
         
         result = {}
         try:
-            with self.get_connection() as con:
-                cur = con.cursor()
-                cur.execute(query, legajos)
-                rows = cur.fetchall()
+            with self.pool.connection() as con:
+                result = self._fetch_records(con, legajos, fields)
                 
-                for row in rows:
-                    legajo = str(row[0])
-                    result[legajo] = PropuestaData(
-                        cod_propuesta=legajo,
-                        nombre_cliente=str(row[1]) if row[1] else "",
-                        cod_cliente=str(row[2]) if row[2] else "",
-                        sucursal=str(row[3]) if row[3] else "",
-                        monto=float(row[4]) if row[4] else 0.0,
-                        fecha_contrato=str(row[5]) if row[5] else "",
-                        estado=str(row[6]) if row[6] else "",
-                        tipo_contrato=str(row[7]) if row[7] else "",
-                        telefono=str(row[8]) if row[8] else "",
-                        telefono_movil=str(row[9]) if row[9] else "",
-                        direccion=str(row[10]) if row[10] else "",
-                        asesor=str(row[11]) if row[11] else ""
-                    )
-                    
         except Exception as e:
-            logger.error(f"Error ejecutando consulta múltiple: {str(e)}")
-            
+            logger.error(f"Error consultando campos {', '.join(fields)}: {str(e)}")
+            if raise_errors:
+                raise
+        
+        if self.lookup_cache is not None and result:
+            self.lookup_cache.put_many(namespace, result)
+        
+        result.update(cached)
         return result
 
+    def get_field_frame(self, legajos: List[str], fields: List[str], raise_errors: bool = False,
+                        cache_stats: Optional[Dict[str, int]] = None) -> pl.DataFrame:
+        """Como `get_field_values`, pero devuelve el DataFrame de resultados del llenado masivo
+        
+        Las filas de Firebird se leen con fetchmany y pasan directo a columnas de Polars (ver
+        `query_catalog.read_frame`), sin dicts ni modelos por LEGAJO. Solo los LEGAJOs nuevos
+        se convierten a dicts para guardarlos en la caché persistente.
+        """
+        cached, legajos = self.cached_field_frame(legajos, fields, cache_stats)
+        frames = [cached]
+        if not legajos:
+            return cached
+        
+        try:
+            frames.append(self.fetch_field_frame(legajos, fields))
+        except Exception as e:
+            logger.error(f"Error consultando campos {', '.join(fields)}: {str(e)}")
+            if raise_errors:
+                raise
+        
+        return fill_engine.concat_results(frames, fields)
+
+    def cached_field_frame(self, legajos: List[str], fields: List[str],
+                           cache_stats: Optional[Dict[str, int]] = None) -> Tuple[pl.DataFrame, List[str]]:
+        """Aciertos de la caché persistente como DataFrame de resultados y los LEGAJOs que faltan"""
+        cached = self._cached_values(self._cache_namespace(fields), legajos, cache_stats)
+        missing = [legajo for legajo in legajos if legajo not in cached]
+        return fill_engine.results_to_frame(cached, fields), missing
+
+    def fetch_field_frame(self, legajos: List[str], fields: List[str]) -> pl.DataFrame:
+        """Consulta `legajos` a la BD sin mirar la caché y guarda lo obtenido en ella; propaga los errores"""
+        with self.pool.connection() as con:
+            fetched = self._fetch_frame(con, legajos, fields)
+        if self.lookup_cache is not None and fetched.height:
+            self.lookup_cache.put_many(self._cache_namespace(fields), fill_engine.frame_to_results(fetched, fields))
+        return fetched
+
+    def _cache_namespace(self, fields: List[str]) -> str:
+        namespace = f"{self.connection_string}|campos:{','.join(sorted(fields))}"
+        if FETCH_CONFIG["titular_priority"]:
+            namespace += "|titular"
+        return namespace
+
+    def _cached_values(self, namespace: str, legajos: List[str],
+                       cache_stats: Optional[Dict[str, int]]) -> Dict[str, Dict[str, Any]]:
+        """Aciertos de la caché persistente para `legajos` (vacío si no hay caché)"""
+        if self.lookup_cache is None or not legajos:
+            return {}
+        cached = self.lookup_cache.get_many(namespace, legajos)
+        metrics.LOOKUP_CACHE_REQUESTS.inc(len(cached), result="hit")
+        metrics.LOOKUP_CACHE_REQUESTS.inc(len(legajos) - len(cached), result="miss")
+        if cache_stats is not None:
+            with self._stats_lock:
+                cache_stats["hits"] = cache_stats.get("hits", 0) + len(cached)
+                cache_stats["misses"] = cache_stats.get("misses", 0) + len(legajos) - len(cached)
+        return cached
+
+    def _fetch_records(self, con, legajos: List[str], fields: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Una consulta (joins simples, sin subconsultas correlacionadas) con un registro por LEGAJO"""
+        titular_priority = FETCH_CONFIG["titular_priority"]
+        if FETCH_CONFIG["lookup_mode"] == "temp_table":
+            return temp_lookup.fetch_records(con, legajos, fields, titular_priority)
+        return query_catalog.fetch_lookup(con, legajos, fields, titular_priority)
+
+    def _fetch_frame(self, con, legajos: List[str], fields: List[str]) -> pl.DataFrame:
+        """Igual que `_fetch_records`, leyendo el resultado por bloques de columnas"""
+        titular_priority = FETCH_CONFIG["titular_priority"]
+        if FETCH_CONFIG["lookup_mode"] == "temp_table":
+            return temp_lookup.fetch_frame(con, legajos, fields, titular_priority)
+        return query_catalog.fetch_lookup_frame(con, legajos, fields, titular_priority)
+
+    def export_snapshot(self, full: bool = False) -> Dict[str, Any]:
+        """Refresca el snapshot local (ver snapshot.py) con una conexión del pool
+        
+        Incremental por defecto; `full` vuelve a exportar todos los LEGAJOs.
+        """
+        store = get_snapshot_store()
+        with self.pool.connection() as con:
+            if full:
+                return store.export(con, source=self.connection_string)
+            return store.refresh(con, source=self.connection_string)
+
+    @staticmethod
+    def _to_propuesta(legajo: str, record: Dict[str, Any]) -> PropuestaData:
+        return to_propuesta_data(PropuestaRecord.from_record(legajo, record))
+
+def record_csv_metrics(input_path: str, output_path: Optional[str], success: bool, rows: int,
+                       matched: int, seconds: float):
+    """Actualiza las métricas de CSV (ver metrics.py) con un archivo procesado"""
+    metrics.CSV_FILES.inc(result="ok" if success else "error")
+    if not success:
+        return
+    metrics.CSV_ROWS.inc(rows)
+    metrics.CSV_MATCHED_ROWS.inc(matched)
+    metrics.CSV_SECONDS.observe(seconds)
+    if seconds > 0:
+        metrics.CSV_ROWS_PER_SECOND.set(rows / seconds)
+    if os.path.exists(input_path):
+        metrics.CSV_BYTES_READ.inc(os.path.getsize(input_path))
+    if output_path and os.path.exists(output_path):
+        metrics.CSV_BYTES_WRITTEN.inc(os.path.getsize(output_path))
+
 # Clase para procesamiento de CSV con Polars optimizado
 class CSVProcessor:
-    def __init__(self, db_manager: FirebirdManager):
+    def __init__(self, db_manager: FirebirdManager, fill_executor: Optional[Executor] = None,
+                 progress: Optional[Callable[..., None]] = None):
         self.db_manager = db_manager
+        # Pool de procesos opcional para el llenado (CPU); sin él se llena en el thread actual
+        self.fill_executor = fill_executor
+        # Callback de progreso (ver jobs.Job.update); si lanza una excepción se aborta el proceso
+        self.progress = progress
+    
+    def _report(self, **fields):
+        if self.progress is not None:
+            self.progress(**fields)
         
     def process_csv_file(self, file_path: str, request: CSVProcessRequest) -> ProcessResult:
         """Procesa el archivo CSV y llena los campos faltantes usando Polars optimizado"""
@@ -225,20 +344,53 @@ class CSVProcessor:
             logger.info(f"Procesando CSV ({file_size_mb:.1f} MB) con Polars, streaming: {use_streaming}")
             
             if use_streaming:
-                return self._process_large_csv_streaming(file_path, request)
+                result = self._process_large_csv_streaming(file_path, request)
             else:
-                return self._process_standard_csv(file_path, request)
+                result = self._process_standard_csv(file_path, request)
                 
         except Exception as e:
             logger.error(f"Error procesando CSV: {str(e)}")
             execution_time = (datetime.now() - start_time).total_seconds()
-            return ProcessResult(
+            result = ProcessResult(
                 success=False,
                 processed_count=processed_count,
                 matched_count=matched_count,
                 errors=[str(e)],
                 execution_time=execution_time
             )
+        
+        record_csv_metrics(file_path, result.file_path, result.success, result.processed_count,
+                           result.matched_count, result.execution_time)
+        return result
+    
+    def process_csv_files(self, file_paths: List[str], request: CSVProcessRequest,
+                          output_dir: Optional[str] = None,
+                          executor: Optional[Executor] = None) -> BatchProcessResult:
+        """Procesa varios CSV con una sola consulta a la BD para los LEGAJOs de todos
+        
+        Lectura y llenado de cada archivo van a `executor` (por defecto el `fill_executor`),
+        un archivo por proceso; sin ninguno, uno tras otro (ver multi_template.py).
+        """
+        cache_stats = {"hits": 0, "misses": 0}
+        
+        def lookup(propuestas: List[str], fields: List[str], errors: List[str]) -> pl.DataFrame:
+            self._report(phase="consultando", rows_total=len(propuestas))
+            results = self.lookup_results(propuestas, fields, errors, cache_stats)
+            self._report(phase="llenando")
+            return results
+        
+        self._report(phase="leyendo")
+        summary = multi_template.process_templates(
+            file_paths, lookup, self._fill_mapping(request),
+            data_start_row=request.data_start_row,
+            propuesta_column=request.propuesta_column,
+            output_dir=output_dir,
+            executor=executor or self.fill_executor
+        )
+        for item in summary["files"]:
+            record_csv_metrics(item["file"], item.get("file_path"), item["success"], item.get("processed_count", 0),
+                               item.get("matched_count", 0), item.get("fill_time", 0.0))
+        return BatchProcessResult(**summary, cache_hits=cache_stats["hits"], cache_misses=cache_stats["misses"])
     
     def _process_standard_csv(self, file_path: str, request: CSVProcessRequest) -> ProcessResult:
         """Procesa archivos CSV estándar (< 100MB) con Polars"""
@@ -246,24 +398,21 @@ class CSVProcessor:
         errors = []
         processed_count = 0
         matched_count = 0
+        cache_stats = {"hits": 0, "misses": 0}
         
         try:
             # Leer el CSV con Polars (más rápido que pandas)
-            df = pl.read_csv(
-                file_path,
-                has_header=False,
-                dtypes=str,  # Todo como string para evitar problemas de tipo
-                ignore_errors=True,
-                truncate_ragged_lines=True  # Manejar líneas inconsistentes
-            )
+            self._report(phase="leyendo")
+            df = fill_engine.read_template(file_path, header_rows=max(request.data_start_row - 1, 1))
             logger.info(f"CSV cargado con {df.height} filas y {df.width} columnas usando Polars")
             
             # Extraer propuestas de manera eficiente
-            propuestas, propuesta_indices = self._extract_propuestas_optimized(df, request)
-            processed_count = len(propuestas)
+            legajos = self._extract_propuestas_optimized(df, request)
+            processed_count = legajos.height
             logger.info(f"Encontradas {processed_count} propuestas para procesar")
+            self._report(phase="consultando", rows_total=processed_count)
             
-            if not propuestas:
+            if legajos.is_empty():
                 return ProcessResult(
                     success=True,
                     processed_count=0,
@@ -272,16 +421,29 @@ class CSVProcessor:
                     execution_time=(datetime.now() - start_time).total_seconds()
                 )
             
-            # Obtener datos de la BD de manera eficiente (en lotes)
-            propuestas_data = self._get_data_in_batches(propuestas)
+            # Obtener datos de la BD de manera eficiente (en lotes, cada LEGAJO una sola vez)
+            unique_propuestas = fill_engine.unique_legajos(legajos)
+            logger.info(f"{len(unique_propuestas)} propuestas únicas de {processed_count}")
+            
+            def batch_progress(done: int, total: int):
+                # Las consultas a BD son casi todo el tiempo; el avance por filas se estima por lotes
+                self._report(batches_done=done, batches_total=total,
+                             rows_done=processed_count * done // total, fraction=0.95 * done / total)
+            
+            mapping = self._fill_mapping(request)
+            results = self.lookup_results(
+                unique_propuestas, field_mapping.mapping_fields(mapping), errors, cache_stats, batch_progress
+            )
             
             # Aplicar actualizaciones de manera optimizada
-            matched_count = self._apply_updates_optimized(df, propuestas, propuesta_indices, 
-                                                        propuestas_data, request, errors)
+            self._report(phase="llenando", rows_done=processed_count)
+            df, matched_count, unmatched = self._apply_updates_optimized(df, legajos, results, request)
+            errors.extend(f"No se encontró datos para propuesta: {propuesta}" for propuesta in unmatched)
             
             # Guardar el archivo procesado
+            self._report(phase="escribiendo")
             output_path = file_path.replace('.csv', '_processed.csv')
-            df.write_csv(output_path, has_header=False)
+            df.write_csv(output_path, include_header=False)
             
             execution_time = (datetime.now() - start_time).total_seconds()
             
@@ -291,7 +453,10 @@ class CSVProcessor:
                 matched_count=matched_count,
                 errors=errors,
                 file_path=output_path,
-                execution_time=execution_time
+                execution_time=execution_time,
+                unique_count=len(unique_propuestas),
+                cache_hits=cache_stats["hits"],
+                cache_misses=cache_stats["misses"]
             )
             
         except Exception as e:
@@ -305,159 +470,491 @@ class CSVProcessor:
                 execution_time=execution_time
             )
     
-    def _extract_propuestas_optimized(self, df: pl.DataFrame, request: CSVProcessRequest):
-        """Extrae propuestas del DataFrame de manera optimizada con Polars"""
-        propuestas = []
-        propuesta_indices = []
+    def _process_large_csv_streaming(self, file_path: str, request: CSVProcessRequest) -> ProcessResult:
+        """Procesa archivos CSV grandes (> 100MB) por chunks, con memoria acotada al tamaño del chunk"""
+        start_time = datetime.now()
+        errors = []
+        processed_count = 0
+        matched_count = 0
+        chunks_processed = 0
+        # Solo las claves (no los datos) para contar LEGAJOs distintos en todo el archivo
+        seen_legajos = set()
+        cache_stats = {"hits": 0, "misses": 0}
+        chunk_size = CSV_CONFIG["chunk_size"]
+        output_path = file_path.replace('.csv', '_processed.csv')
+        # En streaming no se conoce el total de filas: el avance se mide por bytes leídos
+        total_bytes = os.path.getsize(file_path) or 1
+        bytes_read = 0
+        batches_before = 0
         
-        if df.width > 1:  # Verificar que existe columna B
-            # Obtener columna B (índice 1) usando Polars
-            propuesta_col = df.get_column(f"column_1")
+        try:
+            schema = None
+            header_index = None
+            row_offset = 0
+            header_rows = max(request.data_start_row - 1, 1)
+            
+            with open(output_path, "wb") as output:
+                # El primer chunk trae todas las filas de encabezado aunque `chunk_size` sea menor
+                for raw_chunk in self._iter_csv_chunks(file_path, chunk_size, first_chunk_size=header_rows):
+                    bytes_read += len(raw_chunk)
+                    self._report(phase=f"chunk {chunks_processed + 1}")
+                    # El ancho del CSV sale de los encabezados; todos los chunks se leen con ese esquema
+                    if schema is None:
+                        chunk = fill_engine.read_template(io.BytesIO(raw_chunk), header_rows=header_rows)
+                        schema = chunk.schema
+                        header_index = self._build_header_index(chunk, request)
+                    else:
+                        chunk = fill_engine.read_template(io.BytesIO(raw_chunk), schema=schema)
+                    
+                    legajos = self._extract_propuestas_optimized(chunk, request, row_offset)
+                    processed_count += legajos.height
+                    
+                    if not legajos.is_empty():
+                        unique_propuestas = fill_engine.unique_legajos(legajos)
+                        seen_legajos.update(unique_propuestas)
+                        chunk_batches = [0]
+                        
+                        def batch_progress(done: int, total: int):
+                            chunk_batches[0] = done
+                            self._report(batches_done=batches_before + done)
+                        
+                        results = self.lookup_results(
+                            unique_propuestas, field_mapping.mapping_fields(self._fill_mapping(request)),
+                            errors, cache_stats, batch_progress
+                        )
+                        batches_before += chunk_batches[0]
+                        chunk, chunk_matched, unmatched = self._apply_updates_optimized(
+                            chunk, legajos, results, request,
+                            header_index=header_index
+                        )
+                        matched_count += chunk_matched
+                        errors.extend(f"No se encontró datos para propuesta: {propuesta}" for propuesta in unmatched)
+                    
+                    chunk.write_csv(output, include_header=False)
+                    row_offset += chunk.height
+                    chunks_processed += 1
+                    logger.info(f"Chunk {chunks_processed}: {chunk.height} filas, "
+                                f"{legajos.height} propuestas, {matched_count} matches acumulados")
+                    self._report(rows_done=processed_count, batches_done=batches_before,
+                                 fraction=bytes_read / total_bytes)
+            
+            execution_time = (datetime.now() - start_time).total_seconds()
+            
+            return ProcessResult(
+                success=True,
+                processed_count=processed_count,
+                matched_count=matched_count,
+                errors=errors,
+                file_path=output_path,
+                execution_time=execution_time,
+                chunks_processed=chunks_processed,
+                unique_count=len(seen_legajos),
+                cache_hits=cache_stats["hits"],
+                cache_misses=cache_stats["misses"]
+            )
             
-            # Filtrar desde la fila de datos especificada
-            start_idx = request.data_start_row - 1
+        except Exception as e:
+            logger.error(f"Error en _process_large_csv_streaming: {str(e)}")
+            # No dejar un archivo de salida a medias
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            execution_time = (datetime.now() - start_time).total_seconds()
+            return ProcessResult(
+                success=False,
+                processed_count=processed_count,
+                matched_count=matched_count,
+                errors=[str(e)],
+                execution_time=execution_time,
+                chunks_processed=chunks_processed
+            )
+    
+    def _iter_csv_chunks(self, file_path: str, chunk_size: int, first_chunk_size: int = 0):
+        """Lee el CSV en bloques de `chunk_size` registros sin cortar campos entre comillas.
+        
+        El primero tiene al menos `first_chunk_size` registros. El lector por lotes de Polars
+        no soporta `truncate_ragged_lines`, y los templates tienen filas de ancho irregular,
+        así que aquí solo se cortan los bytes en límites de registro y cada bloque se parsea
+        después con Polars.
+        """
+        with open(file_path, "rb") as f:
+            lines = []
+            records = 0
+            in_quotes = False
+            limit = max(chunk_size, first_chunk_size)
             
-            for idx in range(start_idx, min(len(propuesta_col), df.height)):
-                propuesta = propuesta_col[idx]
-                if propuesta is not None:
-                    propuesta_clean = str(propuesta).strip()
-                    if propuesta_clean and propuesta_clean != '':
-                        propuestas.append(propuesta_clean)
-                        propuesta_indices.append(idx)
-        
-        return propuestas, propuesta_indices
-    
-    def _get_data_in_batches(self, propuestas: List[str], batch_size: int = 1000):
-        """Obtiene datos de BD en lotes para optimizar rendimiento"""
-        all_data = {}
-        
-        # Procesar en lotes para evitar consultas SQL muy grandes
-        for i in range(0, len(propuestas), batch_size):
-            batch = propuestas[i:i + batch_size]
-            logger.info(f"Procesando lote {i//batch_size + 1}: {len(batch)} propuestas")
+            for line in f:
+                lines.append(line)
+                # Un número impar de comillas abre o cierra un campo multilínea
+                if line.count(b'"') % 2:
+                    in_quotes = not in_quotes
+                if in_quotes:
+                    continue
+                
+                records += 1
+                if records >= limit:
+                    yield b"".join(lines)
+                    lines = []
+                    records = 0
+                    limit = chunk_size
             
-            batch_data = self.db_manager.get_multiple_propuestas(batch)
-            all_data.update(batch_data)
+            if lines:
+                yield b"".join(lines)
+    
+    def _extract_propuestas_optimized(self, df: pl.DataFrame, request: CSVProcessRequest,
+                                      row_offset: int = 0) -> pl.DataFrame:
+        """Extrae propuestas del DataFrame con expresiones vectorizadas de Polars
         
-        return all_data
+        `row_offset` es la fila global donde empieza `df` cuando se procesa por chunks;
+        los índices de fila devueltos son locales a `df`.
+        """
+        start_idx = max(0, request.data_start_row - 1 - row_offset)
+        column_index = fill_engine.column_letter_to_index(request.propuesta_column)
+        return fill_engine.extract_legajos(df, start_row=start_idx, column_index=column_index)
     
-    def _apply_updates_optimized(self, df: pl.DataFrame, propuestas: List[str], 
-                                propuesta_indices: List[int], propuestas_data: Dict,
-                                request: CSVProcessRequest, errors: List[str]) -> int:
-        """Aplica actualizaciones al DataFrame de manera optimizada"""
-        matched_count = 0
+    def lookup_results(self, propuestas: List[str], fields: List[str],
+                        errors: Optional[List[str]] = None,
+                        cache_stats: Optional[Dict[str, int]] = None,
+                        progress: Optional[Callable[[int, int], None]] = None) -> pl.DataFrame:
+        """Datos de `fields` para `propuestas` como DataFrame de resultados (ver `fill_engine.results_to_frame`)
         
-        # Encontrar o crear columna objetivo
-        target_col_index = self._find_or_create_column_index(df, request.target_column)
-        target_col_name = f"column_{target_col_index}"
+        En modo "snapshot" salen del snapshot local con un hash join; los LEGAJOs que no
+        están (o todos, si no hay snapshot de esta base con esos campos) se consultan a la BD.
+        """
+        if FETCH_CONFIG["lookup_mode"] == "snapshot":
+            store = get_snapshot_store()
+            if store.covers(fields, self.db_manager.connection_string):
+                age = store.age_seconds()
+                if age > SNAPSHOT_CONFIG["max_age_seconds"]:
+                    logger.warning(f"Snapshot de LEGAJOs con {age / 3600:.1f} horas; conviene refrescarlo")
+                results = store.lookup(propuestas, fields)
+                found = set(results.get_column(fill_engine.LEGAJO).to_list())
+                missing = [propuesta for propuesta in propuestas if propuesta not in found]
+                logger.info(f"Snapshot: {len(found)} LEGAJOs encontrados, {len(missing)} fuera del snapshot")
+                if missing and SNAPSHOT_CONFIG["fallback_missing"]:
+                    fetched = self._get_data_in_batches(missing, fields, errors, cache_stats, progress)
+                    results = fill_engine.concat_results([results, fetched], fields)
+                return results
+            logger.warning(f"No hay snapshot de {self.db_manager.connection_string} con los campos "
+                           f"{', '.join(fields)}; se consulta la BD")
         
-        # Preparar lista de valores para la columna objetivo
-        if target_col_name in df.columns:
-            current_target_values = df.get_column(target_col_name).to_list()
-        else:
-            current_target_values = [""] * df.height
-            # Expandir si es necesario
-            while len(current_target_values) < df.height:
-                current_target_values.append("")
-        
-        # Aplicar actualizaciones
-        for i, propuesta in enumerate(propuestas):
-            row_idx = propuesta_indices[i]
-            
-            if propuesta in propuestas_data:
-                if row_idx < len(current_target_values):
-                    current_target_values[row_idx] = propuestas_data[propuesta].nombre_cliente
-                    matched_count += 1
-            else:
-                errors.append(f"No se encontró datos para propuesta: {propuesta}")
-        
-        # Actualizar DataFrame con nueva columna optimizada
-        # Si la columna no existía, agregarla
-        if target_col_name not in df.columns:
-            df = df.with_columns([
-                pl.Series(name=target_col_name, values=current_target_values)
-            ])
+        return self._get_data_in_batches(propuestas, fields, errors, cache_stats, progress)
+    
+    def _get_data_in_batches(self, propuestas: List[str], fields: List[str],
+                             errors: Optional[List[str]] = None,
+                             cache_stats: Optional[Dict[str, int]] = None,
+                             progress: Optional[Callable[[int, int], None]] = None) -> pl.DataFrame:
+        """Obtiene de BD los `fields` de cada propuesta en lotes paralelos, cada worker con su conexión del pool
+        
+        `propuestas` debe venir sin repetidos (ver `fill_engine.unique_legajos`). El tamaño
+        de lote se adapta a la latencia de cada perfil de consulta (ver batch_controller.py).
+        Cada lote llega como DataFrame de resultados y se unen al final.
+        
+        La caché persistente se consulta antes de armar los lotes: solo van a la BD los
+        LEGAJOs que no están, y la latencia que mide el controlador es la de la consulta.
+        Si algún lote agota sus reintentos se lanza `BatchFetchError` (ver batch_fetcher.py).
+        """
+        cached, missing = self.db_manager.cached_field_frame(propuestas, fields, cache_stats)
+        if cached.height:
+            logger.info(f"Caché: {cached.height} LEGAJOs encontrados, {len(missing)} a consultar")
+        if not missing:
+            return cached
+        
+        # En modo "snapshot" solo llegan aquí los LEGAJOs que faltan: lista IN
+        mode = "temp_table" if FETCH_CONFIG["lookup_mode"] == "temp_table" else "in_list"
+        fetcher = ParallelBatchFetcher(
+            lambda batch: self.db_manager.fetch_field_frame(batch, fields),
+            workers=FETCH_CONFIG["workers"],
+            # Con tabla temporal no hay lista IN que acotar: lotes mucho más grandes
+            batch_size=(FETCH_CONFIG["temp_table_batch_size"] if mode == "temp_table"
+                        else FETCH_CONFIG["batch_size"]),
+            timeout=FETCH_CONFIG["batch_timeout"],
+            retries=FETCH_CONFIG["retries"],
+            max_in_flight=FETCH_CONFIG["max_in_flight"],
+            controller=lookup_controller(mode, fields),
+            combine=lambda frames: fill_engine.concat_results(frames, fields)
+        )
+        return fill_engine.concat_results([cached, fetcher.fetch(missing, errors, progress)], fields)
+    
+    def _apply_updates_optimized(self, df: pl.DataFrame, legajos: pl.DataFrame,
+                                results: pl.DataFrame, request: CSVProcessRequest,
+                                header_index: Optional[Dict[str, int]] = None):
+        """Aplica actualizaciones al DataFrame con un join vectorizado
+        
+        No modifica `df`: devuelve el DataFrame nuevo (que comparte con `df` las columnas que
+        no cambian), el número de filas con match y los LEGAJOs sin datos en BD.
+        """
+        # Encontrar o crear las columnas del mapeo (en streaming el índice viene del primer chunk)
+        if header_index is None:
+            header_index = self._build_header_index(df, request)
+        mapping = self._fill_mapping(request)
+        # Sin respaldo por posición: si un encabezado no está se agrega una columna nueva
+        column_map = fill_engine.resolve_fill_mapping(df, header_index, mapping, fallbacks={})
+        
+        fill_args = (df, legajos, results, column_map)
+        if self.fill_executor is not None:
+            df, stats = self.fill_executor.submit(fill_engine.apply_fill, *fill_args, overwrite=True).result()
         else:
-            # Reemplazar columna existente
-            df = df.with_columns([
-                pl.Series(name=target_col_name, values=current_target_values)
-            ])
-        
-        return matched_count
-    
-    def _find_or_create_column_index(self, df: pl.DataFrame, column_name: str) -> int:
-        """Encuentra o crea la columna objetivo y devuelve el índice"""
-        # Buscar si ya existe una columna con el nombre (en las primeras filas)
-        for col_idx in range(df.width):
-            col_name = f"column_{col_idx}"
-            if col_name in df.columns:
-                col_data = df.get_column(col_name)
-                for row_idx in range(min(10, df.height)):  # Buscar en las primeras 10 filas
-                    if row_idx < len(col_data) and col_data[row_idx] == column_name:
-                        return col_idx
-        
-        # Si no existe, retornar el índice para nueva columna
-        return df.width
+            df, stats = fill_engine.apply_fill(*fill_args, overwrite=True)
+        
+        return df, stats["matched_rows"], fill_engine.unmatched_legajos(legajos, results)
+    
+    def _build_header_index(self, df: pl.DataFrame, request: CSVProcessRequest) -> Dict[str, int]:
+        """Índice encabezado -> columna de las filas previas a los datos, construido una vez por archivo"""
+        return fill_engine.build_header_index(
+            df,
+            header_rows=max(request.data_start_row - 1, 1),
+            names=[*self._fill_mapping(request), *fill_engine.TEMPLATE_HEADERS]
+        )
+    
+    def _fill_mapping(self, request: CSVProcessRequest) -> Dict[str, str]:
+        """Encabezado -> campo a llenar; sin mapeo explícito solo `target_column` con el nombre del cliente"""
+        return request.field_mapping or {request.target_column: "nombre_cliente"}
+
+# Variable global para el manager de BD
+db_manager: Optional[FirebirdManager] = None
+
+# Ejecutores para el trabajo bloqueante (fdb y Polars) fuera del event loop
+io_executor: Optional[ThreadPoolExecutor] = None
+fill_executor: Optional[ProcessPoolExecutor] = None
+# Procesos para leer y llenar en paralelo los archivos de POST /process-csv/batch/
+batch_executor: Optional[ProcessPoolExecutor] = None
+upload_semaphore: Optional[asyncio.Semaphore] = None
+lookup_semaphore: Optional[asyncio.Semaphore] = None
+
+def _run_csv_job(job: Job) -> Dict[str, Any]:
+    """Procesa el CSV de un trabajo reportando el avance en el propio trabajo"""
+    if db_manager is None:
+        raise RuntimeError("Base de datos no configurada")
+    processor = CSVProcessor(db_manager, fill_executor, progress=job.update)
+    result = processor.process_csv_file(job.input_path, CSVProcessRequest(**job.params))
+    if result.success and not job.cancelled:
+        _store_output(result, job.filename)
+    return result.model_dump()
+
+def _store_output(result: ProcessResult, filename: str):
+    """Pasa el CSV generado al almacén de descargas y completa el resultado con su id"""
+    if not result.file_path or not os.path.exists(result.file_path):
+        result.errors.append("No quedó archivo de resultado para descargar")
+        return
+    try:
+        output_id, path = get_output_store().register(
+            result.file_path, filename.replace('.csv', '_processed.csv')
+        )
+    except OSError as e:
+        logger.error(f"Error guardando el resultado de {filename}: {str(e)}")
+        result.errors.append(f"No se pudo guardar el resultado para descargar: {str(e)}")
+        return
+    result.output_id = output_id
+    result.download_url = f"/outputs/{output_id}"
+    result.file_path = path
+
+# Cola de trabajos para procesar CSV sin mantener abierta la conexión HTTP
+job_manager = JobManager(
+    _run_csv_job,
+    workers=JOBS_CONFIG["workers"],
+    max_queue=JOBS_CONFIG["max_queue"],
+    retention_seconds=JOBS_CONFIG["retention_seconds"]
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Crea los ejecutores al iniciar y los cierra junto con el pool de BD al apagar"""
+    global io_executor, fill_executor, batch_executor, upload_semaphore, lookup_semaphore
+    io_executor = ThreadPoolExecutor(max_workers=SERVICE_CONFIG["io_workers"], thread_name_prefix="io")
+    if SERVICE_CONFIG["cpu_workers"] > 0:
+        # spawn: hacer fork de un proceso con threads de Polars puede bloquear al hijo
+        fill_executor = ProcessPoolExecutor(
+            max_workers=SERVICE_CONFIG["cpu_workers"],
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    if MULTI_FILE_CONFIG["workers"] > 0:
+        # Los procesos arrancan recién con el primer lote de varios archivos
+        batch_executor = ProcessPoolExecutor(
+            max_workers=MULTI_FILE_CONFIG["workers"],
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    upload_semaphore = asyncio.Semaphore(SERVICE_CONFIG["max_concurrent_uploads"])
+    lookup_semaphore = asyncio.Semaphore(SERVICE_CONFIG["max_concurrent_lookups"])
+    job_manager.start()
+    # El almacén de descargas se crea aquí (recupera y limpia lo que quedó de la ejecución anterior)
+    get_output_store()
+    cleanup_task = asyncio.create_task(_cleanup_outputs())
+    
+    yield
+    
+    cleanup_task.cancel()
+    job_manager.shutdown()
+    if db_manager is not None:
+        db_manager.pool.close()
+    io_executor.shutdown(wait=False, cancel_futures=True)
+    if fill_executor is not None:
+        fill_executor.shutdown(wait=False, cancel_futures=True)
+        fill_executor = None
+    if batch_executor is not None:
+        batch_executor.shutdown(wait=False, cancel_futures=True)
+        batch_executor = None
+
+async def _cleanup_outputs():
+    """Aplica la retención de resultados cada `cleanup_interval` aunque no lleguen resultados nuevos"""
+    while True:
+        await asyncio.sleep(OUTPUT_CONFIG["cleanup_interval"])
+        try:
+            await run_blocking(get_output_store().cleanup)
+        except Exception as e:
+            logger.error(f"Error limpiando resultados: {str(e)}")
+
+async def run_blocking(func, *args, **kwargs):
+    """Ejecuta una función bloqueante en el pool de I/O sin frenar el event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
 
 # Inicialización de la aplicación
 app = FastAPI(
     title="CSV Firebird Automation",
     description="Automatización de llenado de CSV desde base de datos Firebird",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Variable global para el manager de BD
-db_manager: Optional[FirebirdManager] = None
+# Caché en memoria para GET /propuesta/{legajo}
+propuesta_cache = CoalescingLRUCache(
+    max_entries=CACHE_CONFIG["memory_max_entries"],
+    ttl_seconds=CACHE_CONFIG["memory_ttl_seconds"]
+)
+
+# Proceso del servicio para las métricas de memoria y CPU
+service_process = current_process()
+
+def _collect_service_metrics():
+    """Métricas que ya llevan otros componentes, leídas al momento del scrape"""
+    usage = process_usage(service_process)
+    families = [
+        ("process_resident_memory_bytes", "gauge", "Memoria residente (RSS) del proceso",
+         [({}, usage["memory_mb"] * 1024 * 1024)]),
+        ("process_cpu_seconds_total", "counter", "Tiempo de CPU (usuario + sistema) del proceso",
+         [({}, usage["cpu_seconds"])]),
+        ("process_cpu_percent", "gauge", "Uso de CPU del proceso desde el scrape anterior",
+         [({}, usage["cpu_percent"])]),
+        ("process_threads", "gauge", "Threads del proceso", [({}, usage["threads"])]),
+        ("process_start_time_seconds", "gauge", "Inicio del proceso (epoch)", [({}, usage["started_at"])]),
+    ]
+    
+    if db_manager is not None:
+        pool = db_manager.pool.stats()
+        families.append(("db_pool_connections", "gauge", "Conexiones del pool de Firebird por estado",
+                         [({"state": "in_use"}, pool["in_use"]), ({"state": "idle"}, pool["idle"])]))
+    
+    cache = propuesta_cache.stats()
+    families.append(("propuesta_cache_requests_total", "counter", "Consultas a la caché de GET /propuesta por resultado",
+                     [({"result": result}, cache[result]) for result in ("hits", "misses", "coalesced")]))
+    
+    batch_sizes = controller_stats()
+    families.append(("db_batch_size", "gauge", "Tamaño de lote actual por perfil de consulta",
+                     [({"profile": profile}, stats["size"]) for profile, stats in batch_sizes.items()]))
+    
+    jobs = job_manager.stats()
+    families.append(("jobs", "gauge", "Trabajos de CSV por estado",
+                     [({"phase": "queued"}, jobs["queued"]), ({"phase": "running"}, jobs["running"])]))
+    
+    outputs = get_output_store().stats()
+    families.append(("outputs_stored_bytes", "gauge", "Bytes de CSV procesados guardados para descargar",
+                     [({}, outputs["total_bytes"])]))
+    return families
+
+metrics.REGISTRY.add_collector(_collect_service_metrics)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latencia por ruta; se etiqueta con la plantilla (/jobs/{job_id}) y no con la URL"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "sin_ruta"),
+            status=status
+        )
 
 @app.post("/configure-database/")
 async def configure_database(config: DatabaseConfig):
     """Configura la conexión a la base de datos Firebird"""
     global db_manager
     try:
-        db_manager = FirebirdManager(config)
-        # Probar la conexión
-        with db_manager.get_connection() as con:
-            cur = con.cursor()
-            cur.execute("SELECT 1 FROM RDB$DATABASE")
-            cur.fetchone()
-        
-        return {"message": "Base de datos configurada correctamente"}
+        new_manager = FirebirdManager(config)
+        # Abrir y validar las conexiones mínimas del pool
+        await run_blocking(new_manager.pool.warm_up)
+        
+        if db_manager is not None:
+            await run_blocking(db_manager.pool.close)
+        db_manager = new_manager
+        # Los resultados en memoria pueden ser de la base anterior
+        propuesta_cache.invalidate()
+        
+        return {
+            "message": "Base de datos configurada correctamente",
+            "pool": db_manager.pool.stats()
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error configurando BD: {str(e)}")
 
+def _build_process_request(target_column: str, data_start_row: int, propuesta_column: str,
+                           mapping_json: Optional[str]) -> CSVProcessRequest:
+    """Parámetros de procesamiento; `mapping_json` es el mapeo encabezado -> campo en JSON"""
+    mapping = None
+    if mapping_json:
+        try:
+            mapping = json.loads(mapping_json)
+            if not isinstance(mapping, dict):
+                raise ValueError("se esperaba un objeto {encabezado: campo}")
+            mapping = field_mapping.validate_mapping(mapping)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"field_mapping inválido: {str(e)}")
+    
+    return CSVProcessRequest(
+        target_column=target_column,
+        data_start_row=data_start_row,
+        propuesta_column=propuesta_column,
+        field_mapping=mapping
+    )
+
 @app.post("/process-csv/", response_model=ProcessResult)
 async def process_csv(
+    http_request: Request,
     background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
     target_column: str = "CLIENTE",
     data_start_row: int = 11,
-    propuesta_column: str = "B"
+    propuesta_column: str = "B",
+    field_mapping: Optional[str] = None
 ):
-    """Procesa el archivo CSV y llena los campos faltantes"""
+    """Procesa el archivo CSV (campo multipart `file`) y llena los campos faltantes
+    
+    `field_mapping` (JSON, opcional) llena varias columnas en una sola consulta,
+    p. ej. {"CLIENTE": "nombre_cliente", "TELEFONO": "telefono"}; ver GET /fields.
+    """
     if db_manager is None:
         raise HTTPException(status_code=400, detail="Base de datos no configurada")
     
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Solo se aceptan archivos CSV")
-    
-    # Guardar archivo temporal
-    temp_dir = tempfile.gettempdir()
-    temp_file = os.path.join(temp_dir, f"{uuid.uuid4()}_{file.filename}")
+    request = _build_process_request(target_column, data_start_row, propuesta_column, field_mapping)
+    # Guardar archivo temporal por bloques, validando encabezados mientras llega
+    upload = await _receive_upload(http_request, request)
+    temp_file = upload.path
     
     try:
-        with open(temp_file, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
         # Procesar el archivo
-        processor = CSVProcessor(db_manager)
-        request = CSVProcessRequest(
-            target_column=target_column,
-            data_start_row=data_start_row,
-            propuesta_column=propuesta_column
-        )
+        processor = CSVProcessor(db_manager, fill_executor)
         
-        result = processor.process_csv_file(temp_file, request)
+        # Limitar los procesamientos simultáneos; los demás esperan sin ocupar threads
+        async with upload_semaphore:
+            result = await run_blocking(processor.process_csv_file, temp_file, request)
+        result.input_sha256 = upload.sha256
+        if result.success:
+            await run_blocking(_store_output, result, upload.filename)
         
         # Limpiar archivo temporal en background
         background_tasks.add_task(os.remove, temp_file)
@@ -470,18 +967,266 @@ async def process_csv(
             os.remove(temp_file)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/process-csv/batch/", response_model=BatchProcessResult)
+async def process_csv_batch(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    target_column: str = "CLIENTE",
+    data_start_row: int = 11,
+    propuesta_column: str = "B",
+    field_mapping: Optional[str] = None
+):
+    """Procesa varios CSV (campo multipart `files`, repetido) con una sola consulta a la BD
+    
+    Los LEGAJOs de todos los archivos se consultan una vez; cada archivo tiene su resumen
+    y su URL de descarga. Mismos parámetros que POST /process-csv/.
+    """
+    if db_manager is None:
+        raise HTTPException(status_code=400, detail="Base de datos no configurada")
+    
+    request = _build_process_request(target_column, data_start_row, propuesta_column, field_mapping)
+    uploads = await _receive_uploads(http_request, request)
+    temp_files = [upload.path for upload in uploads]
+    
+    try:
+        processor = CSVProcessor(db_manager, fill_executor)
+        async with upload_semaphore:
+            result = await run_blocking(processor.process_csv_files, temp_files, request, executor=batch_executor)
+        
+        store = get_output_store()
+        for upload, summary in zip(uploads, result.files):
+            # El resumen lleva el nombre original, no el de la subida en disco
+            summary.file = upload.filename
+            if not summary.success:
+                continue
+            if not summary.file_path or not os.path.exists(summary.file_path):
+                summary.success = False
+                summary.errors.append("No quedó archivo de resultado para descargar")
+                continue
+            try:
+                output_id, path = await run_blocking(
+                    store.register, summary.file_path, upload.filename.replace('.csv', '_processed.csv')
+                )
+            except OSError as e:
+                logger.error(f"Error guardando el resultado de {upload.filename}: {str(e)}")
+                summary.success = False
+                summary.errors.append(f"No se pudo guardar el resultado para descargar: {str(e)}")
+                continue
+            summary.output_id = output_id
+            summary.download_url = f"/outputs/{output_id}"
+            summary.file_path = path
+        result.success = all(summary.success for summary in result.files)
+        
+        for temp_file in temp_files:
+            background_tasks.add_task(os.remove, temp_file)
+        
+        return result
+        
+    except Exception as e:
+        for temp_file in temp_files:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/jobs/", status_code=202)
+async def submit_job(
+    http_request: Request,
+    target_column: str = "CLIENTE",
+    data_start_row: int = 11,
+    propuesta_column: str = "B",
+    field_mapping: Optional[str] = None
+):
+    """Encola el procesamiento de un CSV (campo multipart `file`) y devuelve el id del trabajo"""
+    if db_manager is None:
+        raise HTTPException(status_code=400, detail="Base de datos no configurada")
+    
+    request = _build_process_request(target_column, data_start_row, propuesta_column, field_mapping)
+    upload = await _receive_upload(http_request, request)
+    
+    try:
+        job = job_manager.submit(upload.path, request.model_dump(), filename=upload.filename)
+    except QueueFullError as e:
+        os.remove(upload.path)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    
+    return {
+        "job_id": job.id,
+        "input_sha256": upload.sha256,
+        "status_url": f"/jobs/{job.id}",
+        "result_url": f"/jobs/{job.id}/result"
+    }
+
+def _get_job_or_404(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Estado del trabajo: fase, filas y lotes procesados, ETA y resultado al terminar"""
+    return _get_job_or_404(job_id).snapshot()
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, compression: Optional[str] = None):
+    """Descarga el CSV procesado de un trabajo terminado"""
+    job = _get_job_or_404(job_id)
+    if job.phase != DONE:
+        raise HTTPException(status_code=409, detail=f"El trabajo está en fase '{job.phase}'")
+    return _output_response((job.result or {}).get("output_id"), compression)
+
+@app.get("/outputs/{output_id}")
+async def download_output(output_id: str, compression: Optional[str] = None):
+    """Descarga un CSV procesado por bloques; `compression=gzip|zstd` comprime al vuelo"""
+    return _output_response(output_id, compression)
+
+def _output_response(output_id: Optional[str], compression: Optional[str]) -> StreamingResponse:
+    output = get_output_store().get(output_id) if output_id else None
+    if output is None:
+        raise HTTPException(status_code=410, detail="El resultado ya no está disponible")
+    
+    try:
+        body = iter_file(output["path"], OUTPUT_CONFIG["chunk_size"], compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    media_type, extension = COMPRESSIONS.get(compression, ("text/csv", ""))
+    filename = output["filename"].replace('"', '')
+    headers = {"Content-Disposition": f'attachment; filename="{filename}{extension}"'}
+    if compression is None:
+        headers["Content-Length"] = str(output["size"])
+    # El generador es síncrono: Starlette lo recorre en un thread sin frenar el event loop
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancela un trabajo en cola o en proceso"""
+    _get_job_or_404(job_id)
+    return job_manager.cancel(job_id).snapshot()
+
+def _header_validator(request: CSVProcessRequest) -> Callable[[str, bytes], None]:
+    """Validación de las primeras líneas de cada CSV subido"""
+    
+    def validate_header(filename: str, header: bytes):
+        if not filename.lower().endswith('.csv'):
+            raise UploadFormatError("Solo se aceptan archivos CSV")
+        # Alguna de las primeras filas del template debe llegar hasta la columna de PROPUESTA JKM
+        rows = csv.reader(io.StringIO(header.decode('utf-8', errors='replace')))
+        width = max((len(row) for row in rows), default=0)
+        if width <= fill_engine.column_letter_to_index(request.propuesta_column):
+            raise UploadFormatError(
+                f"{filename}: el CSV tiene {width} columnas; falta la columna {request.propuesta_column} de PROPUESTA JKM"
+            )
+    
+    return validate_header
+
+async def _receive_upload(http_request: Request, request: CSVProcessRequest) -> SavedUpload:
+    """Guarda la subida en disco; responde 413/400 sin esperar al final si no es aceptable"""
+    try:
+        return await save_csv_upload(
+            http_request,
+            UPLOAD_CONFIG["directory"] or tempfile.gettempdir(),
+            max_bytes=UPLOAD_CONFIG["max_size_mb"] * 1024 * 1024,
+            chunk_size=UPLOAD_CONFIG["chunk_size"],
+            header_lines=request.data_start_row,
+            validate_header=_header_validator(request),
+            offload=run_blocking
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _receive_uploads(http_request: Request, request: CSVProcessRequest) -> List[SavedUpload]:
+    """Como `_receive_upload` para varios archivos en el campo `files`"""
+    try:
+        return await save_csv_uploads(
+            http_request,
+            UPLOAD_CONFIG["directory"] or tempfile.gettempdir(),
+            max_files=MULTI_FILE_CONFIG["max_files"],
+            max_bytes=UPLOAD_CONFIG["max_size_mb"] * 1024 * 1024,
+            chunk_size=UPLOAD_CONFIG["chunk_size"],
+            header_lines=request.data_start_row,
+            validate_header=_header_validator(request),
+            offload=run_blocking
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/fields")
+async def list_fields():
+    """Campos de BD disponibles para `field_mapping`"""
+    return {"fields": sorted(field_mapping.FIELDS)}
+
 @app.get("/propuesta/{legajo}", response_model=PropuestaData)
 async def get_propuesta(legajo: str):
     """Obtiene los datos de una propuesta específica"""
     if db_manager is None:
         raise HTTPException(status_code=400, detail="Base de datos no configurada")
     
-    data = db_manager.get_propuesta_data(legajo)
+    # Consultas repetidas salen de la caché; concurrentes por el mismo legajo comparten la consulta
+    manager = db_manager
+    
+    async def load():
+        async with lookup_semaphore:
+            return await run_blocking(manager.get_propuesta_data, legajo)
+    
+    data = await propuesta_cache.get_or_load(legajo, load)
     if data is None:
         raise HTTPException(status_code=404, detail=f"Propuesta {legajo} no encontrada")
     
     return data
 
+@app.post("/cache/invalidate")
+async def invalidate_cache(request: CacheInvalidateRequest):
+    """Invalida entradas de la caché persistente de LEGAJOs (todas si no se indican)"""
+    cache = get_lookup_cache()
+    if cache is None:
+        raise HTTPException(status_code=400, detail="Caché de LEGAJOs deshabilitada")
+    
+    invalidated = cache.invalidate(request.legajos)
+    propuesta_cache.invalidate(request.legajos)
+    return {"invalidated": invalidated, "cache": cache.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Tamaño y tasa de aciertos de las cachés de LEGAJOs"""
+    cache = get_lookup_cache()
+    return {
+        "propuesta": propuesta_cache.stats(),
+        "persistent": cache.stats() if cache is not None else None
+    }
+
+@app.get("/snapshot")
+async def snapshot_info():
+    """Fecha, tamaño y campos del snapshot local de LEGAJOs"""
+    store = get_snapshot_store()
+    meta = store.metadata()
+    if meta is None:
+        raise HTTPException(status_code=404, detail="No hay snapshot; usar POST /snapshot/refresh")
+    return {**meta, "age_seconds": store.age_seconds(), "active": FETCH_CONFIG["lookup_mode"] == "snapshot"}
+
+@app.post("/snapshot/refresh")
+async def refresh_snapshot(full: bool = False):
+    """Refresca el snapshot local: solo las propuestas cambiadas, o todo con `full=true` (puede tardar)"""
+    if db_manager is None:
+        raise HTTPException(status_code=400, detail="Base de datos no configurada")
+    
+    try:
+        return await run_blocking(db_manager.export_snapshot, full)
+    except SnapshotBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error exportando snapshot: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error exportando snapshot: {str(e)}")
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Métricas del servicio en el formato de texto de Prometheus (ver metrics.py)"""
+    return Response(content=await run_blocking(metrics.render), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     """Endpoint de salud"""
@@ -492,14 +1237,16 @@ async def health_check():
     }
     
     if db_manager:
-        try:
-            with db_manager.get_connection() as con:
-                cur = con.cursor()
-                cur.execute("SELECT 1 FROM RDB$DATABASE")
-                cur.fetchone()
-            status["database_connection"] = "ok"
-        except:
-            status["database_connection"] = "error"
+        # Reportar la ocupación del pool sin abrir conexiones nuevas en cada sondeo; stats()
+        # cierra las conexiones vencidas, así que corre fuera del event loop
+        pool_stats = await run_blocking(db_manager.pool.stats)
+        status["database_pool"] = pool_stats
+        status["database_connection"] = "ok" if pool_stats["size"] > 0 else "sin conexiones abiertas"
+    
+    status["batch_sizes"] = controller_stats()
+    status["prepared_statements"] = query_catalog.catalog_stats()
+    status["jobs"] = job_manager.stats()
+    status["outputs"] = get_output_store().stats()
     
     return status
 
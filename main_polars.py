@@ -40,27 +40,26 @@ def main():
     test_legajo = "642799"  # Del ejemplo
     client.get_propuesta_info(test_legajo)
     
-    # 4. Determinar archivo a procesar
-    csv_file = None
+    # 4. Determinar archivos a procesar
+    csv_files = []
     
-    # Si se pasó archivo como argumento
+    # Si se pasaron archivos como argumento
     if len(sys.argv) > 1:
-        csv_file = sys.argv[1]
-        if not os.path.exists(csv_file):
-            print(f"[X] Archivo no encontrado: {csv_file}")
+        csv_files = sys.argv[1:]
+        missing = [f for f in csv_files if not os.path.exists(f)]
+        if missing:
+            print(f"[X] Archivos no encontrados: {', '.join(missing)}")
             return
     else:
-        # Buscar archivos CSV en el directorio actual
-        csv_files = [f for f in os.listdir('.') if f.endswith('.csv') and not f.startswith('test_')]
+        # Buscar archivos CSV en el directorio actual (sin resultados de corridas anteriores)
+        csv_files = [f for f in os.listdir('.') if f.endswith('.csv') and not f.startswith('test_')
+                     and not f.endswith('_processed.csv')]
         
         if csv_files:
             print(f"\n4[EMOJI]⃣ Archivos CSV encontrados:")
             for i, csv_file_found in enumerate(csv_files, 1):
                 size_mb = os.path.getsize(csv_file_found) / (1024 * 1024)
                 print(f"   {i}. {csv_file_found} ({size_mb:.1f} MB)")
-            
-            # Usar el primer archivo encontrado
-            csv_file = csv_files[0]
         else:
             print("\n4[EMOJI]⃣ No se encontraron archivos CSV")
             print("[INFO] Coloca tu archivo CSV en este directorio")
@@ -71,15 +70,31 @@ def main():
                 client.benchmark_polars()
             return
     
-    # 5. Procesar archivo
-    if csv_file:
+    # 5. Procesar archivos
+    if len(csv_files) > 1:
+        # Varios archivos en un solo request: los LEGAJOs compartidos se consultan una vez
+        print(f"\n[PROCESO] Procesando {len(csv_files)} archivos juntos")
+        result = client.process_csv_batch(
+            file_paths=csv_files,
+            target_column=CSV_CONFIG["target_column"],
+            data_start_row=CSV_CONFIG["data_start_row"]
+        )
+        
+        if result:
+            print(f"\n[GRAFICO] Resumen final:")
+            print(f"   • {result['matched_count']:,} de {result['processed_count']:,} registros completados")
+            print(f"   • Tiempo total: {result['execution_time']:.2f} segundos")
+            if result['execution_time']:
+                print(f"   • Velocidad: {result['processed_count']/result['execution_time']:,.0f} registros/seg")
+    elif csv_files:
+        csv_file = csv_files[0]
         print(f"\n[PROCESO] Procesando: {csv_file}")
         
-        result = client.process_csv_file(
+        # Como trabajo asíncrono: archivos grandes no dependen del timeout de la conexión HTTP
+        result = client.process_csv_job(
             file_path=csv_file,
             target_column=CSV_CONFIG["target_column"],
-            data_start_row=CSV_CONFIG["data_start_row"],
-            use_streaming=CSV_CONFIG["use_streaming"]
+            data_start_row=CSV_CONFIG["data_start_row"]
         )
         
         if result and result.get('file_path'):
@@ -91,4 +106,4 @@ def main():
             print(f"   • Velocidad: {result['processed_count']/result['execution_time']:,.0f} registros/seg")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
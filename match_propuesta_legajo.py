@@ -7,29 +7,22 @@ y llenar automáticamente la columna CLIENTE
 import polars as pl
 import fdb
 import os
+import sys
 from config import DATABASE_CONFIG
+import query_catalog
+from fill_engine import read_template, template_paths, processed_path, DEFAULT_TEMPLATE, build_header_index, extract_legajos, results_to_frame, apply_fill, LEGAJO, ROW_IDX
 
-def read_csv_robust():
+def read_csv_robust(csv_file=DEFAULT_TEMPLATE):
     """Lee el CSV real de manera robusta"""
-    print("[LECTURA] Leyendo ORDEN DE VENTA CUA.csv...")
-    
-    csv_file = "ORDEN DE VENTA CUA.csv"
+    print(f"[LECTURA] Leyendo {csv_file}...")
     
     if not os.path.exists(csv_file):
-        print("[ERROR] No se encontró ORDEN DE VENTA CUA.csv")
+        print(f"[ERROR] No se encontró {csv_file}")
         return None
     
     try:
         # Leer con configuración robusta para CSV irregular
-        df = pl.read_csv(
-            csv_file,
-            separator=',',  # CSV separado por COMAS
-            has_header=False,
-            truncate_ragged_lines=True,  # Arregla líneas irregulares
-            ignore_errors=True,
-            infer_schema_length=0,  # Todo como string
-            encoding='utf-8'
-        )
+        df = read_template(csv_file)
         
         print(f"[OK] CSV leído: {df.height} filas x {df.width} columnas")
         return df
@@ -46,33 +39,27 @@ def extract_propuestas_from_csv(df):
         print("[ERROR] CSV no tiene columna B")
         return []
     
-    # Usar el nombre real de la columna B (segunda columna)
-    column_b_name = df.columns[1]
-    col_b = df.get_column(column_b_name)
-    
-    print(f"[INFO] Extrayendo de columna '{column_b_name}'")
+    # Columna de PROPUESTA JKM según el encabezado (columna B si no aparece)
+    column_b_index = build_header_index(df).get("PROPUESTA JKM", 1)
+    column_b_name = df.columns[column_b_index]
     
     # Revisar desde fila 11 (índice 10) - DESPUÉS de "PROPUESTA JKM"
     # Las filas 5-9 son solo ejemplos/plantillas, los datos reales empiezan en fila 11
     start_row = 10
     
-    propuestas = []
-    
     print(f"[INFO] Extrayendo de columna '{column_b_name}'")
     print(f"[INFO] Revisando desde fila {start_row + 1}...")
     
-    for i in range(start_row, min(df.height, start_row + 100)):  # Revisar 100 filas
-        if i < len(col_b):
-            val = col_b[i]
-            if val is not None:
-                val_str = str(val).strip()
-                
-                # Filtrar solo valores que parecen números (LEGAJO/PROPUESTA)
-                # Aceptar números puros de 4+ dígitos
-                if val_str and val_str.isdigit() and len(val_str) >= 4:
-                    propuestas.append(val_str)
-                    print(f"  Fila {i+1}: '{val_str}'")
+    # Solo números puros de 4+ dígitos (LEGAJO/PROPUESTA), revisando 100 filas
+    found = (
+        extract_legajos(df, start_row=start_row, column_index=column_b_index)
+        .filter(pl.col(ROW_IDX) < start_row + 100)
+    )
+    
+    for row_idx, legajo in found.iter_rows():
+        print(f"  Fila {row_idx + 1}: '{legajo}'")
     
+    propuestas = found.get_column(LEGAJO).to_list()
     print(f"[RESULTADO] {len(propuestas)} propuestas encontradas")
     return propuestas
 
@@ -93,47 +80,31 @@ def search_legajos_in_database(propuestas):
             charset=DATABASE_CONFIG["charset"]
         )
         
-        # Tu consulta SQL real (simplificada para testing)
-        query = """
-        SELECT DISTINCT 
-            p.LEGAJO AS COD_PROPUESTA,
-            c.NOMBRE as Nombre_Cliente,
-            s.NOMBRE AS SUCURSAL,
-            CR.MONTO,
-            ct.FECHA as FECHA_CONTRATO
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        WHERE p.LEGAJO = ?
-        """
-        
-        cursor = con.cursor()
+        # Campos del catálogo (ver field_mapping.FIELDS); una consulta IN por lote
+        fields = ["nombre_cliente", "sucursal", "monto", "fecha_contrato"]
         matches = {}
         
         print(f"[INFO] Probando {len(propuestas)} propuestas...")
         
+        try:
+            records = query_catalog.fetch_lookup(con, propuestas, fields)
+        except Exception as e:
+            print(f"  [ERROR] Consulta: {e}")
+            records = {}
+        
         for propuesta in propuestas:
-            try:
-                cursor.execute(query, (propuesta,))
-                result = cursor.fetchone()
-                
-                if result:
-                    matches[propuesta] = {
-                        'legajo': result[0],
-                        'cliente': result[1],
-                        'sucursal': result[2],
-                        'monto': result[3],
-                        'fecha': result[4]
-                    }
-                    print(f"  [MATCH] {propuesta} -> {result[1]}")
-                else:
-                    print(f"  [NO MATCH] {propuesta}")
-                    
-            except Exception as e:
-                print(f"  [ERROR] {propuesta}: {e}")
+            record = records.get(propuesta)
+            if record:
+                matches[propuesta] = {
+                    'legajo': propuesta,
+                    'cliente': record['nombre_cliente'],
+                    'sucursal': record['sucursal'],
+                    'monto': record['monto'],
+                    'fecha': record['fecha_contrato']
+                }
+                print(f"  [MATCH] {propuesta} -> {record['nombre_cliente']}")
+            else:
+                print(f"  [NO MATCH] {propuesta}")
         
         con.close()
         
@@ -152,8 +123,9 @@ def fill_cliente_column(df, matches):
         print("[ERROR] No hay matches para llenar")
         return df
     
-    # Encontrar la columna CLIENTE (debería ser la columna F, índice 5)
-    cliente_col_index = 5  # Columna F según tu estructura
+    # Encontrar las columnas por sus encabezados (CLIENTE debería ser la columna F, índice 5)
+    header_index = build_header_index(df)
+    cliente_col_index = header_index.get("CLIENTE", 5)
     
     # Verificar que existe la columna
     if df.width <= cliente_col_index:
@@ -164,40 +136,16 @@ def fill_cliente_column(df, matches):
     cliente_col_name = df.columns[cliente_col_index]
     print(f"[INFO] Actualizando columna '{cliente_col_name}' (índice {cliente_col_index})")
     
-    # Obtener valores actuales de la columna CLIENTE
-    current_values = df.get_column(cliente_col_name).to_list()
-    
-    # Obtener valores de la columna PROPUESTA (columna B)
-    propuesta_col_name = df.columns[1]  # Columna B
-    col_b = df.get_column(propuesta_col_name)
-    
-    updates_count = 0
-    
-    # Recorrer y actualizar desde fila 11 (después de "PROPUESTA JKM")
-    for i in range(10, min(df.height, len(col_b))):  # Desde fila 11
-        if i < len(col_b):
-            propuesta = str(col_b[i]).strip()
-            
-            if propuesta in matches:
-                if i < len(current_values):
-                    # Solo actualizar si está vacío o es placeholder
-                    current_val = str(current_values[i]).strip()
-                    if not current_val or current_val in ['', 'CLIENTE', 'nan', 'None']:
-                        current_values[i] = matches[propuesta]['cliente']
-                        updates_count += 1
-                        print(f"  Fila {i+1}: LEGAJO '{propuesta}' -> '{matches[propuesta]['cliente']}'")
-                    else:
-                        print(f"  Fila {i+1}: LEGAJO '{propuesta}' ya tiene cliente: '{current_val}' (no sobrescrito)")    
-    # Actualizar el DataFrame
     try:
-        # Asegurar que la lista tiene el tamaño correcto
-        while len(current_values) < df.height:
-            current_values.append("")
+        # Desde fila 11 (después de "PROPUESTA JKM"), solo celdas vacías o placeholders
+        legajos = extract_legajos(df, start_row=10, column_index=header_index.get("PROPUESTA JKM", 1))
+        results = results_to_frame(matches, ['cliente'])
+        df, stats = apply_fill(df, legajos, results, {cliente_col_name: 'cliente'})
         
-        # Reemplazar la columna
-        df = df.with_columns([
-            pl.Series(name=cliente_col_name, values=current_values[:df.height])
-        ])
+        updates_count = stats['filled'][cliente_col_name]
+        not_overwritten = stats['matched_rows'] - updates_count
+        if not_overwritten:
+            print(f"[INFO] {not_overwritten} filas ya tenían cliente (no sobrescritas)")
         
         print(f"[OK] {updates_count} registros actualizados en columna CLIENTE")
         return df
@@ -206,12 +154,12 @@ def fill_cliente_column(df, matches):
         print(f"[ERROR] Actualizando DataFrame: {e}")
         return df
 
-def save_processed_csv(df):
-    """Guarda el CSV procesado"""
+def save_processed_csv(df, csv_file=DEFAULT_TEMPLATE):
+    """Guarda el CSV procesado junto al original como <nombre>_PROCESADO.csv"""
     print("[GUARDADO] Guardando CSV procesado...")
     
     try:
-        output_file = "ORDEN DE VENTA CUA_PROCESADO.csv"
+        output_file = processed_path(csv_file)
         
         df.write_csv(
             output_file,
@@ -225,12 +173,12 @@ def save_processed_csv(df):
         print(f"[ERROR] Guardando archivo: {e}")
         return None
 
-def main():
+def process_file(csv_file):
     print("MATCH PROPUESTA-LEGAJO Y LLENADO AUTOMATICO")
     print("=" * 60)
     
     # 1. Leer CSV
-    df = read_csv_robust()
+    df = read_csv_robust(csv_file)
     if df is None:
         return
     
@@ -253,7 +201,7 @@ def main():
     df_updated = fill_cliente_column(df, matches)
     
     # 5. Guardar archivo procesado
-    output_file = save_processed_csv(df_updated)
+    output_file = save_processed_csv(df_updated, csv_file)
     
     if output_file:
         print(f"\n{'=' * 60}")
@@ -270,5 +218,11 @@ def main():
     else:
         print("\n[ERROR] No se pudo completar el proceso")
 
+def main():
+    # Uso: python match_propuesta_legajo.py [archivo.csv ...] (por defecto ORDEN DE VENTA CUA.csv)
+    # Para varios archivos con una sola consulta a la BD ver multi_template.py
+    for csv_file in template_paths(sys.argv[1:]):
+        process_file(csv_file)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
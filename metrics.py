@@ -0,0 +1,241 @@
+"""
+Métricas del servicio en el formato de texto de Prometheus (versión 0.0.4)
+Contadores, gauges e histogramas con etiquetas, seguros entre threads y sin dependencias
+externas. Las métricas se definen todas aquí; GET /metrics devuelve `render()`.
+
+Los valores que ya llevan otros módulos (pool, trabajos, cachés) no se duplican: se leen
+al momento del scrape con funciones registradas con `add_collector`.
+"""
+
+import logging
+import math
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tipo de contenido de la respuesta de /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette agrega el charset
+
+# Límites de los histogramas de latencia (segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Tamaños de lote que se usan como etiqueta: cada lote cuenta en el menor límite que lo contiene
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 1500, 2500, 5000, 10000)
+
+# Familia de un colector: (nombre, tipo, ayuda, [(etiquetas, valor), ...])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def size_bucket(size: int) -> str:
+    """Etiqueta acotada para un tamaño de lote (el menor límite de BATCH_SIZE_BUCKETS que lo contiene)"""
+    for bound in BATCH_SIZE_BUCKETS:
+        if size <= bound:
+            return str(bound)
+    return "+Inf"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {', '.join(self.labelnames) or '(ninguna)'}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Metric):
+    """Valor que solo crece (peticiones, filas, bytes)"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError(f"{self.name}: un contador no puede bajar")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Valor que sube y baja (última velocidad medida, tamaño de una cola)"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    """Distribución de observaciones en límites fijos (acumulados al exponer, como pide Prometheus)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Conteo por límite (sin acumular) + el de +Inf, suma y total
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, {"counts": list(state["counts"]), "sum": state["sum"], "count": state["count"]})
+                           for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip([*self.buckets, math.inf], state["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {state['count']}")
+        return lines
+
+
+class Registry:
+    """Conjunto de métricas y colectores que se exponen juntos"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labels: Sequence[str], **options) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labels, **options)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labels):
+                raise ValueError(f"La métrica {name} ya existe con otro tipo o etiquetas")
+            return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def add_collector(self, collect: Callable[[], Iterable[Family]]):
+        """`collect()` devuelve familias calculadas al momento del scrape (ver `Family`)"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        blocks = []
+        for metric in metrics:
+            blocks.append([f"# HELP {metric.name} {metric.documentation}",
+                           f"# TYPE {metric.name} {metric.kind}", *metric.lines()])
+        for collect in collectors:
+            try:
+                families = list(collect())
+            except Exception as e:
+                # Un colector con error no debe dejar sin métricas al resto
+                logger.error(f"Error en colector de métricas {getattr(collect, '__name__', collect)}: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                blocks.append([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}",
+                               *(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)])
+        return "\n".join(line for block in blocks for line in block) + "\n"
+
+
+REGISTRY = Registry()
+
+# HTTP
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta (hasta el inicio de la respuesta)",
+    ["method", "route", "status"]
+)
+
+# Firebird
+DB_STATEMENT_SECONDS = REGISTRY.histogram(
+    "db_statement_duration_seconds", "Ejecución de cada sentencia del catálogo (sin leer el resultado)", ["query"]
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_duration_seconds", "Consulta de un lote de LEGAJOs incluyendo la lectura de filas",
+    ["query", "batch_size"]
+)
+DB_ROWS_FETCHED = REGISTRY.counter("db_rows_fetched_total", "Filas leídas de la BD", ["query"])
+
+# Caché persistente de LEGAJOs
+LOOKUP_CACHE_REQUESTS = REGISTRY.counter(
+    "lookup_cache_requests_total", "LEGAJOs buscados en la caché persistente por resultado", ["result"]
+)
+
+# Procesamiento de CSV
+CSV_FILES = REGISTRY.counter("csv_files_processed_total", "CSV procesados por resultado", ["result"])
+CSV_ROWS = REGISTRY.counter("csv_rows_processed_total", "Filas con LEGAJO procesadas")
+CSV_MATCHED_ROWS = REGISTRY.counter("csv_rows_matched_total", "Filas llenadas con datos de la BD")
+CSV_SECONDS = REGISTRY.histogram("csv_processing_duration_seconds", "Tiempo de procesamiento por CSV")
+CSV_ROWS_PER_SECOND = REGISTRY.gauge("csv_rows_per_second", "Filas por segundo del último CSV procesado")
+CSV_BYTES_READ = REGISTRY.counter("csv_bytes_read_total", "Bytes de los CSV de entrada procesados")
+CSV_BYTES_WRITTEN = REGISTRY.counter("csv_bytes_written_total", "Bytes de los CSV generados")
+
+
+def observe_query(query: str, batch_size: int, seconds: float, rows: int):
+    """Registra un lote consultado: latencia por consulta y tamaño de lote, y filas leídas"""
+    DB_QUERY_SECONDS.observe(seconds, query=query, batch_size=size_bucket(batch_size))
+    DB_ROWS_FETCHED.inc(rows, query=query)
+
+
+def render() -> str:
+    return REGISTRY.render()
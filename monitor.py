@@ -3,18 +3,41 @@ import time
 import os
 import polars as pl
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 import threading
 import json
 
+def current_process() -> Optional[psutil.Process]:
+    """Proceso actual para medir memoria y CPU (None si psutil no puede leerlo)"""
+    try:
+        return psutil.Process()
+    except psutil.Error:
+        return None
+
+def process_usage(process: Optional[psutil.Process]) -> Dict[str, float]:
+    """Memoria RSS, CPU y threads de `process`; ceros si no se puede leer
+    
+    `cpu_percent` es el uso desde la llamada anterior con el mismo `process` (la primera da 0).
+    """
+    usage = {'memory_mb': 0.0, 'cpu_percent': 0.0, 'cpu_seconds': 0.0, 'threads': 0, 'started_at': 0.0}
+    if process:
+        try:
+            with process.oneshot():
+                usage['memory_mb'] = process.memory_info().rss / 1024 / 1024
+                usage['cpu_percent'] = process.cpu_percent()
+                cpu_times = process.cpu_times()
+                usage['cpu_seconds'] = cpu_times.user + cpu_times.system
+                usage['threads'] = process.num_threads()
+                usage['started_at'] = process.create_time()
+        except psutil.Error:
+            pass
+    return usage
+
 class SystemMonitor:
     """Monitor del sistema en tiempo real"""
     
     def __init__(self):
-        try:
-            self.process = psutil.Process()
-        except:
-            self.process = None
+        self.process = current_process()
         self.start_time = time.time()
         self.stats = {
             'files_processed': 0,
@@ -49,18 +72,12 @@ class SystemMonitor:
         """Actualiza estadísticas del sistema"""
         current_stats = {'memory_mb': 0, 'cpu_percent': 0, 'uptime_minutes': 0}
         
-        # Memoria actual
-        if self.process:
-            try:
-                memory_mb = self.process.memory_info().rss / 1024 / 1024
-                if memory_mb > self.stats['peak_memory_mb']:
-                    self.stats['peak_memory_mb'] = memory_mb
-                current_stats['memory_mb'] = memory_mb
-                
-                # CPU actual
-                current_stats['cpu_percent'] = self.process.cpu_percent()
-            except:
-                pass
+        # Memoria y CPU actuales
+        usage = process_usage(self.process)
+        current_stats['memory_mb'] = usage['memory_mb']
+        current_stats['cpu_percent'] = usage['cpu_percent']
+        if usage['memory_mb'] > self.stats['peak_memory_mb']:
+            self.stats['peak_memory_mb'] = usage['memory_mb']
         
         # Tiempo de actividad
         current_stats['uptime_minutes'] = (time.time() - self.start_time) / 60
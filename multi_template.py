@@ -0,0 +1,256 @@
+"""
+Llenado de varios templates CSV en una sola pasada por la BD
+1. Cada template se lee y se le extraen los LEGAJOs (en paralelo, un proceso por archivo)
+2. Los LEGAJOs de todos los archivos se juntan sin repetir y se consultan una sola vez
+3. Cada template se llena con su parte de los resultados y se escribe (en paralelo)
+
+Los workers solo importan fill_engine y Polars, así arrancan rápido con spawn. A cada
+proceso se le pasan rutas y los resultados de sus LEGAJOs, no los DataFrames completos:
+el template se vuelve a leer al llenarlo en lugar de copiarlo entre procesos.
+
+Uso:
+    python multi_template.py "ORDEN*.csv" otro.csv [--output-dir salida] [--workers 4]
+                             [--mapping '{"CLIENTE": "nombre_cliente"}']
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import polars as pl
+
+import fill_engine
+import field_mapping
+from config import CSV_CONFIG, FILL_MAPPING, MULTI_FILE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Muestra de LEGAJOs sin datos que se guarda en el resumen de cada archivo
+UNMATCHED_SAMPLE = 20
+
+# lookup(legajos, campos, errores) -> DataFrame de resultados (ver fill_engine.results_to_frame)
+Lookup = Callable[[List[str], List[str], List[str]], pl.DataFrame]
+
+
+def scan_template(file_path: str, data_start_row: int = 11, propuesta_column: str = "B") -> List[str]:
+    """LEGAJOs distintos de un template (worker: se ejecuta en un proceso aparte)"""
+    df = fill_engine.read_template(file_path, header_rows=max(data_start_row - 1, 1))
+    legajos = fill_engine.extract_legajos(
+        df,
+        start_row=max(0, data_start_row - 1),
+        column_index=fill_engine.column_letter_to_index(propuesta_column)
+    )
+    return fill_engine.unique_legajos(legajos)
+
+
+def fill_template(file_path: str, output_path: str, results: pl.DataFrame, mapping: Mapping[str, str],
+                  data_start_row: int = 11, propuesta_column: str = "B") -> Dict[str, Any]:
+    """Llena un template con `results` y lo escribe en `output_path` (worker)
+
+    Mismo criterio que CSVProcessor: encabezados buscados en las filas previas a los datos,
+    sin respaldo por posición y sobrescribiendo las celdas con dato en BD.
+    """
+    start = time.time()
+    df = fill_engine.read_template(file_path, header_rows=max(data_start_row - 1, 1))
+    legajos = fill_engine.extract_legajos(
+        df,
+        start_row=max(0, data_start_row - 1),
+        column_index=fill_engine.column_letter_to_index(propuesta_column)
+    )
+    header_index = fill_engine.build_header_index(
+        df,
+        header_rows=max(data_start_row - 1, 1),
+        names=[*mapping, *fill_engine.TEMPLATE_HEADERS]
+    )
+    column_map = fill_engine.resolve_fill_mapping(df, header_index, mapping, fallbacks={})
+    df, stats = fill_engine.apply_fill(df, legajos, results, column_map, overwrite=True)
+    df.write_csv(output_path, include_header=False)
+
+    unmatched = fill_engine.unmatched_legajos(legajos, results)
+    return {
+        "rows": df.height,
+        "processed_count": legajos.height,
+        "matched_count": stats["matched_rows"],
+        "filled": {field: stats["filled"][column] for column, field in column_map.items()},
+        "unmatched_count": len(unmatched),
+        "unmatched": unmatched[:UNMATCHED_SAMPLE],
+        "file_path": output_path,
+        "fill_time": time.time() - start,
+    }
+
+
+def _submit(executor: Optional[Executor], func: Callable, *args) -> Future:
+    """Envía `func` al ejecutor o la corre en el momento si no hay (mismo manejo de errores)"""
+    if executor is not None:
+        return executor.submit(func, *args)
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def process_templates(file_paths: List[str], lookup: Lookup, mapping: Mapping[str, str],
+                      data_start_row: int = 11, propuesta_column: str = "B",
+                      output_dir: Optional[str] = None,
+                      executor: Optional[Executor] = None) -> Dict[str, Any]:
+    """Llena todos los templates de `file_paths` con una sola consulta de los LEGAJOs de todos
+
+    Lectura y llenado de cada archivo van a `executor` (sin ejecutor, uno tras otro en este
+    thread). Un archivo que falla no frena a los demás: queda con `success=False` y su error.
+
+    Devuelve `{"files": [resumen por archivo, en el orden recibido], ...totales}`.
+    """
+    start = time.time()
+    fields = field_mapping.mapping_fields(mapping)
+    errors: List[str] = []
+    summaries = [{"file": path, "success": False, "errors": []} for path in file_paths]
+
+    # 1. LEGAJOs de cada archivo
+    scans = [_submit(executor, scan_template, path, data_start_row, propuesta_column) for path in file_paths]
+    file_legajos: Dict[int, List[str]] = {}
+    for i, scan in enumerate(scans):
+        try:
+            file_legajos[i] = scan.result()
+            summaries[i]["unique_count"] = len(file_legajos[i])
+        except Exception as e:
+            logger.error(f"Error leyendo {file_paths[i]}: {str(e)}")
+            summaries[i]["errors"].append(f"Error leyendo el archivo: {str(e)}")
+    scan_time = time.time() - start
+
+    # 2. Una sola consulta para los LEGAJOs de todos los archivos
+    all_legajos = pl.DataFrame(
+        {fill_engine.LEGAJO: [legajo for legajos in file_legajos.values() for legajo in legajos]},
+        schema={fill_engine.LEGAJO: pl.Utf8}
+    )
+    unique = fill_engine.unique_legajos(all_legajos)
+    logger.info(f"{len(file_legajos)} archivos, {all_legajos.height} LEGAJOs por archivo, {len(unique)} distintos")
+    lookup_start = time.time()
+    results = pl.DataFrame(schema=fill_engine.results_schema(fields))
+    if unique:
+        try:
+            results = lookup(unique, fields, errors)
+        except Exception as e:
+            # Sin la consulta completa ningún archivo se llena: quedan todos con el error
+            logger.error(f"Error consultando los LEGAJOs: {str(e)}")
+            errors.append(str(e))
+            for i in file_legajos:
+                summaries[i]["errors"].append(f"Error consultando la BD: {str(e)}")
+            file_legajos = {}
+    lookup_time = time.time() - lookup_start
+
+    # 3. Llenado y escritura; cada proceso recibe solo los resultados de su archivo
+    fill_start = time.time()
+    fills = {}
+    for i, legajos in file_legajos.items():
+        keys = pl.DataFrame({fill_engine.LEGAJO: legajos}, schema={fill_engine.LEGAJO: pl.Utf8})
+        subset = results.join(keys, on=fill_engine.LEGAJO, how="semi")
+        output_path = fill_engine.processed_path(file_paths[i], "_processed", output_dir)
+        fills[i] = _submit(executor, fill_template, file_paths[i], output_path, subset, dict(mapping),
+                           data_start_row, propuesta_column)
+    for i, fill in fills.items():
+        try:
+            summaries[i].update(fill.result(), success=True)
+        except Exception as e:
+            logger.error(f"Error llenando {file_paths[i]}: {str(e)}")
+            summaries[i]["errors"].append(f"Error llenando el archivo: {str(e)}")
+    fill_time = time.time() - fill_start
+
+    return {
+        "success": all(summary["success"] for summary in summaries),
+        "files": summaries,
+        "processed_count": sum(summary.get("processed_count", 0) for summary in summaries),
+        "matched_count": sum(summary.get("matched_count", 0) for summary in summaries),
+        "unique_count": len(unique),
+        # LEGAJOs que se habrían consultado de más procesando cada archivo por separado
+        "shared_count": all_legajos.height - len(unique),
+        "errors": errors,
+        "scan_time": scan_time,
+        "lookup_time": lookup_time,
+        "fill_time": fill_time,
+        "execution_time": time.time() - start,
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    """Tabla por archivo y totales de `process_templates`"""
+    print("\n[RESUMEN] Resultado por archivo:")
+    for item in summary["files"]:
+        name = os.path.basename(item["file"])
+        if not item["success"]:
+            print(f"   [X] {name}: {'; '.join(item['errors'])}")
+            continue
+        filled = ", ".join(f"{field}={count:,}" for field, count in item["filled"].items())
+        print(f"   [OK] {name}: {item['processed_count']:,} filas con LEGAJO, "
+              f"{item['matched_count']:,} con datos, {item['unmatched_count']:,} LEGAJOs sin datos "
+              f"({filled}) en {item['fill_time']:.2f}s -> {item['file_path']}")
+
+    print(f"\n[STATS] {len(summary['files'])} archivos, {summary['unique_count']:,} LEGAJOs consultados "
+          f"({summary['shared_count']:,} compartidos entre archivos)")
+    print(f"[STATS] Filas: {summary['processed_count']:,} con LEGAJO, {summary['matched_count']:,} con datos")
+    print(f"[TIEMPO] Lectura {summary['scan_time']:.2f}s, BD {summary['lookup_time']:.2f}s, "
+          f"llenado {summary['fill_time']:.2f}s, total {summary['execution_time']:.2f}s")
+    for error in summary["errors"]:
+        print(f"[WARN] {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Llena varios templates CSV con una sola consulta a la BD")
+    parser.add_argument("files", nargs="+", help="Templates CSV (se aceptan comodines)")
+    parser.add_argument("--output-dir", help="Carpeta de los CSV procesados (por defecto junto a cada original)")
+    parser.add_argument("--workers", type=int, default=MULTI_FILE_CONFIG["workers"],
+                        help="Procesos para leer y llenar archivos (0 = sin procesos aparte)")
+    parser.add_argument("--mapping", help="Mapeo encabezado -> campo en JSON (por defecto FILL_MAPPING)")
+    parser.add_argument("--data-start-row", type=int, default=CSV_CONFIG["data_start_row"])
+    parser.add_argument("--propuesta-column", default=CSV_CONFIG["propuesta_column"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    paths = fill_engine.template_paths(args.files, default=None)
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing or not paths:
+        print(f"[ERROR] No se encontraron los archivos: {', '.join(missing or args.files)}")
+        sys.exit(1)
+    try:
+        mapping = field_mapping.validate_mapping(json.loads(args.mapping) if args.mapping else FILL_MAPPING)
+    except ValueError as e:
+        print(f"[ERROR] Mapeo inválido: {str(e)}")
+        sys.exit(1)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    # Import diferido: los workers (spawn) importan este módulo y no necesitan fdb ni FastAPI
+    from config import DATABASE_CONFIG
+    from main import CSVProcessor, DatabaseConfig, FirebirdManager
+
+    manager = FirebirdManager(DatabaseConfig(**DATABASE_CONFIG))
+    processor = CSVProcessor(manager)
+    print(f"[INICIO] {len(paths)} archivos, {max(args.workers, 1)} procesos, campos: "
+          f"{', '.join(field_mapping.mapping_fields(mapping))}")
+
+    executor = None
+    if args.workers > 0:
+        # spawn: hacer fork de un proceso con threads de Polars puede bloquear al hijo
+        executor = ProcessPoolExecutor(max_workers=min(args.workers, len(paths)),
+                                       mp_context=multiprocessing.get_context("spawn"))
+    try:
+        summary = process_templates(paths, processor.lookup_results, mapping, args.data_start_row,
+                                    args.propuesta_column, args.output_dir, executor)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        manager.pool.close()
+
+    print_summary(summary)
+    sys.exit(0 if summary["success"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,28 +7,25 @@ Reduce de 2511 consultas a ~25 consultas batch
 import polars as pl
 import fdb
 import os
+import sys
 import time
-from config import DATABASE_CONFIG
+from config import DATABASE_CONFIG, FETCH_CONFIG, FILL_MAPPING
+from lookup_cache import get_lookup_cache
+from fill_engine import read_template, template_paths, processed_path, DEFAULT_TEMPLATE, build_header_index, resolve_fill_mapping, extract_legajos, results_to_frame, apply_fill, unique_legajos, LEGAJO
+from field_mapping import rows_to_records, mapping_fields
+import query_catalog
+from batch_controller import lookup_controller
 
-def process_csv_optimized():
+def process_csv_optimized(csv_file=DEFAULT_TEMPLATE):
     """Procesa el CSV con consultas batch optimizadas"""
     print("PROCESADOR CSV ULTRA-OPTIMIZADO")
     print("=" * 60)
-    
-    csv_file = "ORDEN DE VENTA CUA.csv"
+    print(f"[ARCHIVO] {csv_file}")
     
     # 1. Leer CSV
     print("[1/4] Leyendo CSV...")
     try:
-        df = pl.read_csv(
-            csv_file,
-            separator=',',
-            has_header=False,
-            truncate_ragged_lines=True,
-            ignore_errors=True,
-            infer_schema_length=0,
-            encoding='utf-8'
-        )
+        df = read_template(csv_file)
         print(f"[OK] {df.height} filas x {df.width} columnas")
     except Exception as e:
         print(f"[ERROR] {e}")
@@ -36,22 +33,27 @@ def process_csv_optimized():
     
     # 2. Extraer LEGAJOs
     print("[2/4] Extrayendo LEGAJOs...")
-    column_b_name = df.columns[1]
-    col_b = df.get_column(column_b_name)
-    
-    legajos = []
-    for i in range(10, df.height):  # Desde fila 11
-        val = col_b[i]
-        if val is not None:
-            val_str = str(val).strip()
-            if val_str and val_str.isdigit() and len(val_str) >= 4:
-                legajos.append(val_str)
+    # Encabezados del template (filas 1-10) resueltos una sola vez
+    header_index = build_header_index(df, names=[*FILL_MAPPING, "PROPUESTA JKM"])
+    legajo_rows = extract_legajos(df, start_row=10, column_index=header_index.get("PROPUESTA JKM", 1))  # Desde fila 11
+    # Consultar cada LEGAJO una sola vez; el llenado lo replica en todas sus filas
+    legajos = unique_legajos(legajo_rows)
     
-    print(f"[OK] {len(legajos)} LEGAJOs encontrados")
+    print(f"[OK] {legajo_rows.height} LEGAJOs encontrados ({len(legajos)} únicos)")
     
     # 3. Consultar base de datos con BATCH OPTIMIZADO
     print("[3/4] Consultando base de datos (BATCH OPTIMIZADO)...")
     
+    # Una sola consulta trae todos los campos del mapeo (y solo esos)
+    fields = mapping_fields(FILL_MAPPING)
+    
+    # Solo van a Firebird los LEGAJOs que no están en la caché persistente
+    cache = get_lookup_cache()
+    cache_namespace = f"{DATABASE_CONFIG['host']}:{DATABASE_CONFIG['database_path']}|campos:{','.join(fields)}"
+    cached = cache.get_many(cache_namespace, legajos) if cache else {}
+    pending = [legajo for legajo in legajos if legajo not in cached]
+    print(f"[CACHE] {len(cached)} LEGAJOs desde caché, {len(pending)} a consultar")
+    
     try:
         con = fdb.connect(
             host=DATABASE_CONFIG["host"],
@@ -61,181 +63,61 @@ def process_csv_optimized():
             charset=DATABASE_CONFIG["charset"]
         )
         
-        cursor = con.cursor()
         matches = {}
         
-        # OPTIMIZACIÓN: Consultas batch de 100 LEGAJOs por vez
-        batch_size = 100
-        total_batches = (len(legajos) + batch_size - 1) // batch_size
+        # OPTIMIZACIÓN: Consultas batch; el tamaño se ajusta a la latencia de cada lote
+        controller = lookup_controller("in_list", fields)
+        offset = 0
+        batch_num = 0
         
-        print(f"[INFO] Procesando {total_batches} lotes de {batch_size} LEGAJOs...")
-        print("[INFO] Esto será ~25x más rápido que consultas individuales")
+        print(f"[INFO] Procesando {len(pending)} LEGAJOs en lotes adaptativos...")
+        print(f"[INFO] Campos: {', '.join(fields)}")
         
-        for i in range(0, len(legajos), batch_size):
-            batch = legajos[i:i+batch_size]
-            batch_num = i//batch_size + 1
+        while offset < len(pending):
+            batch_size = controller.next_size() if controller else FETCH_CONFIG["batch_size"]
+            batch = pending[offset:offset + batch_size]
+            offset += len(batch)
+            batch_num += 1
             
-            print(f"  Lote {batch_num}/{total_batches}: {len(batch)} LEGAJOs...", end=" ", flush=True)
+            print(f"  Lote {batch_num} ({offset}/{len(pending)}): {len(batch)} LEGAJOs...", end=" ", flush=True)
             
             start_time = time.time()
             
-            # Crear consulta IN() para el lote completo usando tu SQL completa
-            placeholders = ','.join(['?' for _ in batch])
-            
-            batch_query = f"""
-            SELECT DISTINCT 
-                p.LEGAJO AS COD_PROPUESTA,
-                c.NOMBRE as Nombre_Cliente,
-                cc.COD_CLIENTE, 
-                s.NOMBRE AS SUCURSAL, 
-                CR.MONTO,
-                ct.FECHA as FECHA_CONTRATO, 
-                pvm.NOMBRE as nombre_anterior,
-                cc.COD_CONTRATO,
-                ec.ESTADO as ESTADO,
-                TC.NOMBRE AS TIPO_CONTRATO,
-                ed.ESTADO as ESTADO_CREDITO,
-                eq.DESCRIPCION as equipo,
-                vg.NOMBRE as asesor,
-                cart.NOMBRE as Caracter_Titular,
-                c.TELEFONO,
-                c.TELEFONO_MOVIL,
-                c.TELEFONO_LABORAL,
-                pa.LEGAJO AS UBICACION,
-                DOM.COD_DOMICILIO as DIR_CLIENTE,
-                mco.DESCRIPCION as medio_cobro,
-                mco.COD_COBRADOR_ASIGNADO,
-                zc.COD_MODALIDAD_COBRANZA,
-                zc.DESCRIPCION as zona_cobranza,
-                mcd.COD_DOMICILIO as codigo_cobro_dom,
-                DOM.DIRECCION,
-                bar.NOMBRE as barrio,
-                loc.NOMBRE as localidad,
-                prv.NOMBRE as provinca,
-                dom.MANZANA,
-                tx.COD_USUARIO_ALTA,
-                tx.CODIGO_BARRA as cod_barra_oxxo,
-                cb.CLABE as clabe_banco,
-                C.TIPO_DOCUMENTO,
-                C.NRO_DOCUMENTO,
-                C.CUIT AS RFC1,
-                mcb.NRO_CUENTA as medio_cobro_cuenta,
-                mcb.TITULAR as titular_cobro,
-                CASE
-                    WHEN cb.CLABE IS NULL THEN '0'
-                    ELSE 'C.' || CAST(cb.CLABE AS VARCHAR(50))
-                END AS clabe_banco_formatted
-            FROM CONTRATOS_CLIENTES cc
-            INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-            INNER JOIN CARACTER_TITULARES cart ON cart.COD_CARACTER_TITULAR = cc.COD_CARACTER_TITULAR
-            INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-            INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-            INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-            INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-            INNER JOIN ESTADOS_DEUDAS ed ON cr.COD_ESTADO_DEUDA=ed.COD_ESTADO_DEUDA
-            INNER JOIN ESTADOS_CONTRATOS ec ON ct.COD_ESTADO_CONTRATO = ec.COD_ESTADO_CONTRATO
-            INNER JOIN TIPOS_PROPUESTAS TP ON P.COD_TIPO_PROPUESTA=TP.COD_TIPO_PROPUESTA
-            LEFT JOIN CONTRATOS_PARCELAS cp ON ct.COD_CONTRATO=cp.COD_CONTRATO_PARCELA
-            LEFT JOIN parcela pa ON cp.COD_PARCELA=pa.COD_PARCELA
-            LEFT JOIN ESTADOS_PARCELA EP ON EP.COD_ESTADO_PARCELA = PA.COD_ESTADO
-            LEFT JOIN MANZANA ma ON pa.COD_MANZANA=ma.COD_MANZANA
-            LEFT JOIN ZONAS_PARQUES zp ON ma.COD_ZONA_PARQUE=zp.COD_ZONA_PARQUE
-            INNER JOIN vendedor vg ON ct.COD_VENDEDOR=vg.COD_VENDEDOR
-            INNER JOIN EQUIPO_VENDEDORES eq ON vg.COD_EQUIPO=eq.COD_EQUIPO
-            INNER JOIN TIPOS_CONTRATOS TC ON CT.COD_TIPO_CONTRATO=TC.COD_TIPO_CONTRATO
-            LEFT JOIN PLANES_VENTAS_MODELOS pvm ON ct.COD_PLAN_VENTA_MODELO=pvm.COD_PLAN_VENTA_MODELO
-            LEFT JOIN MEDIOS_COBROS mco ON mco.COD_CLIENTE = c.COD_CLIENTE
-            LEFT JOIN ZONA_COBRANZA zc ON zc.COD_ZONA_COBRANZA = mco.COD_ZONA_COBRANZA
-            LEFT JOIN MEDIOS_COBROS_DOMICILIOS mcd ON mcd.COD_MEDIO_COBRO = mco.COD_MEDIO_COBRO
-            LEFT JOIN DOMICILIOS DOM ON dom.COD_DOMICILIO = mcd.COD_DOMICILIO
-            LEFT JOIN BARRIOS bar ON bar.COD_BARRIO = dom.COD_BARRIO
-            LEFT JOIN LOCALIDADES loc ON loc.COD_LOCALIDAD = dom.COD_LOCALIDAD
-            LEFT JOIN PROVINCIAS prv ON prv.COD_PROVINCIA = loc.COD_PROVINCIA
-            LEFT OUTER JOIN TARJETA_OXXO tx ON tx.COD_PROPUESTA = p.COD_PROPUESTA
-            LEFT OUTER JOIN CLABE_BANCARIA cb ON cb.COD_PROPUESTA = p.COD_PROPUESTA
-            LEFT OUTER JOIN MEDIOS_COBROS_BANCOS mcb ON mcb.COD_MEDIO_COBRO = mco.COD_MEDIO_COBRO
-            WHERE p.LEGAJO IN ({placeholders})
-            ORDER BY p.LEGAJO, c.NOMBRE
-            """
-            
             try:
-                cursor.execute(batch_query, batch)
-                results = cursor.fetchall()
+                # Consulta IN() con solo los joins que piden los campos del mapeo; la sentencia
+                # preparada se reutiliza entre lotes de la misma aridad
+                cursor = query_catalog.execute_lookup(con, batch, fields)
                 
-                # Procesar resultados del lote
                 # IMPORTANTE: Tomar solo el PRIMER resultado por LEGAJO
-                batch_matches = 0
-                legajos_processed = set()
-                
-                for result in results:
-                    legajo = str(result[0])
-                    cliente = result[1]
-                    monto = result[4]
-                    
-                    # Solo tomar el primer cliente por LEGAJO
-                    if legajo not in legajos_processed:
-                        matches[legajo] = {
-                            'cliente': cliente,
-                            'caracter': caracter,
-                            'monto':monto,
-                            'fecha_contrato':fecha_contrato
-                        }
-                        legajos_processed.add(legajo)
-                        batch_matches += 1
+                batch_records = rows_to_records(cursor.fetchall(), fields)
+                matches.update(batch_records)
                 
                 elapsed = time.time() - start_time
-                print(f"{batch_matches} matches en {elapsed:.1f}s")
+                print(f"{len(batch_records)} matches en {elapsed:.1f}s")
+                if controller:
+                    controller.record(len(batch), elapsed, len(batch_records))
                 
             except Exception as e:
                 print(f"ERROR: {e}")
+                if controller:
+                    controller.record_failure(len(batch), str(e))
                 
                 # Fallback: procesar individualmente si el batch falla
                 print(f"    Fallback individual para lote {batch_num}...")
                 for legajo in batch:
                     if legajo not in matches:  # Solo si no lo tenemos ya
                         try:
-                            individual_query = """
-                            SELECT DISTINCT p.LEGAJO, c.NOMBRE 
-                            FROM CONTRATOS_CLIENTES cc
-                            INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-                            INNER JOIN CARACTER_TITULARES cart ON cart.COD_CARACTER_TITULAR = cc.COD_CARACTER_TITULAR
-                            INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-                            INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-                            INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-                            INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-                            INNER JOIN ESTADOS_DEUDAS ed ON cr.COD_ESTADO_DEUDA=ed.COD_ESTADO_DEUDA
-                            INNER JOIN ESTADOS_CONTRATOS ec ON ct.COD_ESTADO_CONTRATO = ec.COD_ESTADO_CONTRATO
-                            INNER JOIN TIPOS_PROPUESTAS TP ON P.COD_TIPO_PROPUESTA=TP.COD_TIPO_PROPUESTA
-                            LEFT JOIN CONTRATOS_PARCELAS cp ON ct.COD_CONTRATO=cp.COD_CONTRATO_PARCELA
-                            LEFT JOIN parcela pa ON cp.COD_PARCELA=pa.COD_PARCELA
-                            LEFT JOIN ESTADOS_PARCELA EP ON EP.COD_ESTADO_PARCELA = PA.COD_ESTADO
-                            LEFT JOIN MANZANA ma ON pa.COD_MANZANA=ma.COD_MANZANA
-                            LEFT JOIN ZONAS_PARQUES zp ON ma.COD_ZONA_PARQUE=zp.COD_ZONA_PARQUE
-                            INNER JOIN vendedor vg ON ct.COD_VENDEDOR=vg.COD_VENDEDOR
-                            INNER JOIN EQUIPO_VENDEDORES eq ON vg.COD_EQUIPO=eq.COD_EQUIPO
-                            INNER JOIN TIPOS_CONTRATOS TC ON CT.COD_TIPO_CONTRATO=TC.COD_TIPO_CONTRATO
-                            LEFT JOIN PLANES_VENTAS_MODELOS pvm ON ct.COD_PLAN_VENTA_MODELO=pvm.COD_PLAN_VENTA_MODELO
-                            LEFT JOIN MEDIOS_COBROS mco ON mco.COD_CLIENTE = c.COD_CLIENTE
-                            LEFT JOIN ZONA_COBRANZA zc ON zc.COD_ZONA_COBRANZA = mco.COD_ZONA_COBRANZA
-                            LEFT JOIN MEDIOS_COBROS_DOMICILIOS mcd ON mcd.COD_MEDIO_COBRO = mco.COD_MEDIO_COBRO
-                            LEFT JOIN DOMICILIOS DOM ON dom.COD_DOMICILIO = mcd.COD_DOMICILIO
-                            LEFT JOIN BARRIOS bar ON bar.COD_BARRIO = dom.COD_BARRIO
-                            LEFT JOIN LOCALIDADES loc ON loc.COD_LOCALIDAD = dom.COD_LOCALIDAD
-                            LEFT JOIN PROVINCIAS prv ON prv.COD_PROVINCIA = loc.COD_PROVINCIA
-                            LEFT OUTER JOIN TARJETA_OXXO tx ON tx.COD_PROPUESTA = p.COD_PROPUESTA
-                            LEFT OUTER JOIN CLABE_BANCARIA cb ON cb.COD_PROPUESTA = p.COD_PROPUESTA
-                            LEFT OUTER JOIN MEDIOS_COBROS_BANCOS mcb ON mcb.COD_MEDIO_COBRO = mco.COD_MEDIO_COBRO
-                            WHERE p.LEGAJO = ?
-                            ORDER BY c.NOMBRE
-                            """
-                            cursor.execute(individual_query, (legajo,))
-                            result = cursor.fetchone()  # Solo el primero
+                            result = query_catalog.execute_lookup(con, [legajo], fields).fetchone()  # Solo el primero
                             if result:
-                                matches[legajo] = result[1]
+                                matches.update(rows_to_records([result], fields))
                         except:
                             pass
         
         con.close()
+        
+        if cache:
+            cache.put_many(cache_namespace, matches)
+        matches.update(cached)
         print(f"\n[OK] {len(matches)} matches encontrados total")
         
     except Exception as e:
@@ -245,50 +127,19 @@ def process_csv_optimized():
     # 4. Actualizar CSV
     print("[4/4] Actualizando CSV y guardando...")
     
-    cliente_col_name = df.columns[5]  # Columna F (CLIENTE)
-
-    monto_col_name = df.columns[21]  #Columna V (IMPORTE ORIGINAL)
-
-    fecha_col_name = df.columns[7]   #Columna h (FECHA_CONTRATO)
-
-
-    monto_current_values = df.get_column(monto_col_name).to_list()
-
-
-    fecha_contrato_current_values = df.get_column(fecha_col_name).to_list()
-
-    current_values = df.get_column(cliente_col_name).to_list()
+    # Columnas por encabezado del mapeo; si no aparece se usa la habitual (F, V, H)
+    column_map = resolve_fill_mapping(df, header_index, FILL_MAPPING)
+    cliente_col_name = next(column for column, field in column_map.items() if field == 'nombre_cliente')
     
-    updates_count = 0
+    # Llenado vectorizado: solo celdas vacías o placeholders
+    results = results_to_frame(matches, fields)
+    df, fill_stats = apply_fill(df, legajo_rows, results, column_map)
     
-    for i in range(10, df.height):  # Desde fila 11
-        if i < len(col_b):
-            legajo = str(col_b[i]).strip()
-            
-            if legajo in matches:
-                if i < len(current_values):
-                    current_val = str(current_values[i]).strip()
-                    if not current_val or current_val in ['', 'CLIENTE', 'nan', 'None', 'null']:
-                        current_values[i] = matches[legajo]['cliente']
-                        monto_current_values[i] = matches[legajo]['monto']
-                        fecha_contrato_current_values[i] = matches[legajo]['fecha_contrato']
-                        updates_count += 1
-    
-    # Actualizar DataFrame
-    while len(current_values) < df.height:
-        current_values.append("")
-        monto_current_values.append("")
-        fecha_contrato_current_values.append("")
-
-    df = df.with_columns([
-        pl.Series(name=cliente_col_name, values=current_values[:df.height]),
-        pl.Series(name=monto_col_name, values=monto_current_values[:df.height]),
-        pl.Series(name=fecha_col_name, values=fecha_contrato_current_values[:df.height])
-    ])
+    updates_count = fill_stats['filled'][cliente_col_name]
     
     # Guardar archivo
     try:
-        output_file = "ORDEN DE VENTA CUA_PROCESADO.csv"
+        output_file = processed_path(csv_file)
         df.write_csv(output_file, separator=',')
         print(f"[OK] Archivo guardado: {output_file}")
         
@@ -300,7 +151,8 @@ def process_csv_optimized():
     print(f"\n{'=' * 60}")
     print("RESULTADO FINAL")
     print(f"{'=' * 60}")
-    print(f"LEGAJOs procesados:        {len(legajos):,}")
+    print(f"LEGAJOs procesados:        {legajo_rows.height:,}")
+    print(f"LEGAJOs únicos:            {len(legajos):,}")
     print(f"Encontrados en BD:         {len(matches):,}")
     print(f"Registros actualizados:    {updates_count:,}")
     
@@ -332,33 +184,18 @@ def quick_test():
             charset=DATABASE_CONFIG["charset"]
         )
         
-        cursor = con.cursor()
-        
         print("[TEST] Consulta batch de 10 LEGAJOs...")
         start_time = time.time()
         
-        placeholders = ','.join(['?' for _ in test_legajos])
-        query = f"""
-        SELECT DISTINCT p.LEGAJO, c.NOMBRE 
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        WHERE p.LEGAJO IN ({placeholders})
-        """
-        
-        cursor.execute(query, test_legajos)
-        results = cursor.fetchall()
+        results = query_catalog.fetch_lookup(con, test_legajos, ["nombre_cliente"])
         
         elapsed = time.time() - start_time
         con.close()
         
         print(f"[OK] {len(results)} resultados en {elapsed:.2f} segundos")
         print("Ejemplos encontrados:")
-        for result in results[:5]:
-            print(f"  {result[0]} -> {result[1]}")
+        for legajo, record in list(results.items())[:5]:
+            print(f"  {legajo} -> {record['nombre_cliente']}")
         
         estimated_total = (elapsed * 25)  # 25 lotes aproximadamente
         print(f"\n[ESTIMACION] Tiempo total: ~{estimated_total:.1f} segundos")
@@ -370,6 +207,7 @@ def quick_test():
         return False
 
 def main():
+    # Uso: python optimized_csv_processor.py [archivo.csv ...] (por defecto ORDEN DE VENTA CUA.csv)
     print("SELECCIONA OPCION:")
     print("1. Prueba rápida (10 LEGAJOs)")
     print("2. Procesamiento completo (2511 LEGAJOs)")
@@ -382,7 +220,8 @@ def main():
     elif choice == "2":
         print("\n[INFO] Iniciando procesamiento completo...")
         print("[INFO] Esto puede tomar 2-5 minutos...")
-        process_csv_optimized()
+        for csv_file in template_paths(sys.argv[1:]):
+            process_csv_optimized(csv_file)
     else:
         print("Opción inválida")
 
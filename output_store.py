@@ -0,0 +1,200 @@
+"""
+Almacén de CSV procesados para descarga por el API
+Cada resultado se guarda con un id; una política de retención y de cuota de disco
+borra los más antiguos para que la carpeta no crezca sin límite
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from config import OUTPUT_CONFIG
+
+try:
+    import zstandard
+except ImportError:  # Compresión zstd opcional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = {
+    # nombre: (media type, extensión)
+    "gzip": ("application/gzip", ".gz"),
+    "zstd": ("application/zstd", ".zst"),
+}
+
+
+class OutputStore:
+    """Resultados en `directory` como `<id>.csv` más `<id>.json` con sus metadatos"""
+
+    def __init__(self, directory: str, retention_seconds: float = 86400, max_total_mb: float = 2048):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.retention_seconds = retention_seconds
+        self.max_total_bytes = int(max_total_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # Ids a mitad de register(): cleanup() no los borra aunque superen la cuota
+        self._registering: Set[str] = set()
+        self._load()
+
+    def register(self, path: str, filename: str) -> Tuple[str, str]:
+        """Mueve el archivo generado al almacén y devuelve su id y su ruta
+
+        La limpieza que corre al final no borra este resultado, aunque solo supere la cuota.
+        """
+        output_id = uuid.uuid4().hex
+        target = self._data_path(output_id)
+        with self._lock:
+            self._registering.add(output_id)
+        try:
+            shutil.move(path, target)
+            entry = {
+                "filename": filename,
+                "size": os.path.getsize(target),
+                "created_at": time.time()
+            }
+            with open(self._meta_path(output_id), "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+
+            with self._lock:
+                self._entries[output_id] = entry
+            self.cleanup()
+        finally:
+            with self._lock:
+                self._registering.discard(output_id)
+        return output_id, target
+
+    def get(self, output_id: str) -> Optional[Dict[str, Any]]:
+        """Metadatos y ruta del resultado, o None si no existe, ya venció o ya se borró"""
+        with self._lock:
+            entry = self._entries.get(output_id)
+        path = self._data_path(output_id)
+        if entry is None or not os.path.exists(path):
+            return None
+        if entry["created_at"] < time.time() - self.retention_seconds:
+            # Vencido pero todavía no borrado: lo borra el próximo cleanup()
+            return None
+        return dict(entry, path=path)
+
+    def cleanup(self) -> int:
+        """Borra resultados vencidos y, si se supera la cuota, los más antiguos"""
+        limit = time.time() - self.retention_seconds
+        with self._lock:
+            ordered = sorted(self._entries.items(), key=lambda item: item[1]["created_at"])
+            total = sum(entry["size"] for _, entry in ordered)
+            expired = []
+            for output_id, entry in ordered:
+                if entry["created_at"] >= limit and total <= self.max_total_bytes:
+                    break
+                if output_id in self._registering:
+                    continue
+                expired.append(output_id)
+                total -= entry["size"]
+                del self._entries[output_id]
+
+        for output_id in expired:
+            for path in (self._data_path(output_id), self._meta_path(output_id)):
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError as e:
+                    # En Windows no se puede borrar un archivo que se está descargando
+                    logger.warning(f"No se pudo borrar {path}: {str(e)}")
+        if expired:
+            logger.info(f"Resultados: {len(expired)} archivos borrados por retención/cuota")
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(entry["size"] for entry in self._entries.values())
+            count = len(self._entries)
+        return {
+            "directory": self.directory,
+            "outputs": count,
+            "total_bytes": total,
+            "total_mb": round(total / (1024 * 1024), 1),
+            "max_total_mb": round(self.max_total_bytes / (1024 * 1024), 1),
+            "retention_seconds": self.retention_seconds
+        }
+
+    def _load(self):
+        """Recupera los resultados que quedaron de una ejecución anterior"""
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            output_id = name[:-len(".json")]
+            try:
+                with open(self._meta_path(output_id), encoding="utf-8") as f:
+                    self._entries[output_id] = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Metadatos de resultado ilegibles ({name}): {str(e)}")
+        self.cleanup()
+
+    def _data_path(self, output_id: str) -> str:
+        return os.path.join(self.directory, f"{output_id}.csv")
+
+    def _meta_path(self, output_id: str) -> str:
+        return os.path.join(self.directory, f"{output_id}.json")
+
+
+_store: Optional[OutputStore] = None
+_store_lock = threading.Lock()
+
+
+def get_output_store() -> OutputStore:
+    """Almacén compartido del proceso según OUTPUT_CONFIG
+
+    Se crea en el primer uso y no al importar: crear el almacén arma la carpeta y borra
+    los resultados vencidos que encuentre en ella.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OutputStore(
+                OUTPUT_CONFIG["directory"],
+                retention_seconds=OUTPUT_CONFIG["retention_seconds"],
+                max_total_mb=OUTPUT_CONFIG["max_total_mb"]
+            )
+        return _store
+
+
+def iter_file(path: str, chunk_size: int = 1024 * 1024, compression: Optional[str] = None) -> Iterator[bytes]:
+    """Lee el archivo por bloques, comprimiendo al vuelo con gzip o zstd si se pide
+
+    La compresión se valida al llamar (ValueError), antes de empezar a enviar la respuesta.
+    """
+    if compression is None:
+        compressor = None
+    elif compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ValueError("Compresión zstd no disponible: instalar el paquete 'zstandard'")
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError(f"Compresión no soportada: {compression} (usar gzip o zstd)")
+
+    def blocks():
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(chunk_size)
+                if not block:
+                    break
+                if compressor is None:
+                    yield block
+                else:
+                    compressed = compressor.compress(block)
+                    if compressed:
+                        yield compressed
+
+        if compressor is not None:
+            yield compressor.flush()
+
+    return blocks()
@@ -0,0 +1,257 @@
+"""
+Catálogo de consultas SQL del proyecto
+Cada consulta se define una vez. Las sentencias se preparan una sola vez por conexión
+(cursor.prep) y se reutilizan; las listas IN se completan hasta unas pocas aridades fijas
+para que lotes de distinto tamaño compartan la misma sentencia preparada.
+"""
+
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import polars as pl
+
+import fill_engine
+import metrics
+from config import FETCH_CONFIG, QUERY_CONFIG
+from field_mapping import build_keys_table_query, build_lookup_query, build_snapshot_query, rows_to_records
+
+logger = logging.getLogger(__name__)
+
+# Consultas fijas por nombre
+QUERIES: Dict[str, str] = {
+    "validation": "SELECT 1 FROM RDB$DATABASE",
+    "table_exists": "SELECT 1 FROM RDB$RELATIONS WHERE RDB$RELATION_NAME = ?",
+    "sample_legajos": "SELECT FIRST 10 LEGAJO FROM propuesta ORDER BY LEGAJO",
+    "caracteres_titulares": "SELECT DISTINCT NOMBRE FROM CARACTER_TITULARES ORDER BY NOMBRE",
+    # Marcas de cambio del snapshot (ver snapshot.py)
+    "contract_watermarks": "SELECT MAX(COD_PROPUESTA), MAX(COD_CONTRATO), MAX(FECHA) FROM contratos",
+    "contracts_since": (
+        "SELECT DISTINCT COD_PROPUESTA FROM contratos "
+        "WHERE COD_PROPUESTA > ? OR COD_CONTRATO > ? OR FECHA >= ?"
+    ),
+}
+
+
+def in_arity(count: int) -> int:
+    """Menor aridad fija que admite `count` claves"""
+    for arity in QUERY_CONFIG["in_arities"]:
+        if arity >= count:
+            return arity
+    raise ValueError(f"{count} claves superan la aridad máxima del IN ({QUERY_CONFIG['in_arities'][-1]})")
+
+
+def max_in_arity() -> int:
+    return QUERY_CONFIG["in_arities"][-1]
+
+
+def pad_keys(keys: Sequence[Any]) -> List[Any]:
+    """Completa `keys` con NULL hasta la aridad fija (un NULL en el IN nunca coincide)"""
+    return list(keys) + [None] * (in_arity(len(keys)) - len(keys))
+
+
+@lru_cache(maxsize=256)
+def lookup_sql(fields: Tuple[str, ...], arity: int, titular_priority: bool) -> str:
+    return build_lookup_query(fields, arity, titular_priority)
+
+
+@lru_cache(maxsize=64)
+def keys_table_sql(fields: Tuple[str, ...], table: str, titular_priority: bool, ranked: bool) -> str:
+    return build_keys_table_query(fields, table, titular_priority, ranked)
+
+
+@lru_cache(maxsize=64)
+def snapshot_sql(fields: Tuple[str, ...], titular_priority: bool, key_count: int) -> str:
+    return build_snapshot_query(fields, titular_priority, key_count)
+
+
+class StatementCache:
+    """Cursor propio de una conexión y sus sentencias preparadas, por (consulta, aridad)
+
+    La conexión la usa un solo thread a la vez (la presta el pool), así que no lleva lock.
+    Las sentencias sobreviven al rollback del pool: solo se cierra su resultado.
+    """
+
+    def __init__(self, con, max_statements: int):
+        self.cursor = con.cursor()
+        self.max_statements = max_statements
+        # Drivers sin prep: se guarda y ejecuta el texto SQL
+        self.supports_prep = hasattr(self.cursor, "prep")
+        self._statements: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable, sql: str):
+        statement = self._statements.get(key)
+        if statement is not None:
+            self._statements.move_to_end(key)
+            _count("hits")
+            return statement
+
+        statement = self.cursor.prep(sql) if self.supports_prep else sql
+        self._statements[key] = statement
+        _count("prepares")
+        logger.debug(f"Sentencia preparada: {key!r}")
+        if len(self._statements) > self.max_statements:
+            # La sentencia desalojada se libera al perder su última referencia
+            self._statements.popitem(last=False)
+            _count("evictions")
+        return statement
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+
+_caches: "weakref.WeakKeyDictionary[Any, StatementCache]" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+_stats = {"prepares": 0, "hits": 0, "evictions": 0, "unprepared": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, amount: int = 1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def statement_cache(con) -> Optional[StatementCache]:
+    """Caché de sentencias de `con` (se crea en el primer uso; ver `discard`)
+
+    None si la conexión no admite referencias débiles (sqlite3 de la base de reemplazo).
+    """
+    with _caches_lock:
+        try:
+            cache = _caches.get(con)
+        except TypeError:
+            return None
+        if cache is None:
+            cache = StatementCache(con, QUERY_CONFIG["max_statements"])
+            _caches[con] = cache
+        return cache
+
+
+def discard(con):
+    """Olvida la caché de sentencias de `con` (llamar al cerrar la conexión)
+
+    El cursor de la caché referencia a su conexión, así que la referencia débil sola no
+    alcanza para liberarlas: quien cierra la conexión tiene que avisar.
+    """
+    with _caches_lock:
+        try:
+            _caches.pop(con, None)
+        except TypeError:
+            pass
+
+
+def execute_sql(con, key: Hashable, sql: str, params: Sequence[Any] = ()):
+    """Ejecuta `sql` con la sentencia preparada de `key` y devuelve el cursor con el resultado
+
+    El cursor es compartido por todas las consultas de la conexión: leer el resultado
+    antes de ejecutar la siguiente.
+    """
+    cache = statement_cache(con) if QUERY_CONFIG["prepared"] else None
+    start = time.perf_counter()
+    if cache is None:
+        _count("unprepared")
+        cur = con.cursor()
+        cur.execute(sql, params)
+    else:
+        cur = cache.cursor
+        cur.execute(cache.get(key, sql), params)
+    metrics.DB_STATEMENT_SECONDS.observe(time.perf_counter() - start, query=_query_name(key))
+    return cur
+
+
+def _query_name(key: Hashable) -> str:
+    """Nombre de la consulta para las métricas: el primer elemento de la clave de caché"""
+    return str(key[0] if isinstance(key, tuple) else key)
+
+
+def execute(con, name: str, params: Sequence[Any] = ()):
+    """Ejecuta la consulta fija `name` de `QUERIES`"""
+    return execute_sql(con, (name, len(params)), QUERIES[name], params)
+
+
+def execute_lookup(con, keys: Sequence[str], fields: Sequence[str], titular_priority: bool = False):
+    """Consulta de `fields` por LEGAJO con el IN completado hasta una aridad fija"""
+    params = pad_keys(keys)
+    fields = tuple(fields)
+    return execute_sql(
+        con, ("lookup", fields, titular_priority, len(params)),
+        lookup_sql(fields, len(params), titular_priority), params
+    )
+
+
+def fetch_lookup(con, keys: Sequence[str], fields: Sequence[str],
+                 titular_priority: bool = False) -> Dict[str, Dict[str, Any]]:
+    """LEGAJO -> {campo: valor}; parte `keys` en lotes de la aridad máxima si hace falta"""
+    records = {}
+    step = max_in_arity()
+    for i in range(0, len(keys), step):
+        start = time.perf_counter()
+        cur = execute_lookup(con, keys[i:i + step], fields, titular_priority)
+        rows = cur.fetchall()
+        metrics.observe_query("lookup", len(keys[i:i + step]), time.perf_counter() - start, len(rows))
+        records.update(rows_to_records(rows, fields))
+    return records
+
+
+def read_frame(cur, fields: Sequence[str]) -> pl.DataFrame:
+    """Resultado de `cur` (LEGAJO, campos...) como DataFrame de resultados, leído con fetchmany
+
+    Cada bloque de FETCH_CONFIG["fetch_size"] filas pasa directo a columnas de Polars.
+    """
+    fields = list(fields)
+    blocks = []
+    while True:
+        rows = cur.fetchmany(FETCH_CONFIG["fetch_size"])
+        if not rows:
+            break
+        blocks.append(fill_engine.rows_to_frame(rows, fields))
+    return fill_engine.concat_results(blocks, fields)
+
+
+def fetch_lookup_frame(con, keys: Sequence[str], fields: Sequence[str],
+                       titular_priority: bool = False) -> pl.DataFrame:
+    """Como `fetch_lookup`, pero columnar: un DataFrame de resultados sin dicts por LEGAJO"""
+    frames = []
+    step = max_in_arity()
+    for i in range(0, len(keys), step):
+        start = time.perf_counter()
+        cur = execute_lookup(con, keys[i:i + step], fields, titular_priority)
+        frames.append(read_frame(cur, fields))
+        metrics.observe_query("lookup", len(keys[i:i + step]), time.perf_counter() - start, frames[-1].height)
+    return fill_engine.concat_results(frames, list(fields))
+
+
+def execute_keys_table(con, fields: Sequence[str], table: str, titular_priority: bool = True,
+                       ranked: bool = True):
+    """Consulta de `fields` para las claves cargadas en `table` (ver temp_lookup.py)"""
+    fields = tuple(fields)
+    return execute_sql(
+        con, ("keys_table", fields, table, titular_priority, ranked),
+        keys_table_sql(fields, table, titular_priority, ranked)
+    )
+
+
+def execute_snapshot(con, fields: Sequence[str], titular_priority: bool = True,
+                     cod_propuestas: Optional[Sequence[int]] = None):
+    """Consulta del snapshot: todos los LEGAJOs, o solo `cod_propuestas` (IN de aridad fija)"""
+    fields = tuple(fields)
+    params = pad_keys(cod_propuestas) if cod_propuestas else []
+    return execute_sql(
+        con, ("snapshot", fields, titular_priority, len(params)),
+        snapshot_sql(fields, titular_priority, len(params)), params
+    )
+
+
+def catalog_stats() -> Dict[str, int]:
+    """Sentencias preparadas y reutilizadas desde el inicio, y conexiones con caché"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["connections"] = len(caches)
+    stats["cached_statements"] = sum(len(cache) for cache in caches)
+    return stats
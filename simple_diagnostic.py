@@ -73,6 +73,7 @@ def test_propuesta_query():
     try:
         from config import DATABASE_CONFIG
         import fdb
+        import query_catalog
         
         con = fdb.connect(
             host=DATABASE_CONFIG["host"],
@@ -82,27 +83,12 @@ def test_propuesta_query():
             charset=DATABASE_CONFIG["charset"]
         )
         
-        # Consulta simple
-        query = """
-        SELECT DISTINCT 
-            p.LEGAJO AS COD_PROPUESTA,
-            c.NOMBRE as Nombre_Cliente,
-            s.NOMBRE AS SUCURSAL
-        FROM CONTRATOS_CLIENTES cc
-        INNER JOIN clientes c ON cc.COD_CLIENTE=c.COD_CLIENTE
-        INNER JOIN contratos ct ON cc.COD_CONTRATO=ct.COD_CONTRATO
-        INNER JOIN propuesta p ON ct.COD_PROPUESTA=p.COD_PROPUESTA
-        INNER JOIN creditos cr ON cr.COD_PROPUESTA = p.COD_PROPUESTA
-        INNER JOIN sucursales s ON cr.COD_SUCURSAL=s.COD_SUCURSAL
-        WHERE p.LEGAJO = ?
-        """
-        
-        cur = con.cursor()
+        # Consulta del catálogo (query_catalog.py), preparada una vez para todos los LEGAJOs
+        fields = ["nombre_cliente", "sucursal"]
         
         # Probar con LEGAJO del ejemplo
         test_legajo = "642799"
-        cur.execute(query, (test_legajo,))
-        result = cur.fetchone()
+        result = query_catalog.execute_lookup(con, [test_legajo], fields).fetchone()
         
         if result:
             print(f"[OK] LEGAJO {test_legajo} encontrado: {result[1]}")
@@ -112,8 +98,7 @@ def test_propuesta_query():
             print(f"[INFO] LEGAJO {test_legajo} no encontrado, buscando otros...")
             
             # Buscar LEGAJOs existentes
-            cur.execute("SELECT FIRST 5 LEGAJO FROM propuesta ORDER BY LEGAJO")
-            sample_legajos = cur.fetchall()
+            sample_legajos = query_catalog.execute(con, "sample_legajos").fetchall()[:5]
             
             if sample_legajos:
                 print("[INFO] LEGAJOs disponibles:")
@@ -122,8 +107,7 @@ def test_propuesta_query():
                 
                 # Probar con el primer LEGAJO encontrado
                 first_legajo = str(sample_legajos[0][0])
-                cur.execute(query, (first_legajo,))
-                test_result = cur.fetchone()
+                test_result = query_catalog.execute_lookup(con, [first_legajo], fields).fetchone()
                 
                 if test_result:
                     print(f"[OK] Consulta funciona con LEGAJO {first_legajo}: {test_result[1]}")
@@ -0,0 +1,485 @@
+"""
+Snapshot local de la dimensión LEGAJO -> cliente
+Para llenar decenas de miles de filas, una sola lectura secuencial de la base es mucho más
+rápida que miles de consultas IN: la consulta de field_mapping se ejecuta una vez sin filtro,
+se guarda en Parquet y el llenado hace un hash join de Polars contra el template.
+
+El refresco incremental solo vuelve a leer las propuestas modificadas desde el último, según
+SNAPSHOT_CONFIG["change_markers"]:
+    "keys":       COD_PROPUESTA / COD_CONTRATO crecientes y fecha de contrato (altas nuevas;
+                  no ve ediciones de clientes ni bajas)
+    "change_log": tabla de cambios mantenida por triggers (ver `change_log_ddl`); ve altas,
+                  ediciones y bajas de las tablas de CHANGE_LOG_SOURCES
+Los catálogos (CHANGE_LOG_CATALOGS: sucursales, estados, etc.) no se siguen: si cambian, hacer una
+exportación completa. Con "change_log" se rechazan campos que dependan de otras tablas.
+
+Uso:
+    python snapshot.py export          # Exportación completa desde Firebird (DATABASE_CONFIG)
+    python snapshot.py refresh         # Refresco incremental (completo si no hay snapshot)
+    python snapshot.py info            # Fecha, filas, campos y marcas del snapshot
+    python snapshot.py changelog-ddl   # DDL de la tabla de cambios y sus triggers (isql)
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import polars as pl
+
+import query_catalog
+from config import FETCH_CONFIG, FILL_MAPPING, SNAPSHOT_CONFIG
+from field_mapping import FIELDS, JOINS, PROPUESTA_FIELDS, build_snapshot_query, required_joins
+from fill_engine import FILL_PREFIX, LEGAJO
+
+logger = logging.getLogger(__name__)
+
+COD_PROPUESTA = "cod_propuesta"
+
+# Tablas que registran cambios en la tabla de cambios: SQL que inserta el COD_PROPUESTA
+# afectado por la fila {row} (NEW u OLD)
+CHANGE_LOG_SOURCES = {
+    "propuesta": "VALUES ({row}.COD_PROPUESTA)",
+    "contratos": "VALUES ({row}.COD_PROPUESTA)",
+    "creditos": "VALUES ({row}.COD_PROPUESTA)",
+    "CONTRATOS_CLIENTES": "SELECT ct.COD_PROPUESTA FROM contratos ct WHERE ct.COD_CONTRATO = {row}.COD_CONTRATO",
+    "clientes": (
+        "SELECT ct.COD_PROPUESTA FROM CONTRATOS_CLIENTES cc "
+        "INNER JOIN contratos ct ON ct.COD_CONTRATO = cc.COD_CONTRATO WHERE cc.COD_CLIENTE = {row}.COD_CLIENTE"
+    ),
+    "MEDIOS_COBROS": (
+        "SELECT ct.COD_PROPUESTA FROM CONTRATOS_CLIENTES cc "
+        "INNER JOIN contratos ct ON ct.COD_CONTRATO = cc.COD_CONTRATO WHERE cc.COD_CLIENTE = {row}.COD_CLIENTE"
+    ),
+    "MEDIOS_COBROS_DOMICILIOS": (
+        "SELECT ct.COD_PROPUESTA FROM MEDIOS_COBROS mco "
+        "INNER JOIN CONTRATOS_CLIENTES cc ON cc.COD_CLIENTE = mco.COD_CLIENTE "
+        "INNER JOIN contratos ct ON ct.COD_CONTRATO = cc.COD_CONTRATO WHERE mco.COD_MEDIO_COBRO = {row}.COD_MEDIO_COBRO"
+    ),
+    "DOMICILIOS": (
+        "SELECT ct.COD_PROPUESTA FROM MEDIOS_COBROS_DOMICILIOS mcd "
+        "INNER JOIN MEDIOS_COBROS mco ON mco.COD_MEDIO_COBRO = mcd.COD_MEDIO_COBRO "
+        "INNER JOIN CONTRATOS_CLIENTES cc ON cc.COD_CLIENTE = mco.COD_CLIENTE "
+        "INNER JOIN contratos ct ON ct.COD_CONTRATO = cc.COD_CONTRATO WHERE mcd.COD_DOMICILIO = {row}.COD_DOMICILIO"
+    ),
+    "MEDIOS_COBROS_BANCOS": (
+        "SELECT ct.COD_PROPUESTA FROM MEDIOS_COBROS mco "
+        "INNER JOIN CONTRATOS_CLIENTES cc ON cc.COD_CLIENTE = mco.COD_CLIENTE "
+        "INNER JOIN contratos ct ON ct.COD_CONTRATO = cc.COD_CONTRATO WHERE mco.COD_MEDIO_COBRO = {row}.COD_MEDIO_COBRO"
+    ),
+    # Un cambio de vendedor registra todas sus propuestas
+    "vendedor": "SELECT ct.COD_PROPUESTA FROM contratos ct WHERE ct.COD_VENDEDOR = {row}.COD_VENDEDOR",
+    "CONTRATOS_PARCELAS": (
+        "SELECT ct.COD_PROPUESTA FROM contratos ct WHERE ct.COD_CONTRATO = {row}.COD_CONTRATO_PARCELA"
+    ),
+    "parcela": (
+        "SELECT ct.COD_PROPUESTA FROM CONTRATOS_PARCELAS cp "
+        "INNER JOIN contratos ct ON ct.COD_CONTRATO = cp.COD_CONTRATO_PARCELA WHERE cp.COD_PARCELA = {row}.COD_PARCELA"
+    ),
+    "TARJETA_OXXO": "VALUES ({row}.COD_PROPUESTA)",
+    "CLABE_BANCARIA": "VALUES ({row}.COD_PROPUESTA)",
+}
+
+# Catálogos de los joins de field_mapping que no se siguen (ver arriba); cualquier otra tabla
+# de la que dependan los campos tiene que estar en CHANGE_LOG_SOURCES para usar "change_log"
+CHANGE_LOG_CATALOGS = {
+    "CARACTER_TITULARES", "sucursales", "ESTADOS_DEUDAS", "ESTADOS_CONTRATOS", "TIPOS_CONTRATOS",
+    "EQUIPO_VENDEDORES", "PLANES_VENTAS_MODELOS", "ZONA_COBRANZA", "BARRIOS", "LOCALIDADES", "PROVINCIAS",
+}
+
+
+def untracked_tables(fields: Sequence[str]) -> List[str]:
+    """Tablas de las que dependen `fields` cuyos cambios no llegan a la tabla de cambios"""
+    known = {table.upper() for table in [*CHANGE_LOG_SOURCES, *CHANGE_LOG_CATALOGS]}
+    tables = [JOINS[alias][0].split(" JOIN ", 1)[1].split()[0] for alias in required_joins(fields)]
+    return [table for table in tables if table.upper() not in known]
+
+
+def change_log_ddl(table: str, dialect: str = "firebird") -> List[str]:
+    """Sentencias que crean la tabla de cambios `table` y los triggers que la llenan
+
+    `dialect` "firebird" (secuencia + triggers de varios eventos) o "sqlite" (base de reemplazo,
+    ver standin_db.py). En un UPDATE se registra la propuesta anterior y la nueva.
+    """
+    def insert(source: str, row: str) -> str:
+        return f"INSERT INTO {table} (COD_PROPUESTA) {CHANGE_LOG_SOURCES[source].format(row=row)};"
+
+    if dialect == "sqlite":
+        statements = [
+            f"CREATE TABLE {table} (ID_CAMBIO INTEGER PRIMARY KEY AUTOINCREMENT, COD_PROPUESTA INTEGER, "
+            f"FECHA_CAMBIO TEXT DEFAULT CURRENT_TIMESTAMP)"
+        ]
+        for source in CHANGE_LOG_SOURCES:
+            statements += [
+                f"CREATE TRIGGER CL_{source}_AI AFTER INSERT ON {source} BEGIN {insert(source, 'NEW')} END",
+                f"CREATE TRIGGER CL_{source}_AU AFTER UPDATE ON {source} "
+                f"BEGIN {insert(source, 'OLD')} {insert(source, 'NEW')} END",
+                f"CREATE TRIGGER CL_{source}_AD AFTER DELETE ON {source} BEGIN {insert(source, 'OLD')} END",
+            ]
+        return statements
+
+    statements = [
+        f"CREATE SEQUENCE GEN_{table}",
+        f"CREATE TABLE {table} (ID_CAMBIO BIGINT NOT NULL PRIMARY KEY, COD_PROPUESTA INTEGER, "
+        f"FECHA_CAMBIO TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+        f"CREATE TRIGGER {table}_BI FOR {table} ACTIVE BEFORE INSERT POSITION 0 AS BEGIN "
+        f"IF (NEW.ID_CAMBIO IS NULL) THEN NEW.ID_CAMBIO = NEXT VALUE FOR GEN_{table}; END",
+    ]
+    for source in CHANGE_LOG_SOURCES:
+        statements.append(
+            f"CREATE TRIGGER CL_{source} FOR {source} ACTIVE AFTER INSERT OR UPDATE OR DELETE POSITION 100 AS BEGIN "
+            f"IF (NOT DELETING) THEN {insert(source, 'NEW')} "
+            f"IF (NOT INSERTING) THEN {insert(source, 'OLD')} END"
+        )
+    return statements
+
+
+def default_fields() -> List[str]:
+    """Campos del snapshot: los de SNAPSHOT_CONFIG o los del API, del mapeo por defecto y el carácter"""
+    if SNAPSHOT_CONFIG["fields"]:
+        return sorted(SNAPSHOT_CONFIG["fields"])
+    return sorted(set(PROPUESTA_FIELDS) | set(FILL_MAPPING.values()) | {"caracter_titular"})
+
+
+class SnapshotBusyError(Exception):
+    """Ya hay una exportación del snapshot en curso"""
+
+
+class SnapshotStore:
+    """Archivo Parquet con un registro por LEGAJO y un JSON con sus metadatos
+
+    Columnas: `legajo` y `__fill_<campo>` (strings, igual que `fill_engine.results_to_frame`),
+    así el resultado de `lookup` va directo a `fill_engine.apply_fill`.
+    """
+
+    def __init__(self, directory: str, name: str = "legajos_snapshot"):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.parquet")
+        self.meta_path = os.path.join(directory, f"{name}.json")
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        """Metadatos del snapshot vigente (None si no hay)"""
+        if not (os.path.exists(self.path) and os.path.exists(self.meta_path)):
+            return None
+        with open(self.meta_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def age_seconds(self) -> Optional[float]:
+        meta = self.metadata()
+        return time.time() - meta["refreshed_ts"] if meta else None
+
+    def covers(self, fields: Sequence[str], source: str) -> bool:
+        """True si existe un snapshot de la base `source` con todos `fields` y la misma prioridad de titular"""
+        meta = self.metadata()
+        return (meta is not None and meta.get("source") == source
+                and set(fields) <= set(meta["fields"])
+                and meta["titular_priority"] == FETCH_CONFIG["titular_priority"])
+
+    def export(self, con, fields: Optional[Sequence[str]] = None, source: str = "") -> Dict[str, Any]:
+        """Ejecuta la consulta completa en `con` y reemplaza el snapshot; devuelve los metadatos
+
+        Las filas se leen con fetchmany y se pasan a columnas de Polars por bloques. El
+        archivo nuevo se escribe aparte y reemplaza al anterior solo si todo salió bien.
+        """
+        fields = sorted(fields or default_fields())
+        unknown = [field for field in fields if field not in FIELDS]
+        if unknown:
+            raise ValueError(f"Campos desconocidos para el snapshot: {', '.join(unknown)}")
+        if SNAPSHOT_CONFIG["change_markers"] == "change_log":
+            untracked = untracked_tables(fields)
+            if untracked:
+                raise ValueError(f"Con change_log el snapshot no vería los cambios de: {', '.join(untracked)}; "
+                                 f"agregar triggers en CHANGE_LOG_SOURCES o quitar los campos que dependen de ellas")
+
+        with self._exclusive():
+            return self._export(con, fields, source)
+
+    def refresh(self, con, source: str = "") -> Dict[str, Any]:
+        """Refresco incremental: relee las propuestas cambiadas desde las marcas guardadas
+
+        Si no hay snapshot, o no tiene las marcas que pide SNAPSHOT_CONFIG["change_markers"],
+        o cambió la prioridad de titular o la base `source`, hace una exportación completa.
+        """
+        meta = self.metadata()
+        if not self._can_refresh(meta, source):
+            logger.info("[snapshot] Sin marcas de cambio utilizables: exportación completa")
+            return self.export(con, meta["fields"] if meta else None, source)
+
+        with self._exclusive():
+            return self._refresh(con, meta, source)
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        if not self._export_lock.acquire(blocking=False):
+            raise SnapshotBusyError("Ya hay una exportación del snapshot en curso")
+        try:
+            yield
+        finally:
+            self._export_lock.release()
+
+    @staticmethod
+    def _can_refresh(meta: Optional[Dict[str, Any]], source: str) -> bool:
+        if meta is None or "watermarks" not in meta:
+            return False
+        if source and meta.get("source") != source:
+            return False
+        if meta["titular_priority"] != FETCH_CONFIG["titular_priority"]:
+            return False
+        if SNAPSHOT_CONFIG["change_markers"] == "change_log":
+            return meta["watermarks"].get("change_id") is not None
+        return True
+
+    def _export(self, con, fields: List[str], source: str) -> Dict[str, Any]:
+        titular_priority = FETCH_CONFIG["titular_priority"]
+        start = time.time()
+        # Las marcas se leen antes que los datos: lo que cambie durante la exportación
+        # se vuelve a leer en el próximo refresco
+        watermarks = self._read_watermarks(con)
+        frame, fetched = self._read_frame(con, fields, titular_priority)
+        elapsed = time.time() - start
+
+        now = time.time()
+        meta = {
+            "created_at": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+            "refreshed_at": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+            "refreshed_ts": now,
+            "source": source,
+            "fields": fields,
+            "titular_priority": titular_priority,
+            "rows_fetched": fetched,
+            "legajos": frame.height,
+            "export_seconds": round(elapsed, 3),
+            "watermarks": watermarks,
+            "last_refresh": {"mode": "full", "rows_fetched": fetched, "seconds": round(elapsed, 3)},
+        }
+        self._replace(frame, meta)
+        logger.info(f"[snapshot] {frame.height:,} LEGAJOs ({fetched:,} filas) exportados en {elapsed:.1f}s")
+        return meta
+
+    def _refresh(self, con, meta: Dict[str, Any], source: str) -> Dict[str, Any]:
+        fields = meta["fields"]
+        titular_priority = meta["titular_priority"]
+        start = time.time()
+        watermarks = self._read_watermarks(con)
+        changed = self._changed_propuestas(con, meta["watermarks"])
+
+        fetched = 0
+        frame = None
+        if changed:
+            delta, fetched = self._read_frame(con, fields, titular_priority, sorted(changed))
+            with self._lock:
+                current = pl.read_parquet(self.path)
+            # Las propuestas cambiadas se reemplazan enteras (las que ya no tienen filas se borran);
+            # si un LEGAJO pasó a otra propuesta gana la fila nueva
+            frame = (
+                pl.concat([current.filter(~pl.col(COD_PROPUESTA).is_in(list(changed))), delta])
+                .unique(subset=[LEGAJO], keep="last", maintain_order=True)
+            )
+        elapsed = time.time() - start
+
+        now = time.time()
+        meta = {
+            **meta,
+            "refreshed_at": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+            "refreshed_ts": now,
+            "source": source or meta["source"],
+            "legajos": frame.height if frame is not None else meta["legajos"],
+            "watermarks": watermarks,
+            "last_refresh": {
+                "mode": SNAPSHOT_CONFIG["change_markers"],
+                "changed_propuestas": len(changed),
+                "rows_fetched": fetched,
+                "seconds": round(elapsed, 3),
+            },
+        }
+        self._replace(frame, meta)
+        logger.info(f"[snapshot] Refresco incremental: {len(changed):,} propuestas cambiadas "
+                    f"({fetched:,} filas) en {elapsed:.1f}s")
+        return meta
+
+    def _read_frame(self, con, fields: Sequence[str], titular_priority: bool,
+                    cod_propuestas: Optional[List[int]] = None):
+        """Filas de la consulta del snapshot como DataFrame con un registro por LEGAJO
+
+        Sin `cod_propuestas` lee todo; con ellas, en lotes de la aridad máxima del IN.
+        """
+        fetch_size = SNAPSHOT_CONFIG["fetch_size"]
+        columns = [LEGAJO] + [FILL_PREFIX + field for field in fields]
+        schema = {LEGAJO: pl.Utf8, COD_PROPUESTA: pl.Int64, **{column: pl.Utf8 for column in columns[1:]}}
+
+        if cod_propuestas is None:
+            batches = [None]
+        else:
+            step = query_catalog.max_in_arity()
+            batches = [cod_propuestas[i:i + step] for i in range(0, len(cod_propuestas), step)]
+
+        blocks = []
+        fetched = 0
+        for batch in batches:
+            cur = query_catalog.execute_snapshot(con, fields, titular_priority, batch)
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                fetched += len(rows)
+                legajo, cod, *values = zip(*rows)
+                # Valores como string, igual que rows_to_records (y la caché persistente)
+                data = {
+                    LEGAJO: [str(value) for value in legajo],
+                    COD_PROPUESTA: [int(value) for value in cod],
+                    **{
+                        column: [None if value is None else str(value) for value in column_values]
+                        for column, column_values in zip(columns[1:], values)
+                    },
+                }
+                blocks.append(pl.DataFrame(data, schema=schema))
+                if cod_propuestas is None:
+                    logger.info(f"[snapshot] {fetched:,} filas leídas")
+
+        frame = pl.concat(blocks) if blocks else pl.DataFrame(schema=schema)
+        # Las filas vienen por LEGAJO y prioridad de cliente: la primera de cada LEGAJO es la buena
+        return frame.unique(subset=[LEGAJO], keep="first", maintain_order=True), fetched
+
+    @staticmethod
+    def _read_watermarks(con) -> Dict[str, Any]:
+        """Máximos actuales de las marcas de cambio"""
+        cod_propuesta, cod_contrato, fecha = query_catalog.execute(con, "contract_watermarks").fetchone()
+        watermarks = {
+            "cod_propuesta": cod_propuesta or 0,
+            "cod_contrato": cod_contrato or 0,
+            "fecha_contrato": str(fecha)[:10] if fecha else None,
+            "change_id": None,
+        }
+        if SNAPSHOT_CONFIG["change_markers"] == "change_log":
+            table = SNAPSHOT_CONFIG["change_log_table"]
+            row = query_catalog.execute_sql(
+                con, ("change_log_max", table), f"SELECT MAX(ID_CAMBIO) FROM {table}"
+            ).fetchone()
+            watermarks["change_id"] = row[0] or 0
+        return watermarks
+
+    @staticmethod
+    def _changed_propuestas(con, watermarks: Dict[str, Any]) -> Set[int]:
+        """COD_PROPUESTA modificados desde `watermarks`, con el margen de SNAPSHOT_CONFIG"""
+        if SNAPSHOT_CONFIG["change_markers"] == "change_log":
+            # Un ID bajo puede confirmarse después de leer el máximo: se relee un margen
+            table = SNAPSHOT_CONFIG["change_log_table"]
+            since = max(watermarks["change_id"] - SNAPSHOT_CONFIG["change_log_overlap"], 0)
+            cur = query_catalog.execute_sql(
+                con, ("change_log_since", table),
+                f"SELECT DISTINCT COD_PROPUESTA FROM {table} WHERE ID_CAMBIO > ? AND COD_PROPUESTA IS NOT NULL",
+                [since]
+            )
+        else:
+            fecha = watermarks["fecha_contrato"]
+            since = (date.fromisoformat(fecha) - timedelta(days=SNAPSHOT_CONFIG["date_overlap_days"])
+                     if fecha else date.min)
+            cur = query_catalog.execute(
+                con, "contracts_since", [watermarks["cod_propuesta"], watermarks["cod_contrato"], since]
+            )
+        return {int(row[0]) for row in cur.fetchall()}
+
+    def lookup(self, legajos: Sequence[str], fields: Sequence[str]) -> pl.DataFrame:
+        """Registros de `legajos` con `fields`, con el formato de `fill_engine.results_to_frame`
+
+        Semi join (hash join de Polars) entre el Parquet y las claves del template: solo se
+        materializan los LEGAJOs pedidos.
+        """
+        keys = pl.LazyFrame({LEGAJO: list(legajos)}, schema={LEGAJO: pl.Utf8})
+        with self._lock:
+            return (
+                pl.scan_parquet(self.path)
+                .select(LEGAJO, *[FILL_PREFIX + field for field in fields])
+                .join(keys, on=LEGAJO, how="semi")
+                .collect()
+            )
+
+    def _replace(self, frame: Optional[pl.DataFrame], meta: Dict[str, Any]):
+        """Escribe datos y metadatos en archivos temporales y los mueve en su lugar
+
+        Con `frame` None solo se actualizan los metadatos (refresco sin cambios).
+        """
+        tmp_path = self.path + ".tmp"
+        tmp_meta = self.meta_path + ".tmp"
+        if frame is not None:
+            frame.write_parquet(tmp_path)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        with self._lock:
+            if frame is not None:
+                os.replace(tmp_path, self.path)
+            os.replace(tmp_meta, self.meta_path)
+
+
+_store: Optional[SnapshotStore] = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """Snapshot compartido del proceso según SNAPSHOT_CONFIG"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SnapshotStore(SNAPSHOT_CONFIG["directory"], SNAPSHOT_CONFIG["name"])
+        return _store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot local de LEGAJOs")
+    parser.add_argument("command", choices=["export", "refresh", "info", "changelog-ddl"])
+    parser.add_argument("--fields", help="Campos separados por coma (por defecto los de SNAPSHOT_CONFIG)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "changelog-ddl":
+        print("SET TERM ^ ;")
+        for statement in change_log_ddl(SNAPSHOT_CONFIG["change_log_table"]):
+            print(f"{statement}^\n")
+        print("SET TERM ; ^")
+        print("COMMIT;")
+        return
+
+    store = get_snapshot_store()
+    if args.command == "info":
+        meta = store.metadata()
+        if meta is None:
+            print(f"[INFO] No hay snapshot en {store.path}")
+            return
+        print(f"[ARCHIVO] {store.path}")
+        print(json.dumps(meta, indent=2, ensure_ascii=False))
+        return
+
+    import fdb
+    from config import DATABASE_CONFIG
+
+    source = f"{DATABASE_CONFIG['host']}:{DATABASE_CONFIG['database_path']}"
+    print(f"[BD] {'Exportando' if args.command == 'export' else 'Refrescando'} snapshot desde {source}...")
+    con = fdb.connect(
+        host=DATABASE_CONFIG["host"],
+        database=DATABASE_CONFIG["database_path"],
+        user=DATABASE_CONFIG["user"],
+        password=DATABASE_CONFIG["password"],
+        charset=DATABASE_CONFIG["charset"]
+    )
+    try:
+        if args.command == "refresh":
+            meta = store.refresh(con, source=source)
+        else:
+            fields = args.fields.split(",") if args.fields else None
+            meta = store.export(con, fields, source=source)
+    finally:
+        con.close()
+    last = meta["last_refresh"]
+    print(f"[CHECK] {meta['legajos']:,} LEGAJOs ({last['mode']}, {last['rows_fetched']:,} filas "
+          f"en {last['seconds']:.1f}s) -> {store.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Base SQLite de reemplazo con el esquema de Firebird que usan las consultas por LEGAJO
+Se genera con datos sintéticos deterministas (varios clientes por contrato, medios de cobro
+con varios domicilios) para comparar variantes de consultas sin acceso al servidor real
+"""
+
+import os
+import random
+import sqlite3
+from typing import Dict, List
+
+# Solo las tablas y columnas que usan las consultas del proyecto
+SCHEMA = [
+    "CREATE TABLE propuesta (COD_PROPUESTA INTEGER PRIMARY KEY, LEGAJO INTEGER NOT NULL, COD_TIPO_PROPUESTA INTEGER)",
+    "CREATE TABLE TIPOS_PROPUESTAS (COD_TIPO_PROPUESTA INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE contratos (COD_CONTRATO INTEGER PRIMARY KEY, COD_PROPUESTA INTEGER, FECHA DATE, "
+    "COD_ESTADO_CONTRATO INTEGER, COD_TIPO_CONTRATO INTEGER, COD_VENDEDOR INTEGER, COD_PLAN_VENTA_MODELO INTEGER)",
+    "CREATE TABLE CONTRATOS_CLIENTES (COD_CONTRATO INTEGER, COD_CLIENTE INTEGER, COD_CARACTER_TITULAR INTEGER)",
+    "CREATE TABLE clientes (COD_CLIENTE INTEGER PRIMARY KEY, NOMBRE TEXT, TELEFONO TEXT, TELEFONO_MOVIL TEXT, "
+    "TELEFONO_LABORAL TEXT, TIPO_DOCUMENTO TEXT, NRO_DOCUMENTO TEXT, CUIT TEXT)",
+    "CREATE TABLE CARACTER_TITULARES (COD_CARACTER_TITULAR INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE creditos (COD_CREDITO INTEGER PRIMARY KEY, COD_PROPUESTA INTEGER, COD_SUCURSAL INTEGER, "
+    "MONTO NUMERIC, COD_ESTADO_DEUDA INTEGER)",
+    "CREATE TABLE sucursales (COD_SUCURSAL INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE ESTADOS_DEUDAS (COD_ESTADO_DEUDA INTEGER PRIMARY KEY, ESTADO TEXT)",
+    "CREATE TABLE ESTADOS_CONTRATOS (COD_ESTADO_CONTRATO INTEGER PRIMARY KEY, ESTADO TEXT)",
+    "CREATE TABLE TIPOS_CONTRATOS (COD_TIPO_CONTRATO INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE vendedor (COD_VENDEDOR INTEGER PRIMARY KEY, NOMBRE TEXT, COD_EQUIPO INTEGER)",
+    "CREATE TABLE EQUIPO_VENDEDORES (COD_EQUIPO INTEGER PRIMARY KEY, DESCRIPCION TEXT)",
+    "CREATE TABLE PLANES_VENTAS_MODELOS (COD_PLAN_VENTA_MODELO INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE CONTRATOS_PARCELAS (COD_CONTRATO_PARCELA INTEGER, COD_PARCELA INTEGER)",
+    "CREATE TABLE parcela (COD_PARCELA INTEGER PRIMARY KEY, LEGAJO TEXT, COD_ESTADO INTEGER, COD_MANZANA INTEGER)",
+    "CREATE TABLE ESTADOS_PARCELA (COD_ESTADO_PARCELA INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE MANZANA (COD_MANZANA INTEGER PRIMARY KEY, COD_ZONA_PARQUE INTEGER)",
+    "CREATE TABLE ZONAS_PARQUES (COD_ZONA_PARQUE INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE MEDIOS_COBROS (COD_MEDIO_COBRO INTEGER PRIMARY KEY, COD_CLIENTE INTEGER, DESCRIPCION TEXT, "
+    "COD_COBRADOR_ASIGNADO INTEGER, COD_ZONA_COBRANZA INTEGER)",
+    "CREATE TABLE ZONA_COBRANZA (COD_ZONA_COBRANZA INTEGER PRIMARY KEY, DESCRIPCION TEXT, COD_MODALIDAD_COBRANZA INTEGER)",
+    "CREATE TABLE MEDIOS_COBROS_DOMICILIOS (COD_MEDIO_COBRO INTEGER, COD_DOMICILIO INTEGER)",
+    "CREATE TABLE DOMICILIOS (COD_DOMICILIO INTEGER PRIMARY KEY, DIRECCION TEXT, COD_BARRIO INTEGER, "
+    "COD_LOCALIDAD INTEGER, MANZANA TEXT)",
+    "CREATE TABLE BARRIOS (COD_BARRIO INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE LOCALIDADES (COD_LOCALIDAD INTEGER PRIMARY KEY, NOMBRE TEXT, COD_PROVINCIA INTEGER)",
+    "CREATE TABLE PROVINCIAS (COD_PROVINCIA INTEGER PRIMARY KEY, NOMBRE TEXT)",
+    "CREATE TABLE MEDIOS_COBROS_BANCOS (COD_MEDIO_COBRO INTEGER, NRO_CUENTA TEXT, TITULAR TEXT)",
+    "CREATE TABLE TARJETA_OXXO (COD_PROPUESTA INTEGER, CODIGO_BARRA TEXT, COD_USUARIO_ALTA INTEGER)",
+    "CREATE TABLE CLABE_BANCARIA (COD_PROPUESTA INTEGER, CLABE TEXT)",
+]
+
+# Índices equivalentes a las claves foráneas de la base real
+INDEXES = [
+    "CREATE INDEX idx_propuesta_legajo ON propuesta (LEGAJO)",
+    "CREATE INDEX idx_contratos_propuesta ON contratos (COD_PROPUESTA)",
+    "CREATE INDEX idx_cc_contrato ON CONTRATOS_CLIENTES (COD_CONTRATO)",
+    "CREATE INDEX idx_cc_cliente ON CONTRATOS_CLIENTES (COD_CLIENTE)",
+    "CREATE INDEX idx_creditos_propuesta ON creditos (COD_PROPUESTA)",
+    "CREATE INDEX idx_cp_contrato ON CONTRATOS_PARCELAS (COD_CONTRATO_PARCELA)",
+    "CREATE INDEX idx_mco_cliente ON MEDIOS_COBROS (COD_CLIENTE)",
+    "CREATE INDEX idx_mcd_medio ON MEDIOS_COBROS_DOMICILIOS (COD_MEDIO_COBRO)",
+    "CREATE INDEX idx_mcb_medio ON MEDIOS_COBROS_BANCOS (COD_MEDIO_COBRO)",
+    "CREATE INDEX idx_oxxo_propuesta ON TARJETA_OXXO (COD_PROPUESTA)",
+    "CREATE INDEX idx_clabe_propuesta ON CLABE_BANCARIA (COD_PROPUESTA)",
+]
+
+FIRST_LEGAJO = 10000
+CARACTERES = ["TITULAR", "COTITULAR", "PROPIETARIO", "BENEFICIARIO"]
+NOMBRES = ["ANA", "LUIS", "MARIA", "JOSE", "CARMEN", "JORGE", "ROSA", "PEDRO", "LAURA", "MIGUEL"]
+APELLIDOS = ["GARCIA", "LOPEZ", "MARTINEZ", "HERNANDEZ", "PEREZ", "SANCHEZ", "RAMIREZ", "TORRES"]
+
+
+def create_standin(path: str, propuestas: int = 20000, seed: int = 42,
+                   change_log: str = "CAMBIOS_LEGAJOS") -> sqlite3.Connection:
+    """Crea (reemplazando) la base en `path` con `propuestas` LEGAJOs y devuelve la conexión
+
+    Con la misma semilla se generan siempre los mismos datos. Después de la carga se crean
+    la tabla de cambios `change_log` y sus triggers (ver snapshot.change_log_ddl).
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    con = sqlite3.connect(path)
+    for statement in SCHEMA:
+        con.execute(statement)
+
+    # Catálogos
+    catalogs = {
+        "TIPOS_PROPUESTAS": [(i, f"TIPO {i}") for i in range(1, 4)],
+        "CARACTER_TITULARES": [(i + 1, name) for i, name in enumerate(CARACTERES)],
+        "sucursales": [(i, f"SUCURSAL {i}") for i in range(1, 21)],
+        "ESTADOS_DEUDAS": [(i, estado) for i, estado in enumerate(["AL DIA", "ATRASADO", "MOROSO"], 1)],
+        "ESTADOS_CONTRATOS": [(i, estado) for i, estado in enumerate(["VIGENTE", "CANCELADO", "SUSPENDIDO"], 1)],
+        "TIPOS_CONTRATOS": [(i, f"CONTRATO {i}") for i in range(1, 6)],
+        "EQUIPO_VENDEDORES": [(i, f"EQUIPO {i}") for i in range(1, 11)],
+        "vendedor": [(i, f"ASESOR {i}", rng.randint(1, 10)) for i in range(1, 201)],
+        "PLANES_VENTAS_MODELOS": [(i, f"PLAN {i}") for i in range(1, 31)],
+        "ESTADOS_PARCELA": [(i, f"ESTADO {i}") for i in range(1, 4)],
+        "ZONAS_PARQUES": [(i, f"ZONA {i}") for i in range(1, 11)],
+        "MANZANA": [(i, rng.randint(1, 10)) for i in range(1, 501)],
+        "ZONA_COBRANZA": [(i, f"COBRANZA {i}", rng.randint(1, 3)) for i in range(1, 51)],
+        "PROVINCIAS": [(i, f"PROVINCIA {i}") for i in range(1, 33)],
+        "LOCALIDADES": [(i, f"LOCALIDAD {i}", rng.randint(1, 32)) for i in range(1, 301)],
+        "BARRIOS": [(i, f"BARRIO {i}") for i in range(1, 1001)],
+    }
+    for table, rows in catalogs.items():
+        con.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * len(rows[0]))})", rows)
+
+    tables = {name: [] for name in (
+        "propuesta", "contratos", "CONTRATOS_CLIENTES", "clientes", "creditos", "CONTRATOS_PARCELAS",
+        "parcela", "MEDIOS_COBROS", "MEDIOS_COBROS_DOMICILIOS", "DOMICILIOS", "MEDIOS_COBROS_BANCOS",
+        "TARJETA_OXXO", "CLABE_BANCARIA"
+    )}
+    client_id = medio_id = domicilio_id = parcela_id = 0
+
+    for cod in range(1, propuestas + 1):
+        tables["propuesta"].append((cod, FIRST_LEGAJO + cod, rng.randint(1, 3)))
+        fecha = f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        tables["contratos"].append((cod, cod, fecha, rng.randint(1, 3), rng.randint(1, 5),
+                                    rng.randint(1, 200), rng.choice([None, rng.randint(1, 30)])))
+        # ~90% con crédito (el resto no aparece en consultas con INNER JOIN creditos)
+        if rng.random() < 0.9:
+            tables["creditos"].append((cod, cod, rng.randint(1, 20), round(rng.uniform(5000, 250000), 2),
+                                       rng.randint(1, 3)))
+        if rng.random() < 0.6:
+            parcela_id += 1
+            tables["CONTRATOS_PARCELAS"].append((cod, parcela_id))
+            tables["parcela"].append((parcela_id, f"P-{parcela_id}", rng.randint(1, 3), rng.randint(1, 500)))
+        if rng.random() < 0.3:
+            tables["TARJETA_OXXO"].append((cod, f"OXXO{cod:010d}", rng.randint(1, 50)))
+        if rng.random() < 0.4:
+            tables["CLABE_BANCARIA"].append((cod, f"{rng.randint(10 ** 17, 10 ** 18 - 1)}"))
+
+        # 1 a 3 clientes por contrato; el titular no siempre es el primero
+        caracteres = rng.sample(range(1, len(CARACTERES) + 1), rng.randint(1, 3))
+        for caracter in caracteres:
+            client_id += 1
+            nombre = f"{rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)} {rng.choice(NOMBRES)}"
+            tables["clientes"].append((client_id, nombre, f"55{rng.randint(10 ** 7, 10 ** 8 - 1)}",
+                                       f"55{rng.randint(10 ** 7, 10 ** 8 - 1)}", None, "INE",
+                                       f"{rng.randint(10 ** 9, 10 ** 10 - 1)}", f"RFC{client_id:09d}"))
+            tables["CONTRATOS_CLIENTES"].append((cod, client_id, caracter))
+
+            # 0 a 3 medios de cobro, cada uno con 0 a 2 domicilios
+            for _ in range(rng.randint(0, 3)):
+                medio_id += 1
+                tables["MEDIOS_COBROS"].append((medio_id, client_id, rng.choice(["EFECTIVO", "BANCO", "OXXO"]),
+                                                rng.randint(1, 100), rng.randint(1, 50)))
+                if rng.random() < 0.3:
+                    tables["MEDIOS_COBROS_BANCOS"].append((medio_id, f"{rng.randint(10 ** 9, 10 ** 10 - 1)}", nombre))
+                for _ in range(rng.randint(0, 2)):
+                    domicilio_id += 1
+                    tables["DOMICILIOS"].append((domicilio_id, f"CALLE {rng.randint(1, 999)} #{rng.randint(1, 500)}",
+                                                 rng.randint(1, 1000), rng.randint(1, 300), f"MZ {rng.randint(1, 99)}"))
+                    tables["MEDIOS_COBROS_DOMICILIOS"].append((medio_id, domicilio_id))
+
+    for table, rows in tables.items():
+        if rows:
+            con.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * len(rows[0]))})", rows)
+    for statement in INDEXES:
+        con.execute(statement)
+    if change_log:
+        from snapshot import change_log_ddl
+        for statement in change_log_ddl(change_log, dialect="sqlite"):
+            con.execute(statement)
+    con.commit()
+    con.execute("ANALYZE")
+    return con
+
+
+def simulate_changes(con: sqlite3.Connection, seed: int = 11, inserts: int = 50, updates: int = 200,
+                     deletes: int = 20) -> Dict[str, int]:
+    """Aplica cambios típicos de un día: altas de propuestas, clientes editados o cambiados
+    de carácter, contratos nuevos en propuestas existentes y contratos dados de baja
+    """
+    rng = random.Random(seed)
+    max_cod = con.execute("SELECT MAX(COD_PROPUESTA) FROM propuesta").fetchone()[0]
+    max_contrato = con.execute("SELECT MAX(COD_CONTRATO) FROM contratos").fetchone()[0]
+    max_cliente = con.execute("SELECT MAX(COD_CLIENTE) FROM clientes").fetchone()[0]
+    max_fecha = con.execute("SELECT MAX(FECHA) FROM contratos").fetchone()[0]
+    stats = {"inserts": 0, "renamed": 0, "recharacterized": 0, "new_contracts": 0, "deletes": 0}
+
+    def add_contract(cod_propuesta: int):
+        nonlocal max_contrato, max_cliente
+        max_contrato += 1
+        max_cliente += 1
+        con.execute("INSERT INTO contratos VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (max_contrato, cod_propuesta, max_fecha, rng.randint(1, 3), rng.randint(1, 5),
+                     rng.randint(1, 200), None))
+        nombre = f"{rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)} {rng.choice(NOMBRES)}"
+        con.execute("INSERT INTO clientes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (max_cliente, f"ALTA {nombre}", "5500000000", "5500000000", None, "INE",
+                     "0000000000", f"RFC{max_cliente:09d}"))
+        con.execute("INSERT INTO CONTRATOS_CLIENTES VALUES (?, ?, ?)", (max_contrato, max_cliente, 1))
+
+    for i in range(1, inserts + 1):
+        cod = max_cod + i
+        con.execute("INSERT INTO propuesta VALUES (?, ?, ?)", (cod, FIRST_LEGAJO + cod, 1))
+        con.execute("INSERT INTO creditos VALUES (?, ?, ?, ?, ?)", (cod, cod, rng.randint(1, 20), 1000.0, 1))
+        add_contract(cod)
+        stats["inserts"] += 1
+
+    for _ in range(updates):
+        cliente = rng.randint(1, max_cliente)
+        if rng.random() < 0.7:
+            con.execute("UPDATE clientes SET NOMBRE = ? WHERE COD_CLIENTE = ?",
+                        (f"EDITADO {cliente} {rng.choice(NOMBRES)}", cliente))
+            stats["renamed"] += 1
+        else:
+            con.execute("UPDATE CONTRATOS_CLIENTES SET COD_CARACTER_TITULAR = ? WHERE COD_CLIENTE = ?",
+                        (rng.randint(1, len(CARACTERES)), cliente))
+            stats["recharacterized"] += 1
+
+    # Contratos nuevos (COD_CONTRATO creciente) en propuestas que ya existían
+    for _ in range(max(inserts // 5, 1)):
+        add_contract(rng.randint(1, max_cod))
+        stats["new_contracts"] += 1
+
+    for _ in range(deletes):
+        cod = rng.randint(1, max_cod)
+        con.execute("DELETE FROM CONTRATOS_CLIENTES WHERE COD_CONTRATO IN "
+                    "(SELECT COD_CONTRATO FROM contratos WHERE COD_PROPUESTA = ?)", (cod,))
+        con.execute("DELETE FROM contratos WHERE COD_PROPUESTA = ?", (cod,))
+        stats["deletes"] += 1
+
+    con.commit()
+    return stats
+
+
+def sample_legajos(con: sqlite3.Connection, count: int, seed: int = 7, missing_ratio: float = 0.05) -> List[str]:
+    """LEGAJOs de prueba como strings (igual que los extrae el CSV), con algunos inexistentes"""
+    rng = random.Random(seed)
+    total = con.execute("SELECT COUNT(*) FROM propuesta").fetchone()[0]
+    legajos = [str(FIRST_LEGAJO + rng.randint(1, total)) for _ in range(count)]
+    for i in range(int(count * missing_ratio)):
+        legajos[i] = str(FIRST_LEGAJO + total + 1 + i)
+    return sorted(set(legajos), key=lambda legajo: (len(legajo), legajo))
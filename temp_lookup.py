@@ -0,0 +1,134 @@
+"""
+Búsqueda de LEGAJOs con tabla temporal en Firebird
+Las claves se cargan en una GLOBAL TEMPORARY TABLE con EXECUTE BLOCK y se consultan con un
+solo join; la prioridad TITULAR -> PROPIETARIO -> otros se resuelve en el servidor
+"""
+
+import logging
+import time
+from typing import Any, Callable, Dict, Sequence
+
+import polars as pl
+
+import fill_engine
+import metrics
+import query_catalog
+from field_mapping import rows_to_records
+
+logger = logging.getLogger(__name__)
+
+TEMP_TABLE = "TMP_LOOKUP_LEGAJOS"
+KEY_TYPE = "VARCHAR(32)"
+
+# Claves por EXECUTE BLOCK: mantiene el texto y el mensaje de parámetros lejos de los 64 KB
+BLOCK_SIZE = 200
+
+# ON COMMIT DELETE ROWS: las filas son de la transacción y desaparecen con el rollback
+# que hace el pool al devolver la conexión
+CREATE_TABLE = f"""
+    CREATE GLOBAL TEMPORARY TABLE {TEMP_TABLE} (
+        LEGAJO {KEY_TYPE} NOT NULL PRIMARY KEY
+    ) ON COMMIT DELETE ROWS
+    """
+
+# None: sin probar; False: el servidor no soporta ROW_NUMBER() (Firebird 2.5)
+_window_functions = None
+
+# Firebird 2.5 rechaza ROW_NUMBER() al preparar: "SQL error code = -104 ... Token unknown"
+_SQLCODE_SYNTAX = -104
+
+
+def ensure_temp_table(con):
+    """Crea la tabla temporal si no existe (el DDL se confirma en su propia transacción)"""
+    if query_catalog.execute(con, "table_exists", (TEMP_TABLE,)).fetchone():
+        return
+
+    try:
+        con.cursor().execute(CREATE_TABLE)
+        con.commit()
+        logger.info(f"Tabla temporal {TEMP_TABLE} creada")
+    except Exception:
+        con.rollback()
+        # Otra conexión pudo crearla al mismo tiempo
+        if not query_catalog.execute(con, "table_exists", (TEMP_TABLE,)).fetchone():
+            raise
+
+
+def _insert_block(count: int) -> str:
+    params = ", ".join(f"k{i} {KEY_TYPE} = ?" for i in range(count))
+    inserts = "\n".join(f"        INSERT INTO {TEMP_TABLE} (LEGAJO) VALUES (:k{i});" for i in range(count))
+    return f"EXECUTE BLOCK ({params})\nAS\nBEGIN\n{inserts}\nEND"
+
+
+def load_keys(con, keys: Sequence[str]) -> int:
+    """Carga las claves (sin repetir) en la tabla temporal; devuelve cuántas se cargaron
+
+    Los bloques completos reutilizan la misma sentencia preparada.
+    """
+    unique = list(dict.fromkeys(keys))
+    for i in range(0, len(unique), BLOCK_SIZE):
+        block = unique[i:i + BLOCK_SIZE]
+        query_catalog.execute_sql(con, ("insert_block", len(block)), _insert_block(len(block)), block)
+    return len(unique)
+
+
+def fetch_records(con, keys: Sequence[str], fields: Sequence[str],
+                  titular_priority: bool = True) -> Dict[str, Dict[str, Any]]:
+    """LEGAJO -> {campo: valor} para `keys`, un cliente por LEGAJO, en una sola consulta
+
+    Usa la transacción actual de `con`: las claves cargadas se borran al terminarla.
+    Si el servidor no soporta ROW_NUMBER() se ordena por prioridad y se toma la primera fila.
+    """
+    if not keys:
+        return {}
+    return _fetch(con, keys, fields, titular_priority, lambda cur: rows_to_records(cur.fetchall(), fields))
+
+
+def fetch_frame(con, keys: Sequence[str], fields: Sequence[str], titular_priority: bool = True) -> pl.DataFrame:
+    """Como `fetch_records`, pero como DataFrame de resultados leído con fetchmany"""
+    if not keys:
+        return fill_engine.concat_results([], list(fields))
+    return _fetch(con, keys, fields, titular_priority, lambda cur: query_catalog.read_frame(cur, fields))
+
+
+def _fetch(con, keys: Sequence[str], fields: Sequence[str], titular_priority: bool, read: Callable[[Any], Any]):
+    # La latencia del lote incluye la carga de claves: es parte del costo de este modo
+    start = time.perf_counter()
+    result = _fetch_keys_table(con, keys, fields, titular_priority, read)
+    metrics.observe_query("keys_table", len(keys), time.perf_counter() - start, len(result))
+    return result
+
+
+def _window_functions_unsupported(error: Exception) -> bool:
+    """True si `error` es el error de sintaxis de un servidor sin ROW_NUMBER()
+
+    fdb.DatabaseError lleva (mensaje, sqlcode, gdscode) en `args`. Bloqueos, deadlocks o una
+    conexión caída no cuentan: no dicen nada de la versión del servidor.
+    """
+    args = getattr(error, "args", ())
+    if len(args) > 1 and isinstance(args[1], int):
+        return args[1] == _SQLCODE_SYNTAX
+    return "token unknown" in str(error).lower()
+
+
+def _fetch_keys_table(con, keys: Sequence[str], fields: Sequence[str], titular_priority: bool,
+                      read: Callable[[Any], Any]):
+    global _window_functions
+    ensure_temp_table(con)
+    load_keys(con, keys)
+
+    if _window_functions is not False:
+        try:
+            cur = query_catalog.execute_keys_table(con, fields, TEMP_TABLE, titular_priority, ranked=True)
+            result = read(cur)
+            _window_functions = True
+            return result
+        except Exception as e:
+            if _window_functions or not _window_functions_unsupported(e):
+                raise
+            _window_functions = False
+            logger.warning(f"ROW_NUMBER() no disponible, se ordena por prioridad: {str(e)}")
+
+    # Un error de sentencia no anula la transacción: las claves siguen cargadas
+    cur = query_catalog.execute_keys_table(con, fields, TEMP_TABLE, titular_priority, ranked=False)
+    return read(cur)
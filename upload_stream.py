@@ -0,0 +1,252 @@
+"""
+Recepción de CSV por multipart directo a disco
+El cuerpo se lee por bloques (sin cargar el archivo en memoria), se calcula el SHA-256
+mientras llega y los encabezados del template se validan antes de terminar la subida
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Tope de bytes a juntar para validar encabezados aunque no aparezcan los saltos de línea
+MAX_HEADER_BYTES = 256 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """La subida superó el tamaño máximo permitido"""
+
+
+class UploadFormatError(Exception):
+    """La subida no trae un CSV válido en el campo esperado"""
+
+
+class SavedUpload:
+    """Archivo recibido: ruta en disco, nombre original, tamaño y hash del contenido"""
+
+    def __init__(self, path: str, filename: str, size: int, sha256: str):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+
+class _FilePartReceiver:
+    """Callbacks de python-multipart; junta los datos de los archivos del campo pedido
+
+    Los datos quedan como (índice de archivo, bytes); con `multiple` el campo puede repetirse.
+    """
+
+    def __init__(self, field_name: str, multiple: bool = False):
+        self.field_name = field_name
+        self.multiple = multiple
+        self.filenames: List[str] = []
+        self.data: List[Tuple[int, bytes]] = []
+        self._in_file = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    @property
+    def filename(self) -> Optional[str]:
+        return self.filenames[0] if self.filenames else None
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def take(self) -> List[Tuple[int, bytes]]:
+        data, self.data = self.data, []
+        return data
+
+    def on_part_begin(self):
+        self._in_file = False
+        self._disposition = b""
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.data.append((len(self.filenames) - 1, data[start:end]))
+
+    def on_part_end(self):
+        self._in_file = False
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if name != self.field_name or b"filename" not in options:
+            return
+        if self.filenames and not self.multiple:
+            raise UploadFormatError(f"Se envió más de un archivo en '{self.field_name}'")
+        self.filenames.append(os.path.basename(options[b"filename"].decode("utf-8", errors="replace")))
+        self._in_file = True
+
+
+class _FileWriter:
+    """Archivo en disco de una subida: escribe por bloques y calcula el hash"""
+
+    def __init__(self, dest_dir: str, filename: str):
+        # Nombre propio con extensión .csv: el procesador deriva de él la ruta del resultado
+        self.path = os.path.join(dest_dir, f"{uuid.uuid4().hex}.csv")
+        self.filename = filename
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.header = bytearray()
+        self.header_checked = False
+        self.buffer = bytearray()
+        self._f = open(self.path, "wb")
+
+    def flush(self):
+        if self.buffer:
+            block = bytes(self.buffer)
+            self._f.write(block)
+            self.hasher.update(block)
+            self.buffer.clear()
+
+    def close(self):
+        self._f.close()
+
+    def discard(self):
+        self._f.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def saved(self) -> SavedUpload:
+        return SavedUpload(self.path, self.filename, self.size, self.hasher.hexdigest())
+
+
+async def save_csv_upload(request, dest_dir: str, field_name: str = "file",
+                          max_bytes: int = 1024 * 1024 * 1024, chunk_size: int = 1024 * 1024,
+                          header_lines: int = 10,
+                          validate_header: Optional[Callable[[str, bytes], None]] = None,
+                          offload: Optional[Callable[..., Awaitable]] = None) -> SavedUpload:
+    """Guarda en `dest_dir` el archivo del campo `field_name` de un request multipart
+
+    - Escribe en bloques de `chunk_size` bytes con `offload` (por defecto el executor del loop)
+    - Corta la subida con UploadTooLargeError al pasar de `max_bytes`
+    - Llama a `validate_header(nombre, primeras líneas)` en cuanto llegan `header_lines`
+      líneas; si lanza una excepción la subida se aborta sin leer el resto
+    """
+    uploads = await _save_uploads(request, dest_dir, field_name, False, 1, max_bytes, chunk_size,
+                                  header_lines, validate_header, offload)
+    return uploads[0]
+
+
+async def save_csv_uploads(request, dest_dir: str, field_name: str = "files", max_files: int = 50,
+                           max_bytes: int = 1024 * 1024 * 1024, chunk_size: int = 1024 * 1024,
+                           header_lines: int = 10,
+                           validate_header: Optional[Callable[[str, bytes], None]] = None,
+                           offload: Optional[Callable[..., Awaitable]] = None) -> List[SavedUpload]:
+    """Como `save_csv_upload` para varios archivos en el mismo campo (hasta `max_files`)
+
+    `max_bytes` es el total de la subida; los encabezados de cada archivo se validan por separado.
+    """
+    return await _save_uploads(request, dest_dir, field_name, True, max_files, max_bytes, chunk_size,
+                               header_lines, validate_header, offload)
+
+
+async def _save_uploads(request, dest_dir: str, field_name: str, multiple: bool, max_files: int,
+                        max_bytes: int, chunk_size: int, header_lines: int,
+                        validate_header: Optional[Callable[[str, bytes], None]],
+                        offload: Optional[Callable[..., Awaitable]]) -> List[SavedUpload]:
+    if offload is None:
+        loop = asyncio.get_running_loop()
+
+        async def offload(func, *args):
+            return await loop.run_in_executor(None, func, *args)
+
+    # Rechazar antes de leer nada si el cliente declara un cuerpo demasiado grande
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MAX_HEADER_BYTES:
+        raise UploadTooLargeError(f"El archivo supera el máximo de {max_bytes / (1024 * 1024):.0f} MB")
+
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise UploadFormatError(f"Se esperaba un formulario multipart con el campo '{field_name}'")
+
+    receiver = _FilePartReceiver(field_name, multiple)
+    parser = MultipartParser(boundary, receiver.callbacks())
+    writers: List[_FileWriter] = []
+    total = 0
+
+    def check_header(writer: _FileWriter):
+        writer.header_checked = True
+        if validate_header is not None:
+            lines = bytes(writer.header).splitlines(keepends=True)[:header_lines]
+            validate_header(writer.filename, b"".join(lines))
+
+    async def open_writers(count: int):
+        # Un archivo vacío no trae datos: se crea igual al ver el siguiente
+        while len(writers) < count:
+            if len(writers) >= max_files:
+                raise UploadFormatError(f"Se enviaron más de {max_files} archivos en '{field_name}'")
+            writers.append(await offload(_FileWriter, dest_dir, receiver.filenames[len(writers)]))
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+
+            for index, data in receiver.take():
+                await open_writers(index + 1)
+                writer = writers[index]
+                writer.size += len(data)
+                total += len(data)
+                if total > max_bytes:
+                    raise UploadTooLargeError(
+                        f"El archivo supera el máximo de {max_bytes / (1024 * 1024):.0f} MB"
+                    )
+
+                writer.buffer += data
+                if not writer.header_checked:
+                    writer.header += data
+                    if writer.header.count(b"\n") >= header_lines or len(writer.header) >= MAX_HEADER_BYTES:
+                        check_header(writer)
+
+                if len(writer.buffer) >= chunk_size:
+                    await offload(writer.flush)
+
+        parser.finalize()
+        if not receiver.filenames:
+            raise UploadFormatError(f"Falta el archivo en el campo '{field_name}'")
+        await open_writers(len(receiver.filenames))
+        for writer in writers:
+            # Archivos con menos líneas que `header_lines`
+            if not writer.header_checked:
+                check_header(writer)
+            await offload(writer.flush)
+            await offload(writer.close)
+    except BaseException:
+        for writer in writers:
+            await offload(writer.discard)
+        raise
+
+    uploads = [writer.saved() for writer in writers]
+    for upload in uploads:
+        logger.info(f"Subida recibida: {upload.filename} ({upload.size / (1024 * 1024):.1f} MB, "
+                    f"sha256 {upload.sha256[:12]})")
+    return uploads